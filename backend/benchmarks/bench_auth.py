@@ -0,0 +1,73 @@
+"""Per-request latency of authenticated calls with and without the token cache.
+
+Runs the app in-process against a throwaway SQLite database:
+
+    python benchmarks/bench_auth.py --requests 2000
+
+SQLite lookups are in-process, so against PostgreSQL the saved round trip
+(and the gap between the two runs) is larger.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+_workdir = tempfile.mkdtemp(prefix="bench-auth-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'bench.db')}")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+import models.models as models  # noqa: E402
+from databases.database import SessionLocal, engine  # noqa: E402
+from harness import percentile  # noqa: E402
+
+
+def run(client: TestClient, headers: dict, requests: int) -> list[float]:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get("/jobs", headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return samples
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(email="bench@example.com", hashed_password="unused")
+    db.add(user)
+    db.commit()
+    token = main.create_access_token({"sub": user.email, "uid": user.id})
+    db.close()
+
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {token}"}
+    ttl = main.token_cache.ttl_seconds or 60
+    run(client, headers, 100)  # warm up
+
+    results = {}
+    for label, cache_ttl in (("uncached", 0), ("cached", ttl)):
+        main.token_cache.clear()
+        main.token_cache.ttl_seconds = cache_ttl
+        results[label] = run(client, headers, args.requests)
+
+    print(f"{'':10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'mean (ms)':>10}")
+    for label, samples in results.items():
+        print(
+            f"{label:10} {percentile(samples, 50) * 1000:10.3f} "
+            f"{percentile(samples, 99) * 1000:10.3f} {statistics.mean(samples) * 1000:10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,137 @@
+"""Cold-start profile: import time of main, time to the first healthy response and to readiness.
+
+Starts uvicorn in a fresh process several times against a throwaway SQLite
+database (or DATABASE_URL), polling / until it answers and then /ready
+until the engines are warm:
+
+    python benchmarks/bench_startup.py --runs 5 --target-ms 500
+
+Exits with status 1 if the median time to the first healthy response is
+above --target-ms. The slowest imports are listed so regressions can be
+traced to the module that caused them.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR  # noqa: E402
+
+
+def _environment(workdir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+    # The sweeper has nothing to do in a fresh database
+    env.setdefault("SWEEP_INTERVAL_SECONDS", "3600")
+    return env
+
+
+def import_profile(workdir: str, top: int) -> tuple[float, list[tuple[str, float]]]:
+    """Seconds to import main, and its slowest direct imports with their cumulative seconds"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import main"],
+        cwd=workdir, env=_environment(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        check=True,
+    )
+    total = 0.0
+    children = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line
+        seconds = int(cumulative) / 1e6
+        if name.strip() == "main":
+            total = seconds
+        elif name.startswith(" " * 3) and not name.startswith(" " * 4):
+            # importtime indents by two spaces per level below main's single space
+            children.append((name.strip(), seconds))
+    return total, sorted(children, key=lambda child: child[1], reverse=True)[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(client: httpx.Client, url: str, deadline: float) -> httpx.Response:
+    while time.monotonic() < deadline:
+        try:
+            response = client.get(url)
+            if response.status_code == 200:
+                return response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} did not answer 200 in time")
+
+
+def start_once(workdir: str, timeout: float) -> dict:
+    """Launch uvicorn and time the first 200 from / and from /ready"""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=_environment(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            deadline = started + timeout
+            _wait_for(client, f"{base}/", deadline)
+            healthy = time.monotonic()
+            ready = _wait_for(client, f"{base}/ready", deadline)
+            return {
+                "healthy_ms": (healthy - started) * 1000,
+                "ready_ms": (time.monotonic() - started) * 1000,
+                "steps": ready.json()["steps"],
+            }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=500, help="budget for the first healthy response")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a server to become ready")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir:
+        total, slowest = import_profile(workdir, args.top)
+        print(f"import main: {total * 1000:.0f} ms")
+        for name, seconds in slowest:
+            print(f"  {name:<32} {seconds * 1000:8.1f} ms")
+
+        # The first run also creates the schema; later ones find it in place
+        runs = [start_once(workdir, args.timeout) for _ in range(args.runs)]
+
+    healthy = statistics.median(run["healthy_ms"] for run in runs)
+    ready = statistics.median(run["ready_ms"] for run in runs)
+    print(f"\nfirst healthy response: median {healthy:.0f} ms, max {max(r['healthy_ms'] for r in runs):.0f} ms")
+    print(f"ready (engines warm):   median {ready:.0f} ms, max {max(r['ready_ms'] for r in runs):.0f} ms")
+    print("start-up steps (last run):")
+    for name, step in runs[-1]["steps"].items():
+        detail = f" ({step['error']})" if step["error"] else ""
+        print(f"  {name:<16} {step['status']:<8} {(step['seconds'] or 0) * 1000:8.1f} ms{detail}")
+
+    if healthy > args.target_ms:
+        print(f"\nFirst healthy response took {healthy:.0f} ms, over the {args.target_ms:.0f} ms target")
+        sys.exit(1)
+    print(f"\nWithin the {args.target_ms:.0f} ms target")
+
+
+if __name__ == "__main__":
+    main_cli()
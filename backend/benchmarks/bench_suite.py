@@ -0,0 +1,273 @@
+"""Throughput and p50/p99 latency of the main API paths at several concurrency levels.
+
+Runs the app in-process over httpx's ASGI transport, against a throwaway
+SQLite database (or DATABASE_URL, e.g. a local Postgres), with synthetic
+videos made by the bundled ffmpeg and a stub TTS engine, so no server or
+network access is needed:
+
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json
+
+--compare exits with status 1 if any scenario regressed beyond --threshold.
+Results only compare meaningfully between runs on the same machine and
+database.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import harness  # noqa: E402
+
+# --save/--compare paths are relative to where the script was started
+CALLER_DIR = os.getcwd()
+WORKDIR = harness.prepare_environment("bench-suite-")
+
+import httpx  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import main  # noqa: E402
+import models.models as models  # noqa: E402
+from databases.database import SQLALCHEMY_DATABASE_URL, SessionLocal  # noqa: E402
+from services import jobs, storage, tts  # noqa: E402
+
+SCENARIOS = (
+    "signup", "login", "my_files_10", "my_files_100", "my_files_500", "download",
+    "text_to_audio", "video_to_audio", "video_to_audio_transcode", "video_to_audio_stream",
+)
+# Scenarios that run ffmpeg use --conversion-requests instead of --requests
+CONVERSIONS = {"video_to_audio", "video_to_audio_transcode", "video_to_audio_stream"}
+PASSWORD = "bench-password"
+RUN_ID = uuid.uuid4().hex[:8]
+
+
+def create_user(email: str, hashed_password: str = "unused") -> tuple[models.User, dict]:
+    db = SessionLocal()
+    try:
+        user = models.User(email=email, hashed_password=hashed_password)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        token = main.create_access_token({"sub": user.email, "uid": user.id})
+        return user, {"Authorization": f"Bearer {token}"}
+    finally:
+        db.close()
+
+
+def seed_library(user_id: int, count: int) -> None:
+    """Give a user `count` files in one bulk insert, as for a long-time user"""
+    db = SessionLocal()
+    try:
+        db.execute(insert(models.MediaFile), [
+            {
+                "filename": f"{RUN_ID}-{i}.mp3",
+                "original_name": f"track {i}.mp4",
+                "file_type": "video_to_audio",
+                "file_size": 1024,
+                "format": "mp3",
+                "user_id": user_id,
+            }
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def seed_download(user_id: int, size: int) -> str:
+    filename = f"{RUN_ID}-download.mp3"
+    storage.outputs.save_bytes(os.urandom(size), filename)
+    db = SessionLocal()
+    try:
+        db.add(models.MediaFile(filename=filename, original_name="download.mp4", file_type="video_to_audio",
+                                file_size=size, format="mp3", user_id=user_id))
+        db.commit()
+    finally:
+        db.close()
+    return filename
+
+
+async def wait_for_job(job_id: str, timeout: float = 300) -> bool:
+    """Poll the in-process job table rather than /jobs/{id}, so polling traffic
+    does not add to the load being measured
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.job_queue.get(job_id)
+        if job.status in (jobs.COMPLETED, jobs.FAILED):
+            return job.status == jobs.COMPLETED
+        await asyncio.sleep(0.005)
+    return False
+
+
+def build_scenarios(client: httpx.AsyncClient, args) -> dict:
+    """Scenario name -> send(i) coroutine function, after seeding what each needs"""
+    user, headers = create_user(f"bench-library-{RUN_ID}@example.com")
+    seed_library(user.id, args.library_size)
+    download = seed_download(user.id, args.download_bytes)
+
+    tone = harness.make_tone("tone.mp3", 2)
+    tts.register_engine(harness.stub_tts_engine(tone, args.tts_latency_ms / 1000))
+    videos = {
+        "copy": open(harness.make_video("copy.mp4", args.video_seconds), "rb").read(),
+        "transcode": open(harness.make_video("transcode.mkv", args.video_seconds, "libopus"), "rb").read(),
+    }
+
+    async def signup(i):
+        response = await client.post(
+            "/signup", json={"email": f"signup-{RUN_ID}-{i}@example.com", "password": PASSWORD}
+        )
+        return response.status_code == 200
+
+    login_email = f"login-{RUN_ID}@example.com"
+
+    async def login(i):
+        response = await client.post("/token", data={"username": login_email, "password": PASSWORD})
+        return response.status_code == 200
+
+    def my_files(limit):
+        async def send(i):
+            response = await client.get("/my-files", params={"limit": limit}, headers=headers)
+            return response.status_code == 200 and len(response.json()["files"]) == min(limit, args.library_size)
+        return send
+
+    async def download_file(i):
+        response = await client.get(f"/download/{download}", headers=headers)
+        return response.status_code == 200 and len(response.content) == args.download_bytes
+
+    async def text_to_audio(i):
+        text = f"Benchmark run {RUN_ID}, request {i}. " * 4
+        response = await client.post(
+            "/convert/text-to-audio", json={"text": text, "engine": "bench-stub"}, headers=headers
+        )
+        return response.status_code == 200
+
+    def video_to_audio(data, name):
+        async def send(i):
+            response = await client.post(
+                "/convert/video-to-audio",
+                files={"file": (name, harness.unique_copy(data, i), "video/mp4")},
+                headers=headers,
+            )
+            return response.status_code == 202 and await wait_for_job(response.json()["job_id"])
+        return send
+
+    async def video_to_audio_stream(i):
+        response = await client.post(
+            "/convert/video-to-audio/stream",
+            params={"filename": "copy.mp4"},
+            content=harness.unique_copy(videos["copy"], i),
+            headers=headers,
+        )
+        return response.status_code == 200
+
+    scenarios = {
+        "my_files_10": my_files(10),
+        "my_files_100": my_files(100),
+        "my_files_500": my_files(500),
+        "download": download_file,
+        "text_to_audio": text_to_audio,
+        "video_to_audio": video_to_audio(videos["copy"], "copy.mp4"),
+        "video_to_audio_transcode": video_to_audio(videos["transcode"], "transcode.mkv"),
+        "video_to_audio_stream": video_to_audio_stream,
+    }
+    # Password hashing depends on the bcrypt backend; skip rather than report 500s
+    try:
+        create_user(login_email, main.get_password_hash(PASSWORD))
+        scenarios.update(signup=signup, login=login)
+    except Exception as e:
+        print(f"Skipping signup/login: password hashing failed ({e})")
+    return scenarios
+
+
+def print_results(results: dict) -> None:
+    print(f"{'scenario':26} {'conc':>5} {'req':>6} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for scenario, levels in results.items():
+        for level, summary in levels.items():
+            print(
+                f"{scenario:26} {level:>5} {summary['requests']:6d} {summary['errors']:5d} "
+                f"{summary['throughput_rps']:9.1f} {summary.get('p50_ms', 0):9.2f} {summary.get('p99_ms', 0):9.2f}"
+            )
+
+
+def print_comparison(rows: list[dict]) -> None:
+    print(f"{'scenario':26} {'conc':>5} {'metric':>14} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in rows:
+        change = "" if row["change"] is None else f"{row['change'] * 100:+.1f}%"
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['scenario']:26} {row['concurrency']:>5} {row['metric']:>14} "
+            f"{row['baseline']:10.2f} {row['current']:10.2f} {change:>8}{flag}"
+        )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 120.0) -> None:
+    """Wait for the start-up steps (schema, warm-ups) the app runs in the background after lifespan start"""
+    deadline = time.monotonic() + timeout
+    while (response := await client.get("/ready")).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"App not ready after {timeout:.0f}s: {response.text}")
+        await asyncio.sleep(0.1)
+
+
+async def run(args) -> dict:
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Seeding needs the tables, and warm-up costs do not belong in the measurements
+            await wait_until_ready(client)
+            scenarios = build_scenarios(client, args)
+            for name in args.scenarios:
+                send = scenarios.get(name)
+                if send is None:
+                    continue
+                requests = args.conversion_requests if name in CONVERSIONS else args.requests
+                # Warm up: worker processes, connection pool, caches
+                await harness.run_load(send, 1, args.warmup)
+                results[name] = {}
+                for concurrency in args.concurrency:
+                    print(f"{name} at concurrency {concurrency}...")
+                    results[name][str(concurrency)] = await harness.run_load(send, concurrency, requests)
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per level for API scenarios")
+    parser.add_argument("--conversion-requests", type=int, default=20, help="requests per level for video scenarios")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--library-size", type=int, default=1000, help="files owned by the /my-files user")
+    parser.add_argument("--download-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--video-seconds", type=float, default=10)
+    parser.add_argument("--tts-latency-ms", type=float, default=0, help="simulated TTS round trip")
+    parser.add_argument("--save", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=harness.DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    print_results(results)
+    if args.save:
+        harness.save_results(os.path.join(CALLER_DIR, args.save), harness.environment_info(SQLALCHEMY_DATABASE_URL), results)
+        print(f"Saved results to {args.save}")
+    if args.compare:
+        baseline = harness.load_results(os.path.join(CALLER_DIR, args.compare))
+        print(f"Compared with {args.compare} ({baseline['environment']['created_at']}):")
+        rows = harness.compare(baseline["results"], results, args.threshold)
+        print_comparison(rows)
+        if any(row["regressed"] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,188 @@
+"""Shared pieces of the benchmark scripts: load generation, fixtures and baselines.
+
+Nothing here imports the app, so scripts can point DATABASE_URL at a
+throwaway database (prepare_environment) before main is imported.
+"""
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Latency and throughput changes smaller than this are treated as noise by compare()
+DEFAULT_THRESHOLD = 0.10
+
+
+def prepare_environment(prefix: str) -> str:
+    """Run from a fresh working directory with its own outputs/ and, unless
+    DATABASE_URL is already set (e.g. to a local Postgres), its own SQLite file.
+    """
+    # Conversion workers are spawned and re-run the script's top level; they
+    # must land in the same directory as the parent
+    workdir = os.environ.get("BENCH_WORKDIR") or tempfile.mkdtemp(prefix=prefix)
+    os.environ["BENCH_WORKDIR"] = workdir
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.chdir(workdir)
+    os.makedirs("outputs", exist_ok=True)
+    os.makedirs("uploads", exist_ok=True)
+    return workdir
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples: list[float], errors: int, wall_seconds: float) -> dict:
+    """Throughput and latency of one load run; latencies only count successful requests"""
+    summary = {"requests": len(samples) + errors, "errors": errors, "throughput_rps": 0.0}
+    if samples:
+        summary.update(
+            throughput_rps=len(samples) / wall_seconds if wall_seconds > 0 else 0.0,
+            p50_ms=percentile(samples, 50) * 1000,
+            p99_ms=percentile(samples, 99) * 1000,
+            mean_ms=statistics.mean(samples) * 1000,
+        )
+    return summary
+
+
+async def run_load(send, concurrency: int, requests: int) -> dict:
+    """Issue `requests` calls of `await send(i)` from `concurrency` workers.
+
+    Load is closed-loop: each worker starts its next request as soon as the
+    previous one finishes. send returns True for a successful request.
+    """
+    samples: list[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            try:
+                ok = await send(i)
+            except Exception as e:
+                print(f"  request {i} failed: {e!r}")
+                ok = False
+            if ok:
+                samples.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, errors, time.perf_counter() - start)
+
+
+def ffmpeg(*args: str) -> None:
+    from services.extractor import ffmpeg_exe
+
+    subprocess.run([ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def make_video(path: str, seconds: float, audio_codec: str = "aac") -> str:
+    """Synthetic test pattern and sine tone, encoded with the bundled ffmpeg"""
+    ffmpeg(
+        "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=25:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", audio_codec, "-shortest", path,
+    )
+    return path
+
+
+def make_tone(path: str, seconds: float) -> bytes:
+    """A short MP3, used as the stub TTS engine's output"""
+    ffmpeg("-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}", "-c:a", "libmp3lame", "-b:a", "64k", path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def unique_copy(data: bytes, i: int) -> bytes:
+    """data with a distinct trailer, so identical uploads do not hit the dedup store.
+
+    ffmpeg stops reading an MP4 or Matroska file at its last box/element and
+    ignores trailing bytes.
+    """
+    return data + f"bench-{time.time_ns()}-{i}".encode("ascii")
+
+
+def stub_tts_engine(audio: bytes, latency_seconds: float = 0.0):
+    """A TTS engine that returns fixed audio after an optional delay standing in for a network call"""
+    from services import tts
+
+    class StubEngine(tts.TTSEngine):
+        name = "bench-stub"
+
+        def synthesize(self, text: str, language: str) -> bytes:
+            if latency_seconds:
+                time.sleep(latency_seconds)
+            return audio
+
+    return StubEngine()
+
+
+def environment_info(database_url: str) -> dict:
+    return {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": database_url.split(":", 1)[0],
+    }
+
+
+def save_results(path: str, info: dict, results: dict) -> None:
+    with open(path, "w") as f:
+        json.dump({"environment": info, "results": results}, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list[dict]:
+    """Per scenario and concurrency level present in both runs, the relative
+    change of each metric and whether it is a regression beyond threshold.
+    """
+    rows = []
+    for scenario, levels in current.items():
+        for level, now in levels.items():
+            before = baseline.get(scenario, {}).get(level)
+            if not before:
+                continue
+            for metric, higher_is_better in (("throughput_rps", True), ("p50_ms", False), ("p99_ms", False)):
+                if not before.get(metric) or metric not in now:
+                    continue
+                change = (now[metric] - before[metric]) / before[metric]
+                rows.append({
+                    "scenario": scenario,
+                    "concurrency": level,
+                    "metric": metric,
+                    "baseline": before[metric],
+                    "current": now[metric],
+                    "change": change,
+                    "regressed": (-change if higher_is_better else change) > threshold,
+                })
+            if now.get("errors", 0) > before.get("errors", 0):
+                rows.append({
+                    "scenario": scenario,
+                    "concurrency": level,
+                    "metric": "errors",
+                    "baseline": before.get("errors", 0),
+                    "current": now["errors"],
+                    "change": None,
+                    "regressed": True,
+                })
+    return rows
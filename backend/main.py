@@ -1,16 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, Header, HTTPException, Depends, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from starlette.requests import ClientDisconnect
+from sqlalchemy import and_, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import shutil
+from email.utils import formatdate
+import base64
+import functools
+import glob
+import hashlib
+import json
+import mimetypes
 import os
+import time
 import uuid
-from gtts import gTTS
-from moviepy import VideoFileClip
 from dotenv import load_dotenv
 
 # Load env vars immediately
@@ -18,7 +25,14 @@ load_dotenv()
 
 import models.models as models
 import schemas.schemas as schemas
-from databases.database import engine, get_db
+from databases.database import (
+    engine, get_db, get_async_db, SessionLocal, add_missing_columns, add_missing_indexes, pool_stats
+)
+from services import (
+    admission, batches, dedup, downloads, extractor, jobs, metrics, readiness, storage, sweeper, tts, uploads,
+    workqueue, zipstream
+)
+from services.auth_cache import Principal, token_cache
 
 app = FastAPI()
 
@@ -27,9 +41,19 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-keep-it-secret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
+# Middleware added last runs first: CORS wraps metrics, which wraps admission,
+# so rejected conversions are still timed and readable by the browser
+app.add_middleware(admission.AdmissionMiddleware, routes={
+    "/convert/text-to-audio": admission.text,
+    "/convert/video-to-audio": admission.video,
+    "/convert/video-to-audio/stream": admission.video,
+    "/convert/batch": admission.video,
+    "/uploads": admission.video,
+})
+app.add_middleware(metrics.MetricsMiddleware)
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -37,61 +61,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by resumable upload clients (Retry-After by clients of rejected conversions)
+    expose_headers=[
+        "Location", "Upload-Offset", "Upload-Length", "Upload-Expires", "Tus-Resumable", "Job-Id", "Retry-After"
+    ],
 )
 
-# Create uploads directory
+# Staged uploads, and conversion output before it is moved into storage
 os.makedirs("uploads", exist_ok=True)
-os.makedirs("outputs", exist_ok=True)
+os.makedirs(storage.STORAGE_SCRATCH_DIR, exist_ok=True)
 
-# --- File Cleanup ---
-def cleanup_old_files(db: Session):
-    """Delete files older than 72 hours"""
-    from datetime import datetime, timedelta
-    cutoff_time = datetime.utcnow() - timedelta(hours=72)
-    
-    # Find old files in database
-    old_files = db.query(models.MediaFile).filter(models.MediaFile.created_at < cutoff_time).all()
-    
-    for file_record in old_files:
-        # Delete physical file
-        file_path = os.path.join("outputs", file_record.filename)
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                print(f"Deleted old file: {file_record.filename}")
-            except Exception as e:
-                print(f"Error deleting {file_record.filename}: {e}")
-        
-        # Delete database record
-        db.delete(file_record)
-    
-    db.commit()
-    print(f"Cleanup complete: Removed {len(old_files)} old files")
+def _create_schema():
+    """Create tables, and columns and indexes added to models since"""
+    models.Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    print("✅ Database tables created successfully")
+
+def _warm_up_auth():
+    _pwd_context().handler().get_backend()
+    import jose.jwt  # noqa: F401
 
 @app.on_event("startup")
 async def startup_event():
-    """Create tables and run cleanup on startup"""
-    try:
-        # Create tables if they don't exist
-        models.Base.metadata.create_all(bind=engine)
-        print("✅ Database tables created successfully")
-    except Exception as e:
-        print(f"⚠️ Warning: Could not create database tables: {e}")
-        print("This is expected if the database is not available during testing.")
-    
-    # Run cleanup
-    db = next(get_db())
-    try:
-        cleanup_old_files(db)
-    finally:
-        db.close()
+    """Finish starting up in the background so the first request is not held up.
+
+    The schema is created (retrying until the database accepts connections)
+    before the retention sweeper starts; meanwhile the conversion engines
+    warm up. GET /ready reports when all of it is done.
+    """
+    warm_up = {
+        "auth": _warm_up_auth,
+        "ffmpeg": extractor.warm_up,
+        "tts": tts.warm_up,
+    }
+    if jobs.JOB_BACKEND == "local":
+        warm_up["conversion_pool"] = jobs.job_queue.warm_up
+    readiness.readiness.start(
+        required={"database": _create_schema},
+        optional=warm_up,
+        # Expired files are deleted in the background so startup never waits on a backlog
+        after_required=sweeper.sweeper.start,
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background start-up work, the sweeper and the conversion worker pool"""
+    await readiness.readiness.stop()
+    await sweeper.sweeper.stop()
+    jobs.job_queue.shutdown()
 
 # --- Auth Helpers ---
+# passlib and jose are imported on first use (or by the start-up warm-up) to keep imports fast
+@functools.cache
+def _pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -100,10 +131,43 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Principal:
+    start = time.perf_counter()
+    result = "rejected"
+    try:
+        principal = token_cache.get(token)
+        if principal is not None:
+            result = "cache_hit"
+            return principal
+        principal = await _verify_token(token, db)
+        result = "verified"
+        return principal
+    finally:
+        metrics.AUTH_SECONDS.labels(result).observe(time.perf_counter() - start)
+
+async def get_stream_user(
+    token: str | None = Depends(optional_oauth2_scheme),
+    access_token: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """get_current_user that also accepts ?access_token=, as browsers' EventSource cannot set headers"""
+    token = token or access_token
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(token, db)
+
+async def _verify_token(token: str, db: AsyncSession) -> Principal:
+    """Decode a bearer token and check its user still exists, caching the result"""
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -114,13 +178,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        token_data = schemas.TokenData(email=email, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    if token_data.user_id is not None:
+        user = await db.get(models.User, token_data.user_id)
+        if user is not None and user.email != token_data.email:
+            user = None
+    else:
+        # Tokens issued before the uid claim existed
+        user = (await db.execute(
+            select(models.User).where(models.User.email == token_data.email)
+        )).scalars().first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal(id=user.id, email=user.email)
+    token_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+def serialize_media_file(f: models.MediaFile) -> dict:
+    return {
+        "filename": f.filename,
+        "original_name": f.original_name,
+        "file_type": f.file_type,
+        "file_size": f.file_size,
+        "format": f.format,
+        "profile": f.profile,
+        "created_at": f.created_at.isoformat(),
+        "download_url": f"http://localhost:8000/download/{f.filename}"
+    }
 
 # --- Routes ---
 
@@ -128,6 +214,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
 def read_root():
     return {"message": "Media Converter API is running"}
 
+@app.get("/ready")
+def get_readiness():
+    """503 until the schema exists and the conversion engines have warmed up; per-step timings either way"""
+    snapshot = readiness.readiness.snapshot()
+    return Response(
+        content=json.dumps(snapshot),
+        media_type="application/json",
+        status_code=status.HTTP_200_OK if snapshot["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
 @app.post("/signup", response_model=schemas.Token)
 def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
@@ -138,7 +234,7 @@ def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    access_token = create_access_token(data={"sub": user.email})
+    access_token = create_access_token(data={"sub": db_user.email, "uid": db_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/token", response_model=schemas.Token)
@@ -152,137 +248,1151 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+def encode_cursor(created_at: datetime, file_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{file_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, file_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(file_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/my-files")
 async def get_my_files(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    file_type: str | None = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get list of all files owned by current user"""
-    files = db.query(models.MediaFile).filter(
-        models.MediaFile.user_id == current_user.id
-    ).order_by(models.MediaFile.created_at.desc()).all()
+    """List the current user's files, newest first, one page at a time.
+
+    Pages are keyed on (created_at, id) rather than offsets so every page is a
+    single index range scan on ix_media_files_user_created.
+    """
+    query = select(
+        models.MediaFile.id,
+        models.MediaFile.filename,
+        models.MediaFile.original_name,
+        models.MediaFile.file_type,
+        models.MediaFile.file_size,
+        models.MediaFile.format,
+        models.MediaFile.profile,
+        models.MediaFile.created_at,
+    ).where(models.MediaFile.user_id == current_user.id)
+    if file_type:
+        query = query.where(models.MediaFile.file_type == file_type)
+    if cursor:
+        query = query.where(
+            tuple_(models.MediaFile.created_at, models.MediaFile.id) < tuple_(*decode_cursor(cursor))
+        )
+    rows = (await db.execute(query.order_by(
+        models.MediaFile.created_at.desc(), models.MediaFile.id.desc()
+    ).limit(limit + 1))).all()
     
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None
     return {
-        "total": len(files),
-        "files": [
-            {
-                "filename": f.filename,
-                "original_name": f.original_name,
-                "file_type": f.file_type,
-                "file_size": f.file_size,
-                "created_at": f.created_at.isoformat(),
-                "download_url": f"http://localhost:8000/download/{f.filename}"
-            }
-            for f in files
-        ]
+        "files": [serialize_media_file(f) for f in page],
+        "next_cursor": next_cursor
     }
 
+def _library_archive_query(user_id: int, request: schemas.LibraryArchiveRequest):
+    """One query selecting every requested file that belongs to user_id"""
+    query = select(
+        models.MediaFile.filename,
+        models.MediaFile.original_name,
+        models.MediaFile.profile,
+    ).where(models.MediaFile.user_id == user_id)
+    if request.filenames:
+        query = query.where(models.MediaFile.filename.in_(set(request.filenames)))
+    if request.file_type:
+        query = query.where(models.MediaFile.file_type == request.file_type)
+    if request.created_after:
+        query = query.where(models.MediaFile.created_at >= request.created_after)
+    if request.created_before:
+        query = query.where(models.MediaFile.created_at < request.created_before)
+    return query.order_by(models.MediaFile.created_at, models.MediaFile.id)
+
+def _library_archive_entries(rows) -> list[tuple[str, str]]:
+    """(archive name, stored name) pairs, named after the original uploads and their profiles.
+
+    Dedup can give a user several rows for one stored file; it is included once.
+    """
+    used_names = set()
+    stored = set()
+    entries = []
+    for row in rows:
+        if row.filename in stored:
+            continue
+        stored.add(row.filename)
+        original = os.path.basename((row.original_name or "").replace("\\", "/"))
+        stem = os.path.splitext(original)[0] or os.path.splitext(row.filename)[0]
+        if row.profile:
+            stem = f"{stem}-{row.profile}"
+        arcname = stem + os.path.splitext(row.filename)[1]
+        entries.append((zipstream.unique_name(arcname, used_names), row.filename))
+    return entries
+
+@app.post("/my-files/archive")
+async def download_library_archive(
+    archive: schemas.LibraryArchiveRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream the named files, or every file matching the filters, as one uncompressed ZIP.
+
+    Ownership of every file is checked with a single query; the archive is
+    built while it is sent, so nothing is staged on disk and memory use does
+    not grow with the number or size of the files.
+    """
+    rows = (await db.execute(_library_archive_query(current_user.id, archive))).all()
+    if archive.filenames and {row.filename for row in rows} != set(archive.filenames):
+        raise HTTPException(status_code=404, detail="File not found or access denied")
+    if not rows:
+        raise HTTPException(status_code=404, detail="No files match")
+    # Release the connection before the (possibly long) transfer starts
+    await db.close()
+    return metrics.count_download(StreamingResponse(
+        zipstream.stream_zip(_library_archive_entries(rows), storage.outputs),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="media-{datetime.utcnow():%Y%m%d-%H%M%S}.zip"'}
+    ))
+
 @app.post("/convert/text-to-audio")
 async def convert_text_to_audio(
     request: schemas.TextRequest, 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        tts = gTTS(text=request.text, lang=request.language)
-        filename = f"{uuid.uuid4()}.mp3"
-        filepath = os.path.join("outputs", filename)
-        tts.save(filepath)
-        
-        # Get file size
-        file_size = os.path.getsize(filepath)
+        tts_engine = tts.get_engine(request.engine)
+    except tts.UnknownEngineError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        key = dedup.content_key(
+            "text_to_audio",
+            hashlib.sha256(request.text.encode("utf-8")).hexdigest(),
+            language=request.language,
+            engine=tts_engine.name,
+            chunk_chars=tts.TTS_CHUNK_CHARS,
+        )
+        metrics.count_bytes("text_to_audio", "in", len(request.text.encode("utf-8")))
+        with metrics.stage("text_to_audio", "dedup_lookup"):
+            blob = await dedup.find_blob_async(db, key)
+        if blob is None:
+            async with admission.text.slot(current_user.id):
+                with metrics.stage("text_to_audio", "synthesize"):
+                    audio = await run_in_threadpool(tts.synthesize_long, request.text, request.language, tts_engine)
+            filename = f"{uuid.uuid4()}.mp3"
+            with metrics.stage("text_to_audio", "write"):
+                await run_in_threadpool(storage.outputs.save_bytes, audio, filename)
+            metrics.count_bytes("text_to_audio", "out", len(audio))
+            # Imported here so numpy stays out of API start-up
+            from services import waveform
+            with metrics.stage("text_to_audio", "waveform"):
+                peaks, _ = await run_in_threadpool(waveform.compute_encoded, None, audio)
+            
+            blob = await dedup.register_blob_async(db, key, filename, len(audio), peaks)
         
         # Create database record
         media_file = models.MediaFile(
-            filename=filename,
+            filename=blob.filename,
             original_name="text_conversion",
             file_type="text_to_audio",
-            file_size=file_size,
-            user_id=current_user.id
+            file_size=blob.file_size,
+            format="mp3",
+            user_id=current_user.id,
+            content_key=key
         )
-        db.add(media_file)
-        db.commit()
+        with metrics.stage("text_to_audio", "record"):
+            db.add(media_file)
+            await db.commit()
         
-        return {"url": f"http://localhost:8000/download/{filename}", "filename": filename}
+        return {"url": f"http://localhost:8000/download/{blob.filename}", "filename": blob.filename}
+    except admission.AdmissionRejected as e:
+        raise _busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/convert/video-to-audio")
+def _busy(e: admission.AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def _check_video_admission(user_id: int, db: AsyncSession) -> None:
+    """Raise AdmissionRejected if a video conversion by user_id would be turned away now"""
+    if jobs.JOB_BACKEND == "database":
+        # The workers run elsewhere; the job table is the only shared view of the load
+        await db.run_sync(workqueue.check_admission, user_id)
+    else:
+        admission.video.check(user_id)
+
+def _video_content_key(
+    input_digest: str, profile: extractor.OutputProfile | None = None, options: extractor.ClipOptions | None = None
+) -> str:
+    # Only non-default clip options are added, so whole-track keys stay as they were
+    clip = options.params() if options is not None else {}
+    if profile is not None:
+        return dedup.content_key(
+            "video_to_audio",
+            input_digest,
+            profile=profile.name,
+            encoder=profile.encoder,
+            bitrate=profile.bitrate,
+            **clip,
+        )
+    return dedup.content_key(
+        "video_to_audio",
+        input_digest,
+        copy_codecs=extractor.STREAM_COPY_CODECS,
+        bitrate=extractor.TRANSCODE_BITRATE,
+        **clip,
+    )
+
+def _observe_extraction(kind: str, result: extractor.ExtractionResult, queued_since: datetime | None = None):
+    """Record timing of a finished ffmpeg run, including how long it waited for a worker"""
+    extractor.record_timing(result)
+    metrics.observe_stages(kind, result.stages)
+    if queued_since is not None:
+        waited = (datetime.utcnow() - queued_since).total_seconds() - result.seconds
+        metrics.STAGE_SECONDS.labels(kind, "queue").observe(max(0.0, waited))
+
+def _record_video_conversion(job: jobs.Job, result: extractor.ExtractionResult) -> int:
+    """Store the MediaFile row for a finished video-to-audio job"""
+    _observe_extraction("video_to_audio", result, job.created_at)
+    metrics.count_bytes("video_to_audio", "out", result.file_size)
+    db = SessionLocal()
+    try:
+        with metrics.stage("video_to_audio", "record"):
+            blob = dedup.register_blob(db, job.content_key, result.filename, result.file_size, result.waveform)
+            job.output_filename = blob.filename
+            return dedup.link_output(db, blob, job.content_key, job.original_name, job.user_id).id
+    finally:
+        db.close()
+
+def _record_renditions(
+    job: jobs.Job, results: list[extractor.ExtractionResult], keys: dict[str, str], linked: list[int]
+) -> list[int]:
+    """Store a MediaFile row per rendition of a finished multi-profile job.
+
+    linked holds the rows already created for renditions served from the dedup cache.
+    """
+    # One ffmpeg run produced every rendition
+    _observe_extraction("video_to_audio", results[0], job.created_at)
+    db = SessionLocal()
+    try:
+        media_file_ids = list(linked)
+        with metrics.stage("video_to_audio", "record"):
+            for result in results:
+                metrics.count_bytes("video_to_audio", "out", result.file_size)
+                key = keys[result.profile]
+                blob = dedup.register_blob(db, key, result.filename, result.file_size, result.waveform)
+                media_file_ids.append(dedup.link_output(db, blob, key, job.original_name, job.user_id, result.profile).id)
+        job.output_filename = results[0].filename
+        return media_file_ids
+    finally:
+        db.close()
+
+def _split_profiles(profiles: list[str] | None) -> list[extractor.OutputProfile]:
+    """Profiles from repeated and/or comma-separated ?profiles= values"""
+    names = [name.strip() for value in profiles or [] for name in value.split(",") if name.strip()]
+    try:
+        return extractor.get_profiles(names)
+    except extractor.UnknownProfileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _clip_options(
+    profiles: list[extractor.OutputProfile],
+    start: float | None = None,
+    end: float | None = None,
+    audio_stream: int = 0,
+    channels: int | None = None,
+    sample_rate: int | None = None,
+) -> extractor.ClipOptions:
+    try:
+        options = extractor.ClipOptions(start, end, audio_stream, channels, sample_rate)
+        options.check_profiles(profiles)
+    except extractor.InvalidInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return options
+
+def _discard_job_files(job: jobs.Job):
+    """Remove the staged upload once the job has finished"""
+    if os.path.exists(job.input_path):
+        os.remove(job.input_path)
+
+async def _record_completed(job: jobs.Job, media_file_ids: list[int], db: AsyncSession):
+    """Track a job served entirely from the dedup cache"""
+    if jobs.JOB_BACKEND == "database":
+        await db.run_sync(workqueue.record_completed, job, media_file_ids)
+    else:
+        jobs.job_queue.record_completed(job, media_file_ids)
+
+def _job_accepted(job: jobs.Job) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.current_status,
+        "status_url": f"http://localhost:8000/jobs/{job.id}"
+    }
+
+async def _convert_renditions(
+    job: jobs.Job,
+    input_path: str,
+    input_digest: str,
+    profiles: list[extractor.OutputProfile],
+    db: AsyncSession,
+    options: extractor.ClipOptions,
+    queue_limit: bool = True,
+) -> dict:
+    """Queue the renditions of a staged upload that are not already in the dedup cache"""
+    keys = {profile.name: _video_content_key(input_digest, profile, options) for profile in profiles}
+    cached = {}
+    missing = []
+    for profile in profiles:
+        with metrics.stage("video_to_audio", "dedup_lookup"):
+            blob = await dedup.find_blob_async(db, keys[profile.name])
+        if blob is None:
+            missing.append(profile.name)
+        else:
+            cached[profile.name] = blob
+
+    if missing and queue_limit:
+        # Nothing is linked until the conversion is admitted; the references
+        # taken by the lookups are not committed yet
+        try:
+            await _check_video_admission(job.user_id, db)
+        except admission.AdmissionRejected:
+            await db.rollback()
+            raise
+    linked = []
+    for name, blob in cached.items():
+        media_file = await db.run_sync(dedup.link_output, blob, keys[name], job.original_name, job.user_id, name)
+        linked.append(media_file.id)
+
+    if not missing:
+        os.remove(input_path)
+        await _record_completed(job, linked, db)
+        return _job_accepted(job)
+
+    job.input_path = input_path
+    if jobs.JOB_BACKEND == "database":
+        # Picked up by a standalone worker (worker.py)
+        await db.run_sync(workqueue.enqueue, job, missing, keys, linked, options)
+        return _job_accepted(job)
+    try:
+        jobs.job_queue.submit(
+            job,
+            storage.convert_and_store,
+            extractor.extract_renditions,
+            input_path,
+            storage.scratch_path(str(uuid.uuid4())),
+            missing,
+            options,
+            on_success=functools.partial(_record_renditions, keys=keys, linked=linked),
+            on_finish=_discard_job_files,
+            admission=admission.video,
+            queue_limit=queue_limit,
+        )
+    except admission.AdmissionRejected:
+        # The last slot went to another request since the check above
+        orphaned = await db.run_sync(dedup.unlink_outputs, linked)
+        for filename in orphaned:
+            await run_in_threadpool(storage.outputs.delete, filename)
+        raise
+    return _job_accepted(job)
+
+async def _queue_video_conversion(
+    job: jobs.Job,
+    input_path: str,
+    input_digest: str,
+    profiles: list[extractor.OutputProfile],
+    db: AsyncSession,
+    options: extractor.ClipOptions | None = None,
+    queue_limit: bool = True,
+) -> dict:
+    """Queue a staged upload for conversion, or link the existing output of an identical one.
+
+    options selects a time range, audio stream and downmix. queue_limit=False
+    queues the job even past the admission limits, for uploads that were
+    checked against them just before being assembled.
+    """
+    options = options or extractor.ClipOptions()
+    if profiles:
+        return await _convert_renditions(job, input_path, input_digest, profiles, db, options, queue_limit)
+    job.content_key = _video_content_key(input_digest, options=options)
+
+    # Identical upload converted before: link the existing output instead
+    with metrics.stage("video_to_audio", "dedup_lookup"):
+        blob = await dedup.find_blob_async(db, job.content_key)
+    if blob is not None:
+        os.remove(input_path)
+        media_file = await db.run_sync(dedup.link_output, blob, job.content_key, job.original_name, job.user_id)
+        job.output_filename = blob.filename
+        await _record_completed(job, [media_file.id], db)
+        return _job_accepted(job)
+
+    job.input_path = input_path
+    if jobs.JOB_BACKEND == "database":
+        if queue_limit:
+            await db.run_sync(workqueue.check_admission, job.user_id)
+        await db.run_sync(workqueue.enqueue, job, options=options)
+        return _job_accepted(job)
+    # The extension depends on whether the audio is stream-copied or transcoded
+    output_stem = storage.scratch_path(str(uuid.uuid4()))
+    jobs.job_queue.submit(
+        job,
+        storage.convert_and_store,
+        extractor.extract_audio,
+        input_path,
+        output_stem,
+        options,
+        on_success=_record_video_conversion,
+        on_finish=_discard_job_files,
+        admission=admission.video,
+        queue_limit=queue_limit,
+    )
+    return _job_accepted(job)
+
+@app.post("/convert/video-to-audio", status_code=status.HTTP_202_ACCEPTED)
 async def convert_video_to_audio(
     file: UploadFile = File(...), 
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    profiles: list[str] | None = Query(None),
+    start: float | None = Query(None, description="Seconds into the video to start the clip at"),
+    end: float | None = Query(None, description="Seconds into the video to end the clip at"),
+    audio_stream: int = Query(0, description="Index of the audio stream to extract, for multi-track videos"),
+    channels: int | None = Query(None, description="Downmix to 1 (mono) or 2 (stereo) channels"),
+    sample_rate: int | None = Query(None, description="Resample to this rate in Hz"),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    """Stage the upload and queue it for conversion; poll /jobs/{job_id} for the result.
+
+    Without profiles the audio track is extracted as-is where possible. With
+    ?profiles=opus-32k,aac-128k every named rendition is encoded from a single
+    decode and recorded as its own file. start/end cut a clip by seeking, so
+    a short clip of a long video only costs the clip. Large files on
+    unreliable connections are better sent through the resumable /uploads endpoints.
+    """
+    selected = _split_profiles(profiles)
+    options = _clip_options(selected, start, end, audio_stream, channels, sample_rate)
+    input_path = None
     try:
-        input_filename = f"{uuid.uuid4()}_{file.filename}"
+        # Turn the request away before staging the upload if it would be rejected anyway
+        await _check_video_admission(current_user.id, db)
+        input_filename = f"{uuid.uuid4()}_{os.path.basename(file.filename or 'upload')}"
         input_path = os.path.join("uploads", input_filename)
         
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with metrics.stage("video_to_audio", "upload"), open(input_path, "wb") as buffer:
+            input_digest = await run_in_threadpool(dedup.copy_and_hash, file.file, buffer)
+            metrics.count_bytes("video_to_audio", "in", buffer.tell())
             
-        output_filename = f"{uuid.uuid4()}.mp3"
-        output_path = os.path.join("outputs", output_filename)
-        
-        # Convert
-        video = VideoFileClip(input_path)
-        if video.audio is None:
-             raise HTTPException(status_code=400, detail="Video has no audio track")
-        
-        video.audio.write_audiofile(output_path)
-        video.close()
-        
-        # Cleanup input
-        os.remove(input_path)
-        
-        # Get file size
-        file_size = os.path.getsize(output_path)
-        
-        # Create database record
-        media_file = models.MediaFile(
-            filename=output_filename,
-            original_name=file.filename,
-            file_type="video_to_audio",
-            file_size=file_size,
-            user_id=current_user.id
-        )
-        db.add(media_file)
-        db.commit()
-        
-        return {"url": f"http://localhost:8000/download/{output_filename}", "filename": output_filename}
+        job = jobs.new_job(current_user.id, "video_to_audio", original_name=file.filename)
+        return await _queue_video_conversion(job, input_path, input_digest, selected, db, options)
+    except admission.AdmissionRejected as e:
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+        raise _busy(e)
     except Exception as e:
         # Cleanup if failed
-        if 'input_path' in locals() and os.path.exists(input_path):
+        if input_path and os.path.exists(input_path):
             os.remove(input_path)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _hash_chunks(chunks, digest):
+    """Pass chunks through while feeding them to a running hash"""
+    async for chunk in chunks:
+        digest.update(chunk)
+        metrics.count_bytes("video_to_audio_stream", "in", len(chunk))
+        yield chunk
+
+async def _stage_stream(head: bytes, chunks, input_path: str):
+    """Write a streamed upload to disk for containers that need seeking"""
+    with open(input_path, "wb") as buffer:
+        buffer.write(head)
+        async for chunk in chunks:
+            await run_in_threadpool(buffer.write, chunk)
+
+async def _extract_stream(request: Request, filename: str) -> tuple[extractor.ExtractionResult, bool, str]:
+    """Convert a streamed request body and store the output; returns (result, staged, input sha256)"""
+    chunks = request.stream().__aiter__()
+    head = bytearray()
+    while len(head) < extractor.STREAM_HEAD_BYTES:
+        try:
+            head += await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    if not head:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    head = bytes(head)
+    metrics.count_bytes("video_to_audio_stream", "in", len(head))
+    digest = hashlib.sha256(head)
+    chunks = _hash_chunks(chunks, digest)
+
+    output_stem = storage.scratch_path(str(uuid.uuid4()))
+    input_path = None
+    try:
+        staged = extractor.needs_seek(head)
+        if staged:
+            input_path = os.path.join("uploads", f"{uuid.uuid4()}_{os.path.basename(filename)}")
+            await _stage_stream(head, chunks, input_path)
+            result = await run_in_threadpool(extractor.extract_audio, input_path, output_stem)
+        else:
+            result = await extractor.extract_audio_stream(head, chunks, output_stem)
+        output_path = storage.scratch_path(result.filename)
+        from services import waveform
+        await run_in_threadpool(waveform.attach, result, output_path)
+        with metrics.stage("video_to_audio_stream", "store"):
+            await run_in_threadpool(storage.outputs.save_file, output_path, result.filename)
+    except extractor.InvalidInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if input_path and os.path.exists(input_path):
+            os.remove(input_path)
+        # Whatever ffmpeg left in scratch if the output was not stored; once stored it has been moved away
+        for leftover in glob.glob(glob.escape(output_stem) + ".*"):
+            os.remove(leftover)
+    return result, staged, digest.hexdigest()
+
+@app.post("/convert/video-to-audio/stream")
+async def convert_video_to_audio_stream(
+    request: Request,
+    filename: str = "upload",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Convert a raw video request body while it is still being uploaded.
+
+    The body is piped straight into ffmpeg. Only containers that cannot be
+    demuxed sequentially (MP4/MOV with the moov box at the end) are staged in
+    uploads/ first. While every conversion slot is busy the body is not read,
+    so clients are slowed down rather than piling up uploads.
+    """
+    try:
+        async with admission.video.slot(current_user.id):
+            result, staged, input_digest = await _extract_stream(request, filename)
+    except admission.AdmissionRejected as e:
+        raise _busy(e)
+    _observe_extraction("video_to_audio_stream", result)
+    metrics.count_bytes("video_to_audio_stream", "out", result.file_size)
+
+    # The hash is only known once the stream ends, so a repeat upload still
+    # converts but keeps a single stored copy
+    key = _video_content_key(input_digest)
+    with metrics.stage("video_to_audio_stream", "record"):
+        blob = await dedup.register_blob_async(db, key, result.filename, result.file_size, result.waveform)
+        await db.run_sync(dedup.link_output, blob, key, filename, current_user.id)
+
+    return {
+        "url": f"http://localhost:8000/download/{blob.filename}",
+        "filename": blob.filename,
+        "staged": staged
+    }
+
+def _upload_headers(upload: uploads.ResumableUpload) -> dict:
+    headers = {
+        "Tus-Resumable": uploads.TUS_VERSION,
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.length),
+        "Upload-Expires": formatdate(uploads.store.expires_at(upload), usegmt=True),
+        "Cache-Control": "no-store",
+    }
+    if upload.job_id:
+        headers["Job-Id"] = upload.job_id
+    return headers
+
+def _check_tus_version(tus_resumable: str | None = Header(None)):
+    """Reject clients speaking another version of the resumable upload protocol"""
+    if tus_resumable is not None and tus_resumable != uploads.TUS_VERSION:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Unsupported Tus-Resumable version: {tus_resumable}",
+            headers={"Tus-Version": uploads.TUS_VERSION},
+        )
+
+def _get_upload(upload_id: str, current_user: Principal) -> uploads.ResumableUpload:
+    upload = uploads.store.get(upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found", headers={"Tus-Resumable": uploads.TUS_VERSION})
+    return upload
+
+@app.options("/uploads")
+def get_upload_capabilities():
+    """Protocol version and extensions supported by the resumable upload endpoints"""
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={
+        "Tus-Resumable": uploads.TUS_VERSION,
+        "Tus-Version": uploads.TUS_VERSION,
+        "Tus-Extension": uploads.TUS_EXTENSIONS,
+        "Tus-Max-Size": str(uploads.store.max_bytes),
+        "Tus-Checksum-Algorithm": ",".join(uploads.CHECKSUM_ALGORITHMS),
+    })
+
+@app.post("/uploads", status_code=status.HTTP_201_CREATED, dependencies=[Depends(_check_tus_version)])
+async def create_upload(
+    upload_length: int | None = Header(None),
+    upload_metadata: str | None = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Start a resumable upload of a video; send its bytes with PATCH to the returned Location.
+
+    Upload-Metadata may carry the filename and comma-separated output profiles.
+    Once every byte has arrived the video is queued for conversion exactly like
+    /convert/video-to-audio, and the final PATCH response names the job.
+    """
+    if upload_length is None:
+        raise HTTPException(status_code=400, detail="Upload-Length header is required")
+    if upload_length > uploads.store.max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Uploads are limited to {uploads.store.max_bytes} bytes",
+        )
+    try:
+        # Turn the upload away early if it would be rejected anyway; the limits
+        # are checked again once its last byte has arrived
+        await _check_video_admission(current_user.id, db)
+    except admission.AdmissionRejected as e:
+        raise _busy(e)
+    try:
+        metadata = uploads.parse_metadata(upload_metadata)
+        _split_profiles([metadata.get("profiles", "")])
+        upload = await run_in_threadpool(uploads.store.create, current_user.id, upload_length, metadata)
+    except uploads.InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(status_code=status.HTTP_201_CREATED, headers={
+        **_upload_headers(upload),
+        "Location": f"http://localhost:8000/uploads/{upload.id}",
+    })
+
+@app.head("/uploads/{upload_id}", dependencies=[Depends(_check_tus_version)])
+def get_upload_offset(upload_id: str, current_user: Principal = Depends(get_current_user)):
+    """How many bytes of an upload the server has, i.e. where to resume"""
+    return Response(status_code=status.HTTP_200_OK, headers=_upload_headers(_get_upload(upload_id, current_user)))
+
+async def _write_chunk(request: Request, upload: uploads.ResumableUpload, offset: int, checksum) -> int:
+    """Append the request body at offset; returns the number of bytes kept"""
+    written = 0
+    with uploads.store.writing(upload, offset) as f:
+        try:
+            async for chunk in request.stream():
+                if offset + written + len(chunk) > upload.length:
+                    raise uploads.InvalidUploadError("Chunk extends past Upload-Length")
+                await run_in_threadpool(f.write, chunk)
+                if checksum is not None:
+                    checksum[0].update(chunk)
+                written += len(chunk)
+                metrics.count_bytes("video_to_audio", "in", len(chunk))
+        except ClientDisconnect:
+            # Without a checksum the bytes that made it are kept to resume from
+            if checksum is None:
+                return written
+            f.truncate(offset)
+            return 0
+        except Exception:
+            f.truncate(offset)
+            raise
+        if checksum is not None and checksum[0].digest() != checksum[1]:
+            f.truncate(offset)
+            raise uploads.ChecksumMismatchError("Chunk does not match Upload-Checksum")
+    return written
+
+async def _convert_finished_upload(upload: uploads.ResumableUpload, db: AsyncSession) -> None:
+    """Hand an assembled upload to the converter and record its job on the upload"""
+    profiles = _split_profiles(upload.profiles)
+    input_path = await run_in_threadpool(uploads.store.finish, upload, "uploads")
+    try:
+        input_digest = await run_in_threadpool(uploads.file_digest, input_path)
+        job = jobs.new_job(upload.user_id, "video_to_audio", original_name=upload.filename)
+        await _queue_video_conversion(job, input_path, input_digest, profiles, db, queue_limit=False)
+    except Exception as e:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        await run_in_threadpool(uploads.store.delete, upload)
+        raise HTTPException(status_code=500, detail=str(e))
+    await run_in_threadpool(uploads.store.mark_complete, upload, job.id)
+
+@app.patch("/uploads/{upload_id}", dependencies=[Depends(_check_tus_version)])
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int | None = Header(None),
+    upload_checksum: str | None = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Append a chunk at Upload-Offset, verified against Upload-Checksum when given.
+
+    A chunk that fails its checksum is discarded (460); one cut off by a
+    dropped connection is kept up to where it stopped unless it carried a
+    checksum. HEAD tells the client where to continue either way.
+    """
+    upload = _get_upload(upload_id, current_user)
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Content-Type must be application/offset+octet-stream",
+        )
+    if upload_offset is None:
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+    if upload.complete and upload_offset == upload.length:
+        # Repeat of the final chunk whose response was lost
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_upload_headers(upload))
+    try:
+        checksum = uploads.parse_checksum(upload_checksum)
+        upload.offset += await _write_chunk(request, upload, upload_offset, checksum)
+    except uploads.UploadConflictError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e), headers=_upload_headers(upload))
+    except uploads.ChecksumMismatchError as e:
+        # 460 Checksum Mismatch, from the tus checksum extension
+        raise HTTPException(status_code=460, detail=str(e), headers=_upload_headers(upload))
+    except uploads.InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e), headers=_upload_headers(upload))
+
+    if upload.offset == upload.length:
+        try:
+            # Creating the upload reserved nothing, so the limits apply again here.
+            # A rejected upload stays whole: resend this PATCH, empty, after Retry-After
+            await _check_video_admission(upload.user_id, db)
+        except admission.AdmissionRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers={
+                **_upload_headers(upload), "Retry-After": str(e.retry_after),
+            })
+        await _convert_finished_upload(upload, db)
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=_upload_headers(upload))
+
+@app.delete("/uploads/{upload_id}", dependencies=[Depends(_check_tus_version)])
+def delete_upload(upload_id: str, current_user: Principal = Depends(get_current_user)):
+    """Abandon an upload and free its space; a job it already started keeps running"""
+    uploads.store.delete(_get_upload(upload_id, current_user))
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"Tus-Resumable": uploads.TUS_VERSION})
+
+def _stage_batch_uploads(files: list[UploadFile]) -> list[tuple[str, str, str]]:
+    """Copy each upload, or the members of a single ZIP, into uploads/ while hashing it"""
+    if len(files) == 1 and (files[0].filename or "").lower().endswith(".zip"):
+        return batches.expand_archive(files[0].file, "uploads")
+    if len(files) > batches.BATCH_MAX_ITEMS:
+        raise batches.InvalidBatchError(f"A batch can contain at most {batches.BATCH_MAX_ITEMS} files")
+    staged = []
+    try:
+        for file in files:
+            name = os.path.basename(file.filename or "upload")
+            input_path = os.path.join("uploads", f"{uuid.uuid4()}_{name}")
+            staged.append((name, input_path, None))
+            with open(input_path, "wb") as buffer:
+                staged[-1] = (name, input_path, dedup.copy_and_hash(file.file, buffer))
+    except Exception:
+        batches.discard_staged(staged)
+        raise
+    return staged
+
+def _batch_item_args(item: batches.BatchItem) -> tuple:
+    return extractor.extract_audio, item.input_path, storage.scratch_path(str(uuid.uuid4()))
+
+def _record_batch_item(batch: batches.Batch, item: batches.BatchItem, result: extractor.ExtractionResult):
+    """Register a converted batch item's output; its MediaFile row is added with the rest of the batch"""
+    _observe_extraction("batch", result, batch.created_at)
+    metrics.count_bytes("batch", "out", result.file_size)
+    db = SessionLocal()
+    try:
+        blob = dedup.register_blob(db, item.content_key, result.filename, result.file_size, result.waveform)
+        db.commit()
+        item.filename, item.file_size = blob.filename, blob.file_size
+    finally:
+        db.close()
+
+def _discard_batch_input(item: batches.BatchItem):
+    if item.input_path and os.path.exists(item.input_path):
+        os.remove(item.input_path)
+
+def _link_batch_outputs(batch: batches.Batch):
+    """Create the MediaFile rows of every completed item with a single bulk INSERT"""
+    completed = [item for item in batch.items if item.status == jobs.COMPLETED]
+    if not completed:
+        return
+    db = SessionLocal()
+    try:
+        with metrics.stage("batch", "record"):
+            ids = db.execute(
+                insert(models.MediaFile).returning(models.MediaFile.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "filename": item.filename,
+                        "original_name": item.name,
+                        "file_type": "video_to_audio",
+                        "file_size": item.file_size,
+                        "format": extractor.output_format(item.filename),
+                        "user_id": batch.user_id,
+                        "content_key": item.content_key,
+                    }
+                    for item in completed
+                ],
+            ).scalars().all()
+            db.commit()
+    finally:
+        db.close()
+    for item, media_file_id in zip(completed, ids):
+        item.media_file_id = media_file_id
+
+def serialize_batch(batch: batches.Batch) -> dict:
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "created_at": batch.created_at.isoformat(),
+        "finished_at": batch.finished_at.isoformat() if batch.finished_at else None,
+        "total": len(batch.items),
+        "progress": batch.counts(),
+        "items": [
+            {
+                "name": item.name,
+                "status": item.status,
+                "error": item.error,
+                "filename": item.filename if item.media_file_id else None,
+                "download_url": f"http://localhost:8000/download/{item.filename}" if item.media_file_id else None,
+            }
+            for item in batch.items
+        ],
+        "archive_url": f"http://localhost:8000/batches/{batch.id}/archive",
+    }
+
+@app.post("/convert/batch", status_code=status.HTTP_202_ACCEPTED)
+async def convert_batch(
+    files: list[UploadFile] = File(...),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Convert many videos, uploaded as several files or as one ZIP, concurrently.
+
+    Poll /batches/{batch_id} for per-item progress, then fetch all outputs at
+    once from /batches/{batch_id}/archive. Not available with
+    JOB_BACKEND=database: batches are tracked in the API process that accepted
+    them, so they could neither run on the workers nor be polled from another
+    API process.
+    """
+    if jobs.JOB_BACKEND == "database":
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Batch conversion is not available on this server; convert the files individually",
+        )
+    try:
+        admission.video.check(current_user.id)
+    except admission.AdmissionRejected as e:
+        raise _busy(e)
+    try:
+        staged = await run_in_threadpool(_stage_batch_uploads, files)
+    except batches.InvalidBatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    batch = batches.new_batch(current_user.id)
+    try:
+        for name, input_path, digest in staged:
+            item = batches.BatchItem(name=name, input_path=input_path, content_key=_video_content_key(digest))
+            # Identical uploads converted before reuse the existing output
+            blob = await dedup.find_blob_async(db, item.content_key)
+            if blob is not None:
+                os.remove(input_path)
+                item.input_path = None
+                item.status = jobs.COMPLETED
+                item.filename, item.file_size = blob.filename, blob.file_size
+            batch.items.append(item)
+        await db.commit()
+    except Exception as e:
+        batches.discard_staged(staged)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # In a thread: when every item was a dedup hit the rows are inserted right away
+    await run_in_threadpool(
+        batches.batch_queue.submit,
+        batch,
+        storage.convert_and_store,
+        _batch_item_args,
+        on_item_success=_record_batch_item,
+        on_item_finish=_discard_batch_input,
+        on_complete=_link_batch_outputs,
+    )
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "total": len(batch.items),
+        "status_url": f"http://localhost:8000/batches/{batch.id}"
+    }
+
+def _get_user_batch(batch_id: str, user_id: int) -> batches.Batch:
+    batch = batches.batch_queue.get(batch_id)
+    if batch is None or batch.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, current_user: Principal = Depends(get_current_user)):
+    """Report the overall and per-item progress of a batch"""
+    return serialize_batch(_get_user_batch(batch_id, current_user.id))
+
+@app.get("/batches/{batch_id}/archive")
+async def download_batch_archive(batch_id: str, current_user: Principal = Depends(get_current_user)):
+    """Stream every output of a finished batch as one ZIP, named after the uploaded files"""
+    batch = _get_user_batch(batch_id, current_user.id)
+    if batch.finished_at is None:
+        raise HTTPException(status_code=409, detail="Batch is still converting")
+    used_names = set()
+    entries = []
+    for item in batch.items:
+        if item.media_file_id is None:
+            continue
+        arcname = os.path.splitext(item.name)[0] + os.path.splitext(item.filename)[1]
+        entries.append((zipstream.unique_name(arcname, used_names), item.filename))
+    if not entries:
+        raise HTTPException(status_code=404, detail="No converted files to download")
+    return StreamingResponse(
+        zipstream.stream_zip(entries, storage.outputs),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch.id}.zip"'}
+    )
+
+async def serialize_job(job: jobs.Job, db: AsyncSession) -> dict:
+    data = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.current_status,
+        "original_name": job.original_name,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "error": job.error,
+        "percent": job.percent,
+        "eta_seconds": job.eta_seconds,
+        "file": None,
+        "files": [],
+    }
+    if job.media_file_ids:
+        rows = (await db.execute(
+            select(models.MediaFile).where(models.MediaFile.id.in_(job.media_file_ids))
+        )).scalars().all()
+        by_id = {media_file.id: media_file for media_file in rows}
+        # "file" is the first output; multi-profile jobs list every rendition in "files"
+        data["files"] = [serialize_media_file(by_id[i]) for i in job.media_file_ids if i in by_id]
+        data["file"] = data["files"][0] if data["files"] else None
+    return data
+
+@app.get("/jobs")
+async def list_jobs(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """List the current user's recent conversion jobs"""
+    if jobs.JOB_BACKEND == "database":
+        user_jobs = await db.run_sync(workqueue.for_user, current_user.id)
+    else:
+        user_jobs = jobs.job_queue.for_user(current_user.id)
+    return {"jobs": [await serialize_job(job, db) for job in user_jobs]}
+
+async def _get_user_job(job_id: str, user_id: int, db: AsyncSession) -> jobs.Job:
+    if jobs.JOB_BACKEND == "database":
+        job = await db.run_sync(workqueue.get, job_id)
+    else:
+        job = jobs.job_queue.get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Report the status of a conversion job and its MediaFile once completed"""
+    return await serialize_job(await _get_user_job(job_id, current_user.id, db), db)
+
+async def _wait_for_change(job: jobs.Job, version: int, db: AsyncSession) -> tuple[jobs.Job, bool]:
+    """The job's latest state, and whether it changed before the keep-alive interval ran out"""
+    if jobs.JOB_BACKEND == "database":
+        # Workers run elsewhere, so watch the row
+        return await workqueue.wait_for_change(db, job, version, jobs.EVENTS_KEEPALIVE_SECONDS)
+    return job, await jobs.job_queue.wait_for_change(job, version, jobs.EVENTS_KEEPALIVE_SECONDS)
+
+def _sse(event: str, data: dict, event_id: int) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    current_user: Principal = Depends(get_stream_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream a job's progress as Server-Sent Events until it finishes.
+
+    `progress` events carry the percent complete and ETA; the stream ends with
+    a `completed` or `failed` event holding the /jobs/{job_id} payload. Every
+    connection starts from the job's current state, so a client can drop and
+    reconnect at any time without affecting the conversion.
+    """
+    job = await _get_user_job(job_id, current_user.id, db)
+
+    async def events():
+        current, version = job, None
+        while True:
+            if current.version != version:
+                version = current.version
+                if current.finished_at is not None:
+                    yield _sse(current.status, await serialize_job(current, db), version)
+                    return
+                yield _sse("progress", {
+                    "job_id": current.id,
+                    "status": current.current_status,
+                    "percent": current.percent,
+                    "eta_seconds": current.eta_seconds,
+                }, version)
+            else:
+                current, changed = await _wait_for_change(current, version, db)
+                if not changed:
+                    yield ": keep-alive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies such as nginx would otherwise hold events back in their buffers
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/stats/extraction")
+def get_extraction_stats():
+    """Wall-time totals for stream-copy vs transcode extractions since startup"""
+    return extractor.timing_stats()
+
+@app.get("/tts/engines")
+def list_tts_engines():
+    """TTS engines this server knows about and whether each can run here"""
+    return {
+        "default": tts.TTS_ENGINE,
+        "engines": [{"name": name, "available": engine.available()} for name, engine in tts.ENGINES.items()]
+    }
+
+@app.get("/profiles")
+def list_output_profiles():
+    """Output profiles accepted by /convert/video-to-audio?profiles="""
+    return {
+        "profiles": [
+            {"name": profile.name, "format": profile.format, "bitrate": profile.bitrate}
+            for profile in extractor.OUTPUT_PROFILES.values()
+        ]
+    }
+
+@app.get("/stats/admission")
+def get_admission_stats():
+    """Running, queued and rejected conversions for each admission controller"""
+    return {"video": admission.video.stats(), "text": admission.text.stats()}
+
+@app.get("/stats/auth-cache")
+def get_auth_cache_stats():
+    """Hit/miss counters of the verified-token cache"""
+    return token_cache.stats()
+
+@app.get("/stats/db-pool")
+def get_db_pool_stats():
+    """Connection pool occupancy and how long checkouts waited for a connection"""
+    return pool_stats()
+
+@app.get("/stats/sweeper")
+def get_sweeper_stats():
+    """Rows and files reclaimed by the retention sweeper and time spent doing it"""
+    return {
+        "interval_seconds": sweeper.sweeper.interval_seconds,
+        "batch_size": sweeper.sweeper.batch_size,
+        **sweeper.sweeper.stats.snapshot(),
+    }
+
+@app.get("/stats/tts-cache")
+def get_tts_cache_stats():
+    """Hit/miss counters and size of the in-memory synthesis cache"""
+    return tts.synthesis_cache.stats()
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint: request latency, conversion stages and the service stats above"""
+    data, content_type = metrics.render()
+    return Response(content=data, media_type=content_type)
+
 @app.get("/download/{filename}")
 async def download_file(
     filename: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if file exists in database and belongs to current user
-    media_file = db.query(models.MediaFile).filter(
+    media_file = (await db.execute(select(models.MediaFile).where(
         models.MediaFile.filename == filename,
         models.MediaFile.user_id == current_user.id
-    ).first()
+    ))).scalars().first()
     
     if not media_file:
         raise HTTPException(status_code=404, detail="File not found or access denied")
     
-    file_path = os.path.join("outputs", filename)
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="audio/mpeg", filename=filename)
+    stored = await run_in_threadpool(storage.outputs.stat, filename)
+    if stored is not None:
+        media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        return metrics.count_download(
+            downloads.file_response(request, storage.outputs, stored, media_type, filename)
+        )
     else:
-        # File missing from disk but exists in DB - clean up DB record
-        db.delete(media_file)
-        db.commit()
+        # File missing from storage but exists in DB - clean up DB record
+        await db.run_sync(dedup.release, media_file)
+        await db.delete(media_file)
+        await db.commit()
         raise HTTPException(status_code=404, detail="File not found")
 
+def _waveform_query(filename: str, user_id: int):
+    """The stored peaks of user_id's file, from the blob that holds exactly that file"""
+    # Matching the filename too keeps a blob re-registered under the key with
+    # another file (or moved by a migration) from answering with other audio
+    return select(models.OutputBlob.waveform).join(
+        models.MediaFile,
+        and_(
+            models.MediaFile.content_key == models.OutputBlob.content_key,
+            models.MediaFile.filename == models.OutputBlob.filename,
+        ),
+    ).where(models.MediaFile.filename == filename, models.MediaFile.user_id == user_id)
+
+@app.get("/files/{filename}/waveform")
+async def get_waveform(
+    filename: str,
+    resolution: int = Query(256, ge=1),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Min/max peaks of one of the user's files for drawing a preview, without reading the audio.
+
+    The peaks were computed when the file was converted; resolution buckets
+    are reduced from the nearest stored level (fewer for very short audio).
+    """
+    from services import waveform
+
+    peaks = (await db.execute(_waveform_query(filename, current_user.id))).scalars().first()
+    if peaks is None:
+        raise HTTPException(status_code=404, detail="No waveform for this file")
+    decoded = waveform.Peaks.decode(peaks)
+    pairs = decoded.at(resolution)
+    body = {
+        "duration": round(decoded.duration, 3),
+        "resolution": len(pairs),
+        "min": pairs[:, 0].tolist(),
+        "max": pairs[:, 1].tolist(),
+    }
+    return Response(
+        content=json.dumps(body, separators=(",", ":")),
+        media_type="application/json",
+        # Outputs never change, so neither do their peaks
+        headers={"Cache-Control": f"private, max-age={downloads.DOWNLOAD_MAX_AGE}"},
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
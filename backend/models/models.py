@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, String
 from sqlalchemy.orm import relationship
 from databases.database import Base
 from datetime import datetime
@@ -15,13 +15,63 @@ class User(Base):
 
 class MediaFile(Base):
     __tablename__ = "media_files"
+    __table_args__ = (
+        # Serves the keyset-paginated /my-files listing
+        Index("ix_media_files_user_created", "user_id", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     original_name = Column(String)  # For video files, store original filename
     file_type = Column(String)  # 'text_to_audio' or 'video_to_audio'
     file_size = Column(Integer)  # Size in bytes
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # Retention sweeps scan by age
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content_key = Column(String, index=True)  # OutputBlob shared with identical conversions
+    format = Column(String)  # Output codec: 'mp3', 'aac' or 'opus'
+    profile = Column(String)  # Output profile such as 'opus-32k'; None for the default extraction
     
     # Relationship back to user
     owner = relationship("User", back_populates="media_files")
+
+class OutputBlob(Base):
+    """A stored converted file, shared by every MediaFile with the same content key"""
+    __tablename__ = "output_blobs"
+    id = Column(Integer, primary_key=True, index=True)
+    content_key = Column(String, unique=True, index=True, nullable=False)  # Hash of input bytes + conversion parameters
+    filename = Column(String, nullable=False)
+    file_size = Column(Integer)
+    ref_count = Column(Integer, nullable=False, default=0)  # Number of MediaFile rows using this blob
+    waveform = Column(LargeBinary)  # Min/max peaks for previews, encoded by services/waveform.py
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ConversionJob(Base):
+    """A video conversion queued for the standalone workers (JOB_BACKEND=database)"""
+    __tablename__ = "conversion_jobs"
+    __table_args__ = (
+        # Workers look for the oldest runnable job
+        Index("ix_conversion_jobs_claim", "status", "run_after", "created_at"),
+    )
+    id = Column(String, primary_key=True)  # uuid, as in /jobs/{job_id}
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")  # queued, running, completed or failed
+    original_name = Column(String)
+    input_path = Column(String)  # Staged upload; must be readable by the workers
+    content_key = Column(String)  # Dedup key of the default extraction
+    profiles = Column(JSON)  # Profile names to encode instead, with their dedup keys in content_keys
+    content_keys = Column(JSON)
+    options = Column(JSON)  # Non-default extractor.ClipOptions, e.g. {"start": 60.0, "end": 90.0}
+    media_file_ids = Column(JSON)  # Outputs recorded so far, e.g. renditions served from the dedup cache
+    output_filename = Column(String)
+    error = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow)  # Delays retries
+    locked_by = Column(String)  # Worker holding the job
+    locked_until = Column(DateTime)  # Another worker may take the job over after this
+    percent = Column(Float)
+    eta_seconds = Column(Float)
+    version = Column(Integer, nullable=False, default=0)  # Bumped on every change, for /jobs/{job_id}/events
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
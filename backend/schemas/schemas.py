@@ -1,4 +1,8 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+
+# Longer texts are rejected before any synthesis starts
+MAX_TEXT_LENGTH = 100_000
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -21,7 +25,19 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: str | None = None
+    user_id: int | None = None
 
 class TextRequest(BaseModel):
-    text: str
+    text: str = Field(min_length=1, max_length=MAX_TEXT_LENGTH)
     language: str = "en"
+    engine: str | None = None  # TTS engine name; the server default when omitted
+
+# Files that can be named in one archive request; filters have no limit
+MAX_ARCHIVE_FILES = 1000
+
+class LibraryArchiveRequest(BaseModel):
+    """Files to bundle: the named ones, or every file matching the filters when filenames is omitted"""
+    filenames: list[str] | None = Field(None, min_length=1, max_length=MAX_ARCHIVE_FILES)
+    file_type: str | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
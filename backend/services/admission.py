@@ -0,0 +1,255 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable
+
+from services import jobs, tts
+
+# Video conversions (ffmpeg) running at once; defaults to one per conversion worker
+VIDEO_MAX_ACTIVE = int(os.getenv("VIDEO_MAX_ACTIVE", str(jobs.CONVERSION_WORKERS)))
+# Video conversions waiting for a slot before new ones are turned away with 503
+VIDEO_MAX_QUEUE = int(os.getenv("VIDEO_MAX_QUEUE", str(4 * jobs.CONVERSION_WORKERS)))
+# Text-to-speech requests synthesizing at once, and waiting for a slot
+TEXT_MAX_ACTIVE = int(os.getenv("TEXT_MAX_ACTIVE", str(2 * tts.TTS_PARALLELISM)))
+TEXT_MAX_QUEUE = int(os.getenv("TEXT_MAX_QUEUE", "64"))
+# Conversions of one kind a single user may have running or queued (0 for no limit); over it, 429
+MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "4"))
+# Longest a request waits in the queue for a slot before giving up with 503
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a conversion cannot be accepted now; carries the HTTP response to send"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    user_id: int
+    start: Callable[[Callable[[], None]], None]
+    queued_at: float
+
+
+class AdmissionController:
+    """Bounds how many conversions of one kind run at once, with a bounded FIFO queue.
+
+    admit() either starts the work immediately, queues it until a slot frees
+    up, or rejects it: 429 when the user already has max_per_user conversions
+    running or queued, 503 when the queue is full. Rejecting early keeps the
+    work that is accepted fast instead of letting every request slow down
+    together.
+    """
+
+    def __init__(self, name: str, max_active: int, max_queue: int, max_per_user: int):
+        self.name = name
+        self.max_active = max(1, max_active)
+        self.max_queue = max(0, max_queue)
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting: deque[_Waiter] = deque()
+        self._by_user: Counter = Counter()  # running or queued, per user
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = Counter()
+        self._max_wait = 0.0
+        # Moving average of how long a slot is held, for Retry-After
+        self._hold_seconds = 0.0
+
+    def _retry_after(self, position: int) -> int:
+        if not self._hold_seconds:
+            return 1
+        return max(1, math.ceil(self._hold_seconds * (position + 1) / self.max_active))
+
+    def _check(self, user_id: int | None) -> None:
+        if user_id is not None and self.max_per_user and self._by_user[user_id] >= self.max_per_user:
+            self._rejected["per_user"] += 1
+            raise AdmissionRejected(
+                429, f"You already have {self.max_per_user} conversions in progress", self._retry_after(0)
+            )
+        if self._active >= self.max_active and len(self._waiting) >= self.max_queue:
+            self._rejected["queue_full"] += 1
+            raise AdmissionRejected(
+                503, "Server is busy converting, please retry later", self._retry_after(len(self._waiting))
+            )
+
+    def check(self, user_id: int | None = None) -> None:
+        """Raise the rejection admit() would, without taking a slot.
+
+        Lets a request be turned away before its upload is staged; admit() can
+        still reject it if the last slot is taken in the meantime.
+        """
+        with self._lock:
+            self._check(user_id)
+
+    def reject(self, reason: str, status_code: int, detail: str, retry_after: int) -> AdmissionRejected:
+        """Count a rejection decided outside the controller, e.g. from the database job queue"""
+        with self._lock:
+            self._rejected[reason] += 1
+        return AdmissionRejected(status_code, detail, retry_after)
+
+    def admit(self, user_id: int, start: Callable[[Callable[[], None]], None], queue_limit: bool = True) -> None:
+        """Call start(release) once a slot is free; release() must be called when the work ends.
+
+        start runs in this thread if a slot is free now, otherwise in whichever
+        thread releases the slot it gets. queue_limit=False queues regardless of
+        the queue and per-user bounds, for work already accepted as part of a
+        larger request.
+        """
+        with self._lock:
+            if queue_limit:
+                self._check(user_id)
+            if self._active < self.max_active and not self._waiting:
+                self._active += 1
+            else:
+                self._waiting.append(_Waiter(user_id, start, time.monotonic()))
+                self._by_user[user_id] += 1
+                self._queued += 1
+                return
+            self._by_user[user_id] += 1
+            self._admitted += 1
+        self._start(_Waiter(user_id, start, time.monotonic()))
+
+    def _start(self, waiter: _Waiter) -> None:
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            with self._lock:
+                if released:
+                    return
+                released = True
+                held = time.monotonic() - started
+                self._hold_seconds = held if not self._hold_seconds else 0.8 * self._hold_seconds + 0.2 * held
+            self._release(waiter.user_id)
+
+        try:
+            waiter.start(release)
+        except Exception:
+            release()
+            raise
+
+    def _release(self, user_id: int) -> None:
+        with self._lock:
+            self._by_user[user_id] -= 1
+            if self._by_user[user_id] <= 0:
+                del self._by_user[user_id]
+            if not self._waiting:
+                self._active -= 1
+                return
+            # Hand the slot straight to the next waiter; _active stays the same
+            waiter = self._waiting.popleft()
+            self._admitted += 1
+            self._max_wait = max(self._max_wait, time.monotonic() - waiter.queued_at)
+        try:
+            self._start(waiter)
+        except Exception as e:
+            print(f"Error starting queued {self.name} conversion: {e}")
+
+    def _withdraw(self, start) -> bool:
+        """Remove a waiter that gave up; False if it was already started"""
+        with self._lock:
+            for waiter in self._waiting:
+                if waiter.start is start:
+                    self._waiting.remove(waiter)
+                    self._by_user[waiter.user_id] -= 1
+                    if self._by_user[waiter.user_id] <= 0:
+                        del self._by_user[waiter.user_id]
+                    return True
+        return False
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, timeout: float = QUEUE_TIMEOUT_SECONDS):
+        """Hold a slot for the body of an async with block, waiting up to timeout in the queue"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant(release):
+            if granted.cancelled():
+                release()
+            else:
+                granted.set_result(release)
+
+        def start(release):
+            loop.call_soon_threadsafe(grant, release)
+
+        self.admit(user_id, start)
+        try:
+            release = await asyncio.wait_for(asyncio.shield(granted), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if not self._withdraw(start):
+                # Granted while we were giving up: hand the slot back once it arrives
+                granted.cancel()
+                if granted.done() and not granted.cancelled():
+                    granted.result()()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            with self._lock:
+                self._rejected["timeout"] += 1
+            raise AdmissionRejected(503, "Timed out waiting for a conversion slot", self._retry_after(len(self._waiting)))
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "max_per_user": self.max_per_user,
+                "active": self._active,
+                "queued": len(self._waiting),
+                "admitted": self._admitted,
+                "queued_total": self._queued,
+                "rejected": {reason: self._rejected[reason] for reason in ("queue_full", "per_user", "timeout")},
+                "max_wait_seconds": round(self._max_wait, 3),
+                "mean_hold_seconds": round(self._hold_seconds, 3),
+            }
+
+
+class AdmissionMiddleware:
+    """Turn requests away with 503 before their body is read while a controller is saturated.
+
+    Uploads can be large; rejecting after receiving them would spend the
+    bandwidth and disk the limit is meant to protect. Per-user limits need the
+    authenticated user and are applied in the endpoints.
+    """
+
+    def __init__(self, app, routes: dict[str, "AdmissionController"]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        controller = self.routes.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if controller is not None:
+            try:
+                controller.check()
+            except AdmissionRejected as e:
+                await send({
+                    "type": "http.response.start",
+                    "status": e.status_code,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(e.retry_after).encode("ascii")),
+                    ],
+                })
+                await send({"type": "http.response.body", "body": json.dumps({"detail": e.detail}).encode("utf-8")})
+                return
+        await self.app(scope, receive, send)
+
+
+video = AdmissionController("video", VIDEO_MAX_ACTIVE, VIDEO_MAX_QUEUE, MAX_PER_USER)
+text = AdmissionController("text", TEXT_MAX_ACTIVE, TEXT_MAX_QUEUE, MAX_PER_USER)
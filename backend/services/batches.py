@@ -0,0 +1,251 @@
+import os
+import posixpath
+import threading
+import uuid
+import zipfile
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable
+
+from services import admission, dedup, jobs
+
+# Files accepted in one batch, whether uploaded individually or inside a ZIP
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+# Uncompressed size limit for an uploaded archive
+BATCH_MAX_ARCHIVE_BYTES = int(os.getenv("BATCH_MAX_ARCHIVE_BYTES", str(4 * 1024 ** 3)))
+# Items of one batch converting at once, so a big batch cannot occupy the whole worker pool
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(jobs.CONVERSION_WORKERS)))
+
+
+class InvalidBatchError(ValueError):
+    """Raised for an upload that cannot be turned into a batch"""
+
+
+@dataclass
+class BatchItem:
+    name: str  # Path of the file as uploaded, including folders inside an archive
+    input_path: str | None = None
+    content_key: str | None = None
+    status: str = jobs.QUEUED
+    error: str | None = None
+    filename: str | None = None  # Stored output once converted
+    file_size: int | None = None
+    media_file_id: int | None = None
+
+
+@dataclass
+class Batch:
+    id: str
+    user_id: int
+    items: list[BatchItem] = field(default_factory=list)
+    status: str = jobs.QUEUED
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    _pending: deque = field(default_factory=deque, repr=False)
+    _remaining: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def counts(self) -> dict:
+        counts = {status: 0 for status in (jobs.QUEUED, jobs.RUNNING, jobs.COMPLETED, jobs.FAILED)}
+        for item in self.items:
+            counts[item.status] += 1
+        return counts
+
+
+def _archive_member_name(name: str) -> str | None:
+    """Normalized relative path of an archive member, or None for entries to skip"""
+    name = posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+    parts = name.split("/")
+    if name in ("", ".") or ".." in parts or parts[0] == "__MACOSX" or parts[-1].startswith("."):
+        return None
+    return name
+
+
+def expand_archive(archive, dest_dir: str) -> list[tuple[str, str, str]]:
+    """Extract a ZIP (path or seekable file) into dest_dir as (member name, staged path, sha256) triples.
+
+    Member paths are never used on disk, and the declared sizes are checked
+    before anything is written so an archive bomb is rejected up front.
+    """
+    try:
+        archive = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise InvalidBatchError("Uploaded archive is not a valid ZIP file")
+    with archive:
+        members = [
+            (name, info)
+            for info in archive.infolist()
+            if not info.is_dir() and (name := _archive_member_name(info.filename)) is not None
+        ]
+        if not members:
+            raise InvalidBatchError("Archive contains no files")
+        if len(members) > BATCH_MAX_ITEMS:
+            raise InvalidBatchError(f"Archive contains more than {BATCH_MAX_ITEMS} files")
+        if sum(info.file_size for _, info in members) > BATCH_MAX_ARCHIVE_BYTES:
+            raise InvalidBatchError("Archive is too large when extracted")
+        staged = []
+        try:
+            for name, info in members:
+                path = os.path.join(dest_dir, f"{uuid.uuid4()}_{posixpath.basename(name)}")
+                staged.append((name, path, None))
+                with archive.open(info) as src, open(path, "wb") as dst:
+                    staged[-1] = (name, path, dedup.copy_and_hash(src, dst))
+        except Exception:
+            discard_staged(staged)
+            raise
+        return staged
+
+
+def discard_staged(staged: list[tuple]) -> None:
+    """Remove staged inputs, e.g. after a batch could not be created"""
+    for _, path, _ in staged:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+class _BatchRun:
+    """One batch in flight together with the callbacks that convert and record its items"""
+
+    def __init__(
+        self, job_queue: jobs.JobQueue, admission, batch: Batch, fn, args_for, on_item_success, on_item_finish,
+        on_complete,
+    ):
+        self.job_queue = job_queue
+        self.admission = admission
+        self.batch = batch
+        self.fn = fn
+        self.args_for = args_for
+        self.on_item_success = on_item_success
+        self.on_item_finish = on_item_finish
+        self.on_complete = on_complete
+
+    def start_next(self) -> None:
+        batch = self.batch
+        with batch._lock:
+            if not batch._pending:
+                return
+            item = batch._pending.popleft()
+            item.status = jobs.RUNNING
+        if self.admission is None:
+            self.run_item(item, None)
+            return
+        # The batch was accepted as a whole, so its items wait rather than being rejected
+        self.admission.admit(batch.user_id, lambda release: self.run_item(item, release), queue_limit=False)
+
+    def run_item(self, item: BatchItem, release) -> None:
+        try:
+            future = self.job_queue.run(self.fn, *self.args_for(item))
+        except Exception as e:
+            self.item_done(item, None, e, release)
+            return
+        future.add_done_callback(lambda future: self.item_done(item, future, release=release))
+
+    def item_done(self, item: BatchItem, future, error: Exception | None = None, release=None) -> None:
+        if release is not None:
+            release()
+        batch = self.batch
+        try:
+            if error is not None:
+                raise error
+            self.on_item_success(batch, item, future.result())
+            item.status = jobs.COMPLETED
+        except Exception as e:
+            item.status = jobs.FAILED
+            item.error = str(e) or e.__class__.__name__
+            print(f"Batch {batch.id} item {item.name} failed: {item.error}")
+        finally:
+            try:
+                self.on_item_finish(item)
+            except Exception as e:
+                print(f"Error finishing batch {batch.id} item {item.name}: {e}")
+        with batch._lock:
+            batch._remaining -= 1
+            last = batch._remaining == 0
+        if last:
+            self.finish()
+        else:
+            self.start_next()
+
+    def finish(self) -> None:
+        batch = self.batch
+        try:
+            self.on_complete(batch)
+        except Exception as e:
+            print(f"Error completing batch {batch.id}: {e}")
+            for item in batch.items:
+                if item.status == jobs.COMPLETED and item.media_file_id is None:
+                    item.status = jobs.FAILED
+                    item.error = "Could not save the converted file"
+        succeeded = any(item.status == jobs.COMPLETED for item in batch.items)
+        batch.status = jobs.COMPLETED if succeeded else jobs.FAILED
+        batch.finished_at = datetime.utcnow()
+
+
+class BatchQueue:
+    """Feeds the items of each batch to the worker pool, at most `concurrency` at a time.
+
+    With an admission controller each item also takes one of its slots while
+    converting, so batches share capacity with single conversions.
+    """
+
+    def __init__(self, job_queue: jobs.JobQueue, concurrency: int, admission=None):
+        self.job_queue = job_queue
+        self.admission = admission
+        self.concurrency = max(1, concurrency)
+        self._batches: dict[str, Batch] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        batch: Batch,
+        fn: Callable,
+        args_for: Callable[[BatchItem], tuple],
+        on_item_success: Callable[[Batch, BatchItem, object], None],
+        on_item_finish: Callable[[BatchItem], None],
+        on_complete: Callable[[Batch], None],
+    ) -> Batch:
+        """Convert every queued item with fn(*args_for(item)).
+
+        Items already marked completed (e.g. dedup hits) are not run.
+        on_item_success runs in the parent process with the worker's return
+        value; on_item_finish always follows it. on_complete runs once after
+        the last item, and inline here if there is nothing to run.
+        """
+        self._prune()
+        with self._lock:
+            self._batches[batch.id] = batch
+        run = _BatchRun(
+            self.job_queue, self.admission, batch, fn, args_for, on_item_success, on_item_finish, on_complete
+        )
+        with batch._lock:
+            batch._pending.extend(item for item in batch.items if item.status == jobs.QUEUED)
+            batch._remaining = len(batch._pending)
+        if batch._remaining == 0:
+            run.finish()
+            return batch
+        batch.status = jobs.RUNNING
+        for _ in range(self.concurrency):
+            run.start_next()
+        return batch
+
+    def get(self, batch_id: str) -> Batch | None:
+        return self._batches.get(batch_id)
+
+    def _prune(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(minutes=jobs.JOB_RETENTION_MINUTES)
+        with self._lock:
+            expired = [
+                batch_id
+                for batch_id, batch in self._batches.items()
+                if batch.finished_at is not None and batch.finished_at < cutoff
+            ]
+            for batch_id in expired:
+                del self._batches[batch_id]
+
+
+def new_batch(user_id: int) -> Batch:
+    return Batch(id=str(uuid.uuid4()), user_id=user_id)
+
+
+batch_queue = BatchQueue(jobs.job_queue, BATCH_CONCURRENCY, admission.video)
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models.models as models
+from services import extractor, storage
+
+# Bump when conversion output changes so old blobs stop matching
+CACHE_VERSION = "1"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def content_key(kind: str, input_digest: str, **params) -> str:
+    """Cache key for a conversion: the input hash plus everything that affects the output"""
+    payload = json.dumps(
+        {"v": CACHE_VERSION, "kind": kind, "input": input_digest, "params": params},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def copy_and_hash(src, dst) -> str:
+    """copyfileobj that also returns the SHA-256 of the bytes copied"""
+    digest = hashlib.sha256()
+    while True:
+        chunk = src.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        dst.write(chunk)
+    return digest.hexdigest()
+
+
+def _lookup_blob(db: Session, key: str) -> models.OutputBlob | None:
+    return db.query(models.OutputBlob).filter(models.OutputBlob.content_key == key).first()
+
+
+def _forget_blob(db: Session, blob: models.OutputBlob) -> None:
+    # The file vanished underneath us; forget the blob and convert again
+    db.delete(blob)
+    db.flush()
+
+
+def _claim_blob(db: Session, blob: models.OutputBlob) -> models.OutputBlob | None:
+    # Increment in SQL so concurrent requests cannot lose an update. No rows
+    # means the last owner released it between the query and now.
+    claimed = db.query(models.OutputBlob).filter(
+        models.OutputBlob.id == blob.id,
+        models.OutputBlob.ref_count > 0,
+    ).update({models.OutputBlob.ref_count: models.OutputBlob.ref_count + 1}, synchronize_session=False)
+    return blob if claimed else None
+
+
+def find_blob(db: Session, key: str) -> models.OutputBlob | None:
+    """Return the live blob for key and take a reference to it, or None on a miss"""
+    blob = _lookup_blob(db, key)
+    if blob is None:
+        return None
+    if not storage.outputs.exists(blob.filename):
+        _forget_blob(db, blob)
+        return None
+    return _claim_blob(db, blob)
+
+
+async def find_blob_async(db: AsyncSession, key: str) -> models.OutputBlob | None:
+    """find_blob for async routes: the storage check runs in a thread, not on the event loop.
+
+    With S3 storage it is a network round trip, which run_sync would make on
+    the event-loop thread.
+    """
+    blob = await db.run_sync(_lookup_blob, key)
+    if blob is None:
+        return None
+    if not await asyncio.to_thread(storage.outputs.exists, blob.filename):
+        await db.run_sync(_forget_blob, blob)
+        return None
+    return await db.run_sync(_claim_blob, blob)
+
+
+def _insert_blob(
+    db: Session, key: str, filename: str, file_size: int, waveform: bytes | None
+) -> models.OutputBlob | None:
+    """Add a blob holding one reference; None, with the session rolled back, if key is taken"""
+    blob = models.OutputBlob(content_key=key, filename=filename, file_size=file_size, ref_count=1, waveform=waveform)
+    db.add(blob)
+    try:
+        db.flush()
+        return blob
+    except IntegrityError:
+        db.rollback()
+        return None
+
+
+def _take_over_key(
+    db: Session, key: str, filename: str, file_size: int, waveform: bytes | None
+) -> models.OutputBlob:
+    # Lost a race with the final release; take over the key with our file
+    db.query(models.OutputBlob).filter(models.OutputBlob.content_key == key).delete()
+    blob = models.OutputBlob(content_key=key, filename=filename, file_size=file_size, ref_count=1, waveform=waveform)
+    db.add(blob)
+    db.flush()
+    return blob
+
+
+def register_blob(
+    db: Session, key: str, filename: str, file_size: int, waveform: bytes | None = None
+) -> models.OutputBlob:
+    """Record a freshly converted output under key, holding one reference.
+
+    If a concurrent conversion of the same input registered first, its blob is
+    claimed instead and our own copy of the output is deleted. That path rolls
+    the session back, so call this before adding the MediaFile row.
+    """
+    blob = _insert_blob(db, key, filename, file_size, waveform)
+    if blob is not None:
+        return blob
+    existing = find_blob(db, key)
+    if existing is None:
+        return _take_over_key(db, key, filename, file_size, waveform)
+    if existing.filename != filename:
+        storage.outputs.delete(filename)
+    return existing
+
+
+async def register_blob_async(
+    db: AsyncSession, key: str, filename: str, file_size: int, waveform: bytes | None = None
+) -> models.OutputBlob:
+    """register_blob for async routes, with the storage calls in a thread"""
+    blob = await db.run_sync(_insert_blob, key, filename, file_size, waveform)
+    if blob is not None:
+        return blob
+    existing = await find_blob_async(db, key)
+    if existing is None:
+        return await db.run_sync(_take_over_key, key, filename, file_size, waveform)
+    if existing.filename != filename:
+        await asyncio.to_thread(storage.outputs.delete, filename)
+    return existing
+
+
+def link_output(
+    db: Session,
+    blob: models.OutputBlob,
+    key: str,
+    original_name: str | None,
+    user_id: int,
+    profile: str | None = None,
+) -> models.MediaFile:
+    """Create and commit a video_to_audio MediaFile row for a (possibly shared) blob"""
+    media_file = models.MediaFile(
+        filename=blob.filename,
+        original_name=original_name,
+        file_type="video_to_audio",
+        file_size=blob.file_size,
+        format=extractor.output_format(blob.filename),
+        profile=profile,
+        user_id=user_id,
+        content_key=key
+    )
+    db.add(media_file)
+    db.commit()
+    return media_file
+
+
+def unlink_outputs(db: Session, media_file_ids: list[int]) -> list[str]:
+    """Delete rows made by link_output for a request that was turned away, and commit.
+
+    Returns the filenames nothing references any more, to delete from storage.
+    """
+    orphaned = []
+    for media_file in db.query(models.MediaFile).filter(models.MediaFile.id.in_(media_file_ids)).all():
+        filename = release(db, media_file)
+        if filename is not None:
+            orphaned.append(filename)
+        db.delete(media_file)
+    db.commit()
+    return orphaned
+
+
+def release(db: Session, media_file: models.MediaFile) -> str | None:
+    """Drop media_file's reference to its output.
+
+    Returns the filename to delete from storage once nothing references it,
+    or None while other MediaFile rows still share the blob.
+    """
+    if media_file.content_key is None:
+        return media_file.filename
+    # Match on the filename too: if the blob was dropped and the key re-registered
+    # with a new file, stale rows must not release the new blob
+    owned_blob = db.query(models.OutputBlob).filter(
+        models.OutputBlob.content_key == media_file.content_key,
+        models.OutputBlob.filename == media_file.filename,
+    )
+    owned_blob.update({models.OutputBlob.ref_count: models.OutputBlob.ref_count - 1}, synchronize_session=False)
+    blob = owned_blob.populate_existing().first()
+    if blob is None:
+        return media_file.filename
+    if blob.ref_count > 0:
+        return None
+    db.delete(blob)
+    return blob.filename
@@ -0,0 +1,109 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from services.storage import Storage, StoredObject
+
+# Outputs never change once written, so clients may reuse them for this long
+DOWNLOAD_MAX_AGE = int(os.getenv("DOWNLOAD_MAX_AGE", "86400"))
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    if "*" in candidates:
+        return True
+    if weak:
+        candidates = [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+    return etag in candidates
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single-range Range header into inclusive (start, end).
+
+    Returns None when the header should be ignored (malformed or multi-range)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def file_response(
+    request: Request, store: Storage, stored: StoredObject, media_type: str, filename: str
+) -> Response:
+    """Serve a stored file with ETag/Last-Modified validators and single-range support"""
+    etag = stored.etag
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stored.mtime, usegmt=True),
+        "Cache-Control": f"private, max-age={DOWNLOAD_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag, weak=True):
+            return Response(status_code=304, headers=headers)
+    elif "if-modified-since" in request.headers:
+        if _not_modified_since(request.headers["if-modified-since"], stored.mtime):
+            return Response(status_code=304, headers=headers)
+
+    quoted = quote(filename)
+    if quoted == filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    else:
+        headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quoted}"
+    size = stored.size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header is not None:
+        if_range = request.headers.get("if-range")
+        # A stale If-Range means the client's partial copy is outdated: send everything
+        if if_range is None or if_range.strip() == etag or (
+            not if_range.strip().startswith(('"', "W/")) and _not_modified_since(if_range, stored.mtime)
+        ):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(store.iter_range(stored.name), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(
+        store.iter_range(stored.name, start, length), status_code=206, media_type=media_type, headers=headers
+    )
@@ -0,0 +1,508 @@
+import asyncio
+import math
+import os
+import re
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field, fields
+
+from services import progress
+
+# Audio codecs that can be demuxed as-is, mapped to the container they are written to
+COPY_CONTAINERS = {
+    "mp3": ".mp3",
+    "aac": ".m4a",
+}
+# Comma-separated subset of COPY_CONTAINERS allowed to skip re-encoding
+STREAM_COPY_CODECS = [
+    codec.strip()
+    for codec in os.getenv("STREAM_COPY_CODECS", ",".join(COPY_CONTAINERS)).split(",")
+    if codec.strip() in COPY_CONTAINERS
+]
+TRANSCODE_BITRATE = os.getenv("TRANSCODE_BITRATE", "192k")
+# Stored format of an output by its extension
+OUTPUT_FORMATS = {".mp3": "mp3", ".m4a": "aac", ".opus": "opus"}
+# Sample rates a clip may be resampled to; every encoder here accepts these
+SAMPLE_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+# Opus only encodes at these rates
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+_INPUT_RE = re.compile(r"Input #0, ([^ ]+), from")
+_AUDIO_STREAM_RE = re.compile(r"Stream #\d+:\d+(?:\[\w+\])?(?:\([^)]*\))?: Audio: (\w+)")
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+_ffmpeg_exe: str | None = None
+
+
+class InvalidInputError(ValueError):
+    """Raised when an upload cannot be converted"""
+
+
+class NoAudioTrackError(InvalidInputError):
+    """Raised when an uploaded video does not carry an audio stream"""
+
+
+class UnknownProfileError(InvalidInputError):
+    """Raised for an output profile name that is not defined"""
+
+
+class ExtractionError(RuntimeError):
+    """Raised when ffmpeg fails to produce an output"""
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    name: str
+    encoder: str
+    bitrate: str
+    extension: str
+
+    @property
+    def format(self) -> str:
+        return OUTPUT_FORMATS[self.extension]
+
+
+# Named renditions a client can request; several are encoded from one decode
+OUTPUT_PROFILES = {
+    profile.name: profile
+    for profile in (
+        OutputProfile("opus-32k", "libopus", "32k", ".opus"),
+        OutputProfile("aac-128k", "aac", "128k", ".m4a"),
+        OutputProfile("mp3-192k", "libmp3lame", "192k", ".mp3"),
+    )
+}
+
+
+@dataclass(frozen=True)
+class ClipOptions:
+    """Which part of which audio track to extract, and how to downmix it.
+
+    The defaults take the whole first audio track as it is. start and end are
+    seconds into the input; the clip is cut by seeking, so its cost depends on
+    its own length rather than the input's.
+    """
+    start: float | None = None
+    end: float | None = None
+    stream: int = 0  # Index among the input's audio streams
+    channels: int | None = None
+    sample_rate: int | None = None
+
+    def __post_init__(self):
+        for value in (self.start, self.end):
+            if value is not None and not math.isfinite(value):
+                raise InvalidInputError("start and end must be finite numbers of seconds")
+        # Normalized so that equal clips get equal dedup keys
+        start = round(float(self.start), 3) if self.start else None
+        end = round(float(self.end), 3) if self.end is not None else None
+        object.__setattr__(self, "start", start)
+        object.__setattr__(self, "end", end)
+        if start is not None and start < 0:
+            raise InvalidInputError("start must not be negative")
+        if end is not None and end <= (start or 0):
+            raise InvalidInputError("end must be after start")
+        if self.stream < 0:
+            raise InvalidInputError("Audio stream index must not be negative")
+        if self.channels not in (None, 1, 2):
+            raise InvalidInputError("channels must be 1 (mono) or 2 (stereo)")
+        if self.sample_rate is not None and self.sample_rate not in SAMPLE_RATES:
+            raise InvalidInputError(f"sample_rate must be one of {', '.join(map(str, SAMPLE_RATES))}")
+
+    @property
+    def resamples(self) -> bool:
+        """Whether the audio has to be decoded and re-encoded, ruling out a stream copy"""
+        return self.channels is not None or self.sample_rate is not None
+
+    def params(self) -> dict:
+        """Options that differ from the defaults, e.g. for content keys"""
+        return {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) != f.default}
+
+    def length(self, duration: float | None) -> float | None:
+        """Seconds of media in the clip, given the input's duration"""
+        end = duration if self.end is None else min(self.end, duration or self.end)
+        return max(0.0, end - (self.start or 0)) if end is not None else None
+
+    def check_profiles(self, profiles: list["OutputProfile"]) -> None:
+        for profile in profiles:
+            if profile.encoder == "libopus" and self.sample_rate and self.sample_rate not in OPUS_SAMPLE_RATES:
+                raise InvalidInputError(
+                    f"{profile.name} needs a sample_rate of {', '.join(map(str, OPUS_SAMPLE_RATES))}"
+                )
+
+    def input_args(self) -> list[str]:
+        # Before -i, ffmpeg seeks with the container's index instead of decoding up to start
+        return ["-ss", f"{self.start:.3f}"] if self.start else []
+
+    def output_args(self, copy: bool = False) -> list[str]:
+        args = ["-map", f"0:a:{self.stream}"]
+        if copy and self.start:
+            # A stream copy starts from the keyframe before start; drop the packets ahead of it
+            args += ["-ss", "0"]
+        if self.end is not None:
+            # Input seeking resets timestamps to zero, so cut by length rather than -to
+            args += ["-t", f"{self.end - (self.start or 0):.3f}"]
+        if self.channels is not None:
+            args += ["-ac", str(self.channels)]
+        if self.sample_rate is not None:
+            args += ["-ar", str(self.sample_rate)]
+        return args
+
+
+@dataclass
+class ProbeResult:
+    container: str | None
+    audio_codec: str | None
+    duration: float | None
+    # Codec of every audio stream, in order; audio_codec is the first
+    audio_codecs: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ExtractionResult:
+    filename: str
+    file_size: int
+    mode: str  # "copy", "transcode" or "renditions"
+    codec: str | None
+    duration: float | None
+    seconds: float
+    profile: str | None = None
+    # Wall time per stage ("probe", "extract"), measured where the work ran
+    stages: dict[str, float] = field(default_factory=dict)
+    waveform: bytes | None = None  # Encoded preview peaks, see services/waveform.py
+
+
+def ffmpeg_exe() -> str:
+    """Path to the ffmpeg binary bundled with imageio-ffmpeg"""
+    global _ffmpeg_exe
+    if _ffmpeg_exe is None:
+        import imageio_ffmpeg
+        _ffmpeg_exe = imageio_ffmpeg.get_ffmpeg_exe()
+    return _ffmpeg_exe
+
+
+def warm_up() -> None:
+    """Locate ffmpeg and run it once, so the first conversion does not pay for either"""
+    subprocess.run([ffmpeg_exe(), "-version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+
+def output_format(filename: str) -> str | None:
+    return OUTPUT_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def get_profiles(names: list[str]) -> list[OutputProfile]:
+    """Resolve profile names in request order, dropping duplicates"""
+    profiles = []
+    for name in dict.fromkeys(names):
+        profile = OUTPUT_PROFILES.get(name)
+        if profile is None:
+            raise UnknownProfileError(f"Unknown output profile: {name}")
+        profiles.append(profile)
+    return profiles
+
+
+def parse_probe(output: str) -> ProbeResult:
+    """Read the container, audio codecs and duration from ffmpeg's input banner"""
+    input_match = _INPUT_RE.search(output)
+    audio_codecs = _AUDIO_STREAM_RE.findall(output)
+    duration_match = _DURATION_RE.search(output)
+    duration = None
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return ProbeResult(
+        container=input_match.group(1) if input_match else None,
+        audio_codec=audio_codecs[0] if audio_codecs else None,
+        duration=duration,
+        audio_codecs=audio_codecs,
+    )
+
+
+def probe(input_path: str) -> ProbeResult:
+    # Only ffmpeg is bundled (no ffprobe), so read the banner it prints for `-i`
+    proc = subprocess.run(
+        [ffmpeg_exe(), "-hide_banner", "-i", input_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    return parse_probe(proc.stderr.decode("utf-8", errors="replace"))
+
+
+def _run_ffmpeg(args: list[str], duration: float | None = None) -> None:
+    command = [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y"]
+    if not progress.tracking():
+        proc = subprocess.run([*command, *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        returncode, stderr = proc.returncode, proc.stderr
+    else:
+        # Errors go to a file so that only the progress pipe has to be drained
+        with tempfile.TemporaryFile() as errors:
+            proc = subprocess.Popen(
+                [*command, "-progress", "pipe:1", "-nostats", *args],
+                stdout=subprocess.PIPE,
+                stderr=errors,
+            )
+            with proc.stdout:
+                for line in proc.stdout:
+                    position = progress.parse_out_time(line)
+                    if position is not None:
+                        progress.report(position, duration)
+            returncode = proc.wait()
+            errors.seek(0)
+            stderr = errors.read()
+    if returncode != 0:
+        raise ExtractionError(stderr.decode("utf-8", errors="replace").strip() or "ffmpeg failed")
+
+
+def _remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _output_args(mode: str, output_path: str, options: ClipOptions) -> list[str]:
+    codec_args = ["-c:a", "copy"] if mode == "copy" else ["-c:a", "libmp3lame", "-b:a", TRANSCODE_BITRATE]
+    return ["-vn", *options.output_args(copy=mode == "copy"), *codec_args, output_path]
+
+
+def _check_input(info: ProbeResult, options: ClipOptions) -> None:
+    if info.container is None:
+        raise InvalidInputError("Could not read the uploaded video")
+    if info.audio_codec is None:
+        raise NoAudioTrackError("Video has no audio track")
+    if options.stream >= len(info.audio_codecs):
+        raise InvalidInputError(
+            f"Audio stream {options.stream} does not exist; the video has {len(info.audio_codecs)}"
+        )
+    if options.start is not None and info.duration is not None and options.start >= info.duration:
+        raise InvalidInputError(f"start is past the end of the video ({info.duration:.1f}s)")
+
+
+def _plan(info: ProbeResult, output_stem: str, options: ClipOptions) -> tuple[str, str]:
+    """Pick the extraction mode and output path for a probed input"""
+    _check_input(info, options)
+    codec = info.audio_codecs[options.stream]
+    if codec in STREAM_COPY_CODECS and not options.resamples:
+        return "copy", output_stem + COPY_CONTAINERS[codec]
+    return "transcode", output_stem + ".mp3"
+
+
+def extract_audio(input_path: str, output_stem: str, options: ClipOptions | None = None) -> ExtractionResult:
+    """Extract the audio track of a video into output_stem plus a codec-dependent extension.
+
+    MP3 and AAC tracks are stream-copied without decoding; anything else, a
+    downmix, or a copy that ffmpeg rejects, is transcoded to MP3.
+    """
+    options = options or ClipOptions()
+    start = time.perf_counter()
+    info = probe(input_path)
+    probed = time.perf_counter()
+    mode, output_path = _plan(info, output_stem, options)
+    input_args = [*options.input_args(), "-i", input_path]
+
+    if mode == "copy":
+        try:
+            _run_ffmpeg([*input_args, *_output_args("copy", output_path, options)], options.length(info.duration))
+            return _result(output_path, "copy", info, options, start, probed)
+        except ExtractionError as e:
+            print(f"Stream copy of {info.audio_codecs[options.stream]} failed, transcoding instead: {e}")
+            _remove(output_path)
+
+    output_path = output_stem + ".mp3"
+    try:
+        _run_ffmpeg([*input_args, *_output_args("transcode", output_path, options)], options.length(info.duration))
+    except Exception:
+        _remove(output_path)
+        raise
+    return _result(output_path, "transcode", info, options, start, probed)
+
+
+def _result(
+    output_path: str,
+    mode: str,
+    info: ProbeResult,
+    options: ClipOptions,
+    start: float,
+    probed: float,
+    profile: str | None = None,
+) -> ExtractionResult:
+    end = time.perf_counter()
+    return ExtractionResult(
+        filename=os.path.basename(output_path),
+        file_size=os.path.getsize(output_path),
+        mode=mode,
+        codec=info.audio_codecs[options.stream],
+        duration=options.length(info.duration),
+        seconds=end - start,
+        profile=profile,
+        stages={"probe": probed - start, "extract": end - probed},
+    )
+
+
+def extract_renditions(
+    input_path: str, output_stem: str, profile_names: list[str], options: ClipOptions | None = None
+) -> list[ExtractionResult]:
+    """Encode the audio track once per output profile in a single ffmpeg run.
+
+    ffmpeg demuxes and decodes the input once and feeds every encoder from the
+    same decoded frames, so extra renditions only cost their encode. Outputs
+    are named output_stem-<profile><extension>.
+    """
+    options = options or ClipOptions()
+    start = time.perf_counter()
+    profiles = get_profiles(profile_names)
+    options.check_profiles(profiles)
+    info = probe(input_path)
+    probed = time.perf_counter()
+    _check_input(info, options)
+
+    args = [*options.input_args(), "-i", input_path]
+    output_paths = []
+    for profile in profiles:
+        output_path = f"{output_stem}-{profile.name}{profile.extension}"
+        args += ["-vn", *options.output_args(), "-c:a", profile.encoder, "-b:a", profile.bitrate, output_path]
+        output_paths.append(output_path)
+    try:
+        _run_ffmpeg(args, options.length(info.duration))
+    except Exception:
+        for output_path in output_paths:
+            _remove(output_path)
+        raise
+    # Every result carries the wall time of the shared run
+    return [
+        _result(output_path, "renditions", info, options, start, probed, profile.name)
+        for profile, output_path in zip(profiles, output_paths)
+    ]
+
+
+# --- Streaming ---
+# Uploads are piped into ffmpeg's stdin as they arrive instead of being staged
+# on disk. Only containers that must be read out of order need a temp file.
+
+# Bytes buffered before deciding how to handle a stream
+STREAM_HEAD_BYTES = int(os.getenv("STREAM_HEAD_BYTES", str(1024 * 1024)))
+
+_ISO_BMFF_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot"}
+
+
+def needs_seek(head: bytes) -> bool:
+    """Whether a container cannot be demuxed from a pipe.
+
+    MP4/MOV files are only readable sequentially when the moov box precedes
+    mdat; otherwise ffmpeg has to seek to the end of the file. If the head ends
+    before either box shows up we cannot tell, so assume seeking is needed.
+    """
+    if len(head) < 8 or head[4:8] not in _ISO_BMFF_BOXES:
+        return False
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box = struct.unpack(">I4s", head[offset:offset + 8])
+        if box == b"moov":
+            return False
+        if box == b"mdat":
+            return True
+        if size == 1:
+            if offset + 16 > len(head):
+                break
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        elif size == 0:
+            break
+        if size < 8:
+            break
+        offset += size
+    return True
+
+
+async def probe_bytes(head: bytes) -> ProbeResult:
+    """Probe a stream from its first bytes"""
+    proc = await asyncio.create_subprocess_exec(
+        ffmpeg_exe(), "-hide_banner", "-i", "pipe:0",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # ffmpeg may exit before consuming everything; a broken pipe is expected
+    try:
+        _, stderr = await proc.communicate(head)
+    except (BrokenPipeError, ConnectionResetError):
+        stderr = await proc.stderr.read()
+        await proc.wait()
+    return parse_probe(stderr.decode("utf-8", errors="replace"))
+
+
+async def extract_audio_stream(head: bytes, chunks, output_stem: str) -> ExtractionResult:
+    """Extract audio from a streamed upload: head, then the async iterable chunks.
+
+    The stream cannot be replayed, so unlike extract_audio a failed stream copy
+    is not retried as a transcode.
+    """
+    start = time.perf_counter()
+    info = await probe_bytes(head)
+    probed = time.perf_counter()
+    options = ClipOptions()
+    mode, output_path = _plan(info, output_stem, options)
+
+    proc = await asyncio.create_subprocess_exec(
+        ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+        "-i", "pipe:0", *_output_args(mode, output_path, options),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # Drain stderr concurrently so ffmpeg never blocks on a full pipe
+    stderr_task = asyncio.create_task(proc.stderr.read())
+    try:
+        try:
+            proc.stdin.write(head)
+            await proc.stdin.drain()
+            async for chunk in chunks:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg exited early; its exit status explains why
+            pass
+        returncode = await proc.wait()
+        stderr = await stderr_task
+        if returncode != 0:
+            raise ExtractionError(stderr.decode("utf-8", errors="replace").strip() or "ffmpeg failed")
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        stderr_task.cancel()
+        _remove(output_path)
+        raise
+    return _result(output_path, mode, info, options, start, probed)
+
+
+# --- Timing ---
+# Aggregated in the API process from the results workers send back
+
+_stats_lock = threading.Lock()
+_stats = {
+    mode: {"count": 0, "seconds": 0.0, "media_seconds": 0.0}
+    for mode in ("copy", "transcode", "renditions")
+}
+
+
+def record_timing(result: ExtractionResult) -> None:
+    """Count one ffmpeg run; for renditions pass only one of the results"""
+    with _stats_lock:
+        entry = _stats[result.mode]
+        entry["count"] += 1
+        entry["seconds"] += result.seconds
+        entry["media_seconds"] += result.duration or 0.0
+    print(
+        f"Extracted {result.codec} audio via {result.mode} in {result.seconds:.2f}s "
+        f"({result.duration or 0:.1f}s of media)"
+    )
+
+
+def timing_stats() -> dict:
+    """Per-path totals plus mean wall time and speed relative to real time"""
+    with _stats_lock:
+        stats = {mode: dict(entry) for mode, entry in _stats.items()}
+    for entry in stats.values():
+        entry["mean_seconds"] = entry["seconds"] / entry["count"] if entry["count"] else None
+        entry["realtime_factor"] = entry["media_seconds"] / entry["seconds"] if entry["seconds"] else None
+    return stats
@@ -0,0 +1,271 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable
+
+from services import progress
+
+# Where video conversions run: "local" (this process's pool) or "database" (a table
+# consumed by standalone workers, see worker.py)
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+# Number of encoder processes; defaults to one per core
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", os.cpu_count() or 1))
+# Finished jobs are forgotten after this long
+JOB_RETENTION_MINUTES = int(os.getenv("JOB_RETENTION_MINUTES", "60"))
+# Idle /jobs/{id}/events streams send a comment this often so proxies keep them open
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("JOB_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: int
+    kind: str
+    original_name: str | None = None
+    input_path: str | None = None
+    output_filename: str | None = None
+    content_key: str | None = None
+    status: str = QUEUED
+    error: str | None = None
+    media_file_ids: list[int] = field(default_factory=list)  # One per output, e.g. per rendition
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    future: Future | None = field(default=None, repr=False)
+    # Progress reported by ffmpeg while the job runs
+    percent: float | None = None
+    eta_seconds: float | None = None
+    # Bumped on every progress report and when the job finishes
+    version: int = 0
+
+    @property
+    def media_file_id(self) -> int | None:
+        return self.media_file_ids[0] if self.media_file_ids else None
+
+    @property
+    def current_status(self) -> str:
+        # Still running while on_success records a finished future's result
+        if self.status == QUEUED and self.future is not None and (self.future.running() or self.future.done()):
+            return RUNNING
+        return self.status
+
+    def record_progress(self, position: float, duration: float | None, elapsed: float) -> None:
+        percent, eta_seconds = progress.estimate(position, duration, elapsed)
+        if percent is not None:
+            self.percent = percent
+        if eta_seconds is not None:
+            self.eta_seconds = eta_seconds
+        self.version += 1
+
+
+class JobQueue:
+    """Runs conversions on a bounded process pool and tracks their state in memory"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor: ProcessPoolExecutor | None = None
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._progress = None
+        # Event loops and events of clients waiting for a job to change, by job id
+        self._waiters: dict[str, set[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the API process is multi-threaded
+                context = multiprocessing.get_context("spawn")
+                self._progress = context.Queue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=progress.init_worker,
+                    initargs=(self._progress,),
+                )
+                threading.Thread(target=self._listen, args=(self._progress,), name="job-progress", daemon=True).start()
+            return self._executor
+
+    def _listen(self, queue) -> None:
+        """Apply progress reports sent by the workers until the pool shuts down"""
+        while True:
+            message = queue.get()
+            if message is None:
+                return
+            job_id, position, duration, elapsed = message
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished_at is None:
+                job.record_progress(position, duration, elapsed)
+                self._notify(job)
+
+    def _notify(self, job: Job) -> None:
+        with self._lock:
+            waiters = list(self._waiters.get(job.id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait_for_change(self, job: Job, version: int, timeout: float) -> bool:
+        """Wait until job.version moves past version; False if timeout passed first"""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.setdefault(job.id, set()).add(waiter)
+        try:
+            if job.version != version:
+                return True
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(job.id)
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[job.id]
+
+    def submit(
+        self,
+        job: Job,
+        fn: Callable,
+        *args,
+        on_success: Callable[[Job, object], int | list[int]],
+        on_finish: Callable[[Job], None] | None = None,
+        admission=None,
+        queue_limit: bool = True,
+    ) -> Job:
+        """Queue fn(*args) on the pool.
+
+        on_success runs in the parent process with the worker's return value and
+        must return the id (or ids) of the MediaFile rows it recorded. on_finish always runs
+        afterwards, e.g. to remove staged input files.
+
+        With an admission controller the job only reaches the pool once the
+        controller gives it a slot, and holds that slot until it finishes. If
+        the controller rejects it, AdmissionRejected propagates and the job is
+        not tracked; queue_limit=False always queues it (see AdmissionController.admit).
+        """
+        self._prune()
+        with self._lock:
+            self._jobs[job.id] = job
+        if admission is None:
+            self._start(job, fn, args, on_success, on_finish, None)
+            return job
+        try:
+            admission.admit(
+                job.user_id,
+                lambda release: self._start(job, fn, args, on_success, on_finish, release),
+                queue_limit=queue_limit,
+            )
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def _start(self, job: Job, fn: Callable, args: tuple, on_success, on_finish, release) -> None:
+        try:
+            job.future = self.run(progress.run_job, job.id, fn, *args)
+        except Exception as e:
+            job.future = Future()
+            job.future.set_exception(e)
+        job.future.add_done_callback(lambda future: self._complete(job, future, on_success, on_finish, release))
+
+    def run(self, fn: Callable, *args) -> Future:
+        """Run fn(*args) on the worker pool without tracking it as a Job"""
+        try:
+            return self._get_executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool and retry once
+            self.shutdown()
+            return self._get_executor().submit(fn, *args)
+
+    def warm_up(self) -> None:
+        """Start a worker process now rather than on the first conversion"""
+        self.run(os.getpid).result()
+
+    def record_completed(self, job: Job, media_file_ids: int | list[int]) -> Job:
+        """Track a job that was satisfied without running, e.g. from the dedup cache"""
+        job.status = COMPLETED
+        job.media_file_ids = _as_list(media_file_ids)
+        job.percent, job.eta_seconds = 100.0, 0.0
+        job.finished_at = datetime.utcnow()
+        self._prune()
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def _complete(self, job: Job, future: Future, on_success, on_finish, release=None) -> None:
+        try:
+            result = future.result()
+            job.media_file_ids = _as_list(on_success(job, result))
+            job.status = COMPLETED
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e) or e.__class__.__name__
+            print(f"Job {job.id} failed: {job.error}")
+        finally:
+            if on_finish is not None:
+                try:
+                    on_finish(job)
+                except Exception as e:
+                    print(f"Error finishing job {job.id}: {e}")
+            if release is not None:
+                release()
+            if job.status == COMPLETED:
+                job.percent, job.eta_seconds = 100.0, 0.0
+            job.finished_at = datetime.utcnow()
+            job.version += 1
+            self._notify(job)
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def for_user(self, user_id: int) -> list[Job]:
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.user_id == user_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def pending(self) -> int:
+        """Number of jobs that are queued or running"""
+        return sum(1 for job in list(self._jobs.values()) if job.status == QUEUED)
+
+    def _prune(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(minutes=JOB_RETENTION_MINUTES)
+        with self._lock:
+            expired = [
+                job_id
+                for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            queue, self._progress = self._progress, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if queue is not None:
+            queue.put(None)  # Stops the listener thread
+
+
+def _as_list(media_file_ids: int | list[int]) -> list[int]:
+    return list(media_file_ids) if isinstance(media_file_ids, (list, tuple)) else [media_file_ids]
+
+
+def new_job(user_id: int, kind: str, original_name: str | None = None) -> Job:
+    return Job(id=str(uuid.uuid4()), user_id=user_id, kind=kind, original_name=original_name)
+
+
+job_queue = JobQueue(CONVERSION_WORKERS)
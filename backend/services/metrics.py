@@ -0,0 +1,238 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+from databases.database import async_engine, engine, pool_stats
+from services import admission, extractor, jobs, sweeper, tts
+from services.auth_cache import token_cache
+
+PREFIX = "mediaconverter"
+
+# Conversions take from milliseconds (dedup hits) to minutes (long transcodes)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    f"{PREFIX}_http_request_duration_seconds",
+    "HTTP request latency until the response body is sent, by route template",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    f"{PREFIX}_conversion_stage_seconds",
+    "Time spent in each stage of a conversion",
+    ["kind", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+CONVERSION_BYTES = Counter(
+    f"{PREFIX}_conversion_bytes",
+    "Bytes received as conversion input and written as output",
+    ["kind", "direction"],
+)
+AUTH_SECONDS = Histogram(
+    f"{PREFIX}_auth_duration_seconds",
+    "Bearer token authentication latency by outcome",
+    ["result"],
+    buckets=QUERY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    f"{PREFIX}_db_query_duration_seconds",
+    "Database statement latency by engine and statement type",
+    ["engine", "operation"],
+    buckets=QUERY_BUCKETS,
+)
+DOWNLOADS = Counter(f"{PREFIX}_downloads", "Download responses by status code", ["status"])
+DOWNLOAD_BYTES = Counter(f"{PREFIX}_download_bytes", "Bytes of stored files sent to clients")
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+@contextmanager
+def stage(kind: str, name: str):
+    """Time a block as one conversion stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(kind, name).observe(time.perf_counter() - start)
+
+
+def observe_stages(kind: str, stages: dict[str, float]) -> None:
+    """Record stage timings measured elsewhere, e.g. in a worker process"""
+    for name, seconds in stages.items():
+        STAGE_SECONDS.labels(kind, name).observe(seconds)
+
+
+def count_bytes(kind: str, direction: str, size: int | None) -> None:
+    """Add size to the conversion input or output byte counter"""
+    if size:
+        CONVERSION_BYTES.labels(kind, direction).inc(size)
+
+
+async def _count_sent(chunks):
+    async for chunk in chunks:
+        DOWNLOAD_BYTES.inc(len(chunk))
+        yield chunk
+
+
+def count_download(response):
+    """Count a download response by status, and its body bytes as they are sent"""
+    DOWNLOADS.labels(str(response.status_code)).inc()
+    if hasattr(response, "body_iterator"):
+        response.body_iterator = _count_sent(response.body_iterator)
+    return response
+
+
+def time_queries(bind, name: str) -> None:
+    """Observe every statement run on bind in DB_QUERY_SECONDS"""
+
+    @event.listens_for(bind, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(bind, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is None:
+            return
+        operation = statement.lstrip()[:6].upper()
+        if operation not in _OPERATIONS:
+            operation = "OTHER"
+        DB_QUERY_SECONDS.labels(name, operation).observe(time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request.
+
+    Requests are labelled by route template (/download/{filename}) rather
+    than path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+class StatsCollector:
+    """Exports the counters the services already keep, read only at scrape time"""
+
+    def collect(self):
+        pending = GaugeMetricFamily(f"{PREFIX}_jobs_pending", "Conversion jobs queued or running")
+        pending.add_metric([], jobs.job_queue.pending())
+        yield pending
+
+        admission_gauges = {
+            key: GaugeMetricFamily(f"{PREFIX}_admission_{key}", help_text, labels=["kind"])
+            for key, help_text in (
+                ("active", "Conversions holding an admission slot"),
+                ("queued", "Conversions waiting for an admission slot"),
+            )
+        }
+        rejected = CounterMetricFamily(
+            f"{PREFIX}_admission_rejected", "Conversions turned away by admission control", labels=["kind", "reason"]
+        )
+        for controller in (admission.video, admission.text):
+            stats = controller.stats()
+            for key, gauge in admission_gauges.items():
+                gauge.add_metric([controller.name], stats[key])
+            for reason, count in stats["rejected"].items():
+                rejected.add_metric([controller.name, reason], count)
+        yield from admission_gauges.values()
+        yield rejected
+
+        extraction_runs = CounterMetricFamily(
+            f"{PREFIX}_extractions", "Completed ffmpeg extraction runs by mode", labels=["mode"]
+        )
+        extraction_seconds = CounterMetricFamily(
+            f"{PREFIX}_extraction_seconds", "Wall time of ffmpeg extraction runs by mode", labels=["mode"]
+        )
+        for mode, entry in extractor.timing_stats().items():
+            extraction_runs.add_metric([mode], entry["count"])
+            extraction_seconds.add_metric([mode], entry["seconds"])
+        yield extraction_runs
+        yield extraction_seconds
+
+        pool_gauges = {
+            key: GaugeMetricFamily(f"{PREFIX}_db_pool_{key}", help_text, labels=["pool"])
+            for key, help_text in (
+                ("size", "Connections the pool keeps open"),
+                ("checked_out", "Connections currently in use"),
+                ("overflow", "Connections opened beyond the pool size (negative while below it)"),
+            )
+        }
+        checkouts = CounterMetricFamily(f"{PREFIX}_db_pool_checkouts", "Connection checkouts", labels=["pool"])
+        timeouts = CounterMetricFamily(
+            f"{PREFIX}_db_pool_timeouts", "Checkouts that gave up waiting for a connection", labels=["pool"]
+        )
+        max_wait = GaugeMetricFamily(
+            f"{PREFIX}_db_pool_max_wait_seconds", "Longest wait for a connection since startup", labels=["pool"]
+        )
+        for pool, stats in pool_stats().items():
+            for key, gauge in pool_gauges.items():
+                if key in stats:
+                    gauge.add_metric([pool], stats[key])
+            checkouts.add_metric([pool], stats["checkouts"])
+            timeouts.add_metric([pool], stats["timeouts"])
+            max_wait.add_metric([pool], stats["max_wait_seconds"])
+        yield from pool_gauges.values()
+        yield checkouts
+        yield timeouts
+        yield max_wait
+
+        sweep = sweeper.sweeper.stats.snapshot()
+        for key, help_text in (
+            ("runs", "Retention sweeper passes"),
+            ("rows_deleted", "Expired media_files rows deleted by the sweeper"),
+            ("files_deleted", "Stored files removed by the sweeper"),
+            ("uploads_expired", "Abandoned resumable uploads removed by the sweeper"),
+            ("seconds", "Time spent in retention sweeps"),
+        ):
+            metric = CounterMetricFamily(f"{PREFIX}_sweeper_{key}", help_text)
+            metric.add_metric([], sweep[key])
+            yield metric
+
+        tts_stats = tts.synthesis_cache.stats()
+        for cache, stats in (("auth", token_cache.stats()), ("tts", tts_stats)):
+            lookups = CounterMetricFamily(
+                f"{PREFIX}_{cache}_cache_lookups", f"{cache} cache lookups by result", labels=["result"]
+            )
+            lookups.add_metric(["hit"], stats["hits"])
+            lookups.add_metric(["miss"], stats["misses"])
+            yield lookups
+            entries = GaugeMetricFamily(f"{PREFIX}_{cache}_cache_entries", f"Entries in the {cache} cache")
+            entries.add_metric([], stats["entries"])
+            yield entries
+        tts_bytes = GaugeMetricFamily(f"{PREFIX}_tts_cache_bytes", "Bytes of audio held in the synthesis cache")
+        tts_bytes.add_metric([], tts_stats["bytes"])
+        yield tts_bytes
+
+
+def render() -> tuple[bytes, str]:
+    """The registry in Prometheus text format, with its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+time_queries(engine, "sync")
+time_queries(async_engine.sync_engine, "async")
+REGISTRY.register(StatsCollector())
@@ -0,0 +1,70 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Where progress goes by default: set in conversion pool workers to send it to the API process
+_sink = None
+# The job the current thread is converting, with its sink and start time
+_local = threading.local()
+
+
+def init_worker(queue) -> None:
+    """Pool initializer: send progress of the jobs this worker runs to queue"""
+    global _sink
+    _sink = lambda *message: queue.put_nowait(message)
+
+
+@contextmanager
+def tracking_job(job_id: str, sink=None):
+    """Report the ffmpeg runs of this thread as progress of job_id to sink(job_id, position, duration, elapsed)"""
+    _local.job_id, _local.sink, _local.started = job_id, sink or _sink, time.monotonic()
+    try:
+        yield
+    finally:
+        _local.job_id = _local.sink = None
+
+
+def run_job(job_id: str, fn, *args):
+    """Pool target: run fn(*args) on behalf of job_id so its ffmpeg runs report progress"""
+    with tracking_job(job_id):
+        report(0.0, None)
+        return fn(*args)
+
+
+def tracking() -> bool:
+    """Whether the current thread is running a job whose progress is watched"""
+    return getattr(_local, "job_id", None) is not None and _local.sink is not None
+
+
+def report(position: float, duration: float | None) -> None:
+    """Pass on how many seconds of media the running job has converted"""
+    if not tracking():
+        return
+    try:
+        _local.sink(_local.job_id, position, duration, time.monotonic() - _local.started)
+    except Exception as e:
+        # Progress is advisory; never fail a conversion over it
+        print(f"Error reporting progress of job {_local.job_id}: {e}")
+
+
+def estimate(position: float, duration: float | None, elapsed: float) -> tuple[float | None, float | None]:
+    """Percent complete and seconds left, assuming the rest converts at the speed seen so far"""
+    if not duration:
+        return None, None
+    fraction = min(position / duration, 1.0)
+    if fraction <= 0:
+        return 0.0, None
+    return round(fraction * 100, 1), round(elapsed * (1 - fraction) / fraction, 1)
+
+
+def parse_out_time(line: bytes | str) -> float | None:
+    """Seconds of output written, from the out_time_us line of ffmpeg -progress output"""
+    if isinstance(line, bytes):
+        line = line.decode("ascii", errors="replace")
+    key, _, value = line.strip().partition("=")
+    if key != "out_time_us":
+        return None
+    try:
+        return max(0, int(value)) / 1_000_000
+    except ValueError:
+        return None  # "N/A" before the first frame
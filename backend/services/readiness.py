@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+from typing import Callable
+
+# Seconds between attempts of a required step that failed, e.g. the database not accepting connections yet
+RETRY_SECONDS = 2.0
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Start-up work that runs after the app begins answering requests.
+
+    The process serves / (liveness) as soon as it is imported. Required steps,
+    such as creating the schema, are retried until they succeed; optional ones
+    warm up engines that would otherwise initialize on first use. /ready
+    reports 503 until every required step succeeded and every optional one
+    finished, so orchestrators only route traffic to a warm instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._steps: dict[str, dict] = {}
+        self._started = time.monotonic()
+        self._task: asyncio.Task | None = None
+
+    def _set(self, name: str, **fields) -> None:
+        with self._lock:
+            self._steps.setdefault(name, {}).update(fields)
+
+    def start(self, required: dict[str, Callable], optional: dict[str, Callable], after_required=None) -> None:
+        """Run the required steps in order, then after_required(), then the optional steps concurrently"""
+        for name in {**required, **optional}:
+            self._set(name, status=PENDING, required=name in required, seconds=None, error=None)
+
+        async def run_all():
+            for name, fn in required.items():
+                await self._run(name, fn, required=True)
+            if after_required is not None:
+                after_required()
+            await asyncio.gather(*(self._run(name, fn, required=False) for name, fn in optional.items()))
+
+        self._task = asyncio.get_running_loop().create_task(run_all())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self, name: str, fn: Callable[[], object], required: bool) -> None:
+        """Run fn in a thread and record how long it took; required steps retry until they succeed"""
+        start = time.perf_counter()
+        while True:
+            try:
+                await asyncio.to_thread(fn)
+            except Exception as e:
+                self._set(name, error=str(e) or e.__class__.__name__)
+                print(f"Start-up step {name} failed: {e}")
+                if not required:
+                    self._set(name, status=FAILED, seconds=time.perf_counter() - start)
+                    return
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+            self._set(name, status=READY, seconds=time.perf_counter() - start, error=None)
+            return
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            steps = list(self._steps.values())
+        return bool(steps) and all(
+            step["status"] == READY or (step["status"] == FAILED and not step["required"]) for step in steps
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {
+            "ready": self.ready,
+            "uptime_seconds": time.monotonic() - self._started,
+            "steps": steps,
+        }
+
+
+readiness = Readiness()
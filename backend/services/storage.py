@@ -0,0 +1,341 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator
+
+# Where converted files are kept: "local" (sharded directories) or "s3"
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+# Root of the local layout; files live in <root>/<aa>/<bb>/<name>
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "outputs")
+# Conversions write here first, then the result is moved or uploaded into storage.
+# Keep it on the same filesystem as STORAGE_LOCAL_ROOT so the move is a rename.
+STORAGE_SCRATCH_DIR = os.getenv("STORAGE_SCRATCH_DIR", os.path.join(STORAGE_LOCAL_ROOT, ".incoming"))
+# S3 or any S3-compatible service (MinIO, Ceph, R2); credentials come from the usual AWS_* variables
+S3_BUCKET = os.getenv("S3_BUCKET", "mediaconverter")
+S3_PREFIX = os.getenv("S3_PREFIX", "outputs/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION") or None
+# Files at least this large are uploaded in parts, several at a time
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 ** 2)))
+S3_PART_SIZE = max(5 * 1024 ** 2, int(os.getenv("S3_PART_SIZE", str(8 * 1024 ** 2))))
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+
+CHUNK_SIZE = 64 * 1024
+# DeleteObjects accepts at most this many keys per call
+S3_DELETE_BATCH = 1000
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    name: str
+    size: int
+    mtime: float
+    etag: str  # Strong validator, quoted as in an ETag header
+
+
+class Storage:
+    """Where converted files are kept, addressed by their unique filename.
+
+    Objects are written once and never modified, so a name always refers to
+    the same bytes.
+    """
+
+    def save_file(self, path: str, name: str) -> None:
+        """Move a finished local file into storage under name"""
+        raise NotImplementedError
+
+    def save_bytes(self, data: bytes, name: str) -> None:
+        raise NotImplementedError
+
+    def stat(self, name: str) -> StoredObject | None:
+        """Size and validators of name, or None if it does not exist"""
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        return self.stat(name) is not None
+
+    def iter_range(self, name: str, start: int = 0, length: int | None = None,
+                   chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream length bytes of name from start (to the end when length is None)"""
+        raise NotImplementedError
+
+    def delete(self, name: str) -> bool:
+        """Remove name; False if it was already gone"""
+        raise NotImplementedError
+
+    def delete_many(self, names: list[str]) -> tuple[int, int]:
+        """Remove several objects; returns (deleted, failed)"""
+        deleted = failed = 0
+        for name in names:
+            try:
+                deleted += self.delete(name)
+            except Exception as e:
+                failed += 1
+                print(f"Error deleting {name}: {e}")
+        return deleted, failed
+
+
+class LocalShardedStorage(Storage):
+    """Files on a local or shared filesystem, spread over 65,536 directories.
+
+    The two directory levels come from a hash of the name, so no directory
+    grows beyond a few dozen entries even with millions of files. Files from
+    the old flat layout (<root>/<name>) are still found until moved with
+    migrate_flat().
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, name: str) -> str:
+        if os.path.basename(name) != name or name in ("", ".", ".."):
+            raise ValueError(f"Invalid object name: {name!r}")
+        digest = hashlib.md5(name.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def _existing_path(self, name: str) -> str | None:
+        path = self.path(name)
+        if os.path.exists(path):
+            return path
+        legacy = os.path.join(self.root, name)
+        if os.path.isfile(legacy):
+            return legacy
+        return None
+
+    def save_file(self, path: str, name: str) -> None:
+        dest = self.path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)
+
+    def save_bytes(self, data: bytes, name: str) -> None:
+        dest = self.path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Written aside and renamed, so readers never see a partial file
+        partial = f"{dest}.{os.getpid()}-{threading.get_ident()}.part"
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, dest)
+
+    def stat(self, name: str) -> StoredObject | None:
+        path = self._existing_path(name)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        # Name, size and mtime identify the exact bytes without hashing them
+        token = f"{name}:{stat.st_size}:{stat.st_mtime_ns}"
+        etag = '"' + hashlib.sha1(token.encode("utf-8")).hexdigest() + '"'
+        return StoredObject(name=name, size=stat.st_size, mtime=stat.st_mtime, etag=etag)
+
+    def iter_range(self, name, start=0, length=None, chunk_size=CHUNK_SIZE):
+        path = self._existing_path(name)
+        if path is None:
+            raise FileNotFoundError(name)
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length if length is not None else os.fstat(f.fileno()).st_size - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str) -> bool:
+        path = self._existing_path(name)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def migrate_flat(self) -> int:
+        """Move files left in the root by the old flat layout into their shards"""
+        moved = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith("."):
+                    self.save_file(entry.path, entry.name)
+                    moved += 1
+        return moved
+
+
+def _is_missing(error: Exception) -> bool:
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3Storage(Storage):
+    """Objects in an S3-compatible bucket.
+
+    client is a boto3 S3 client or anything with the same methods (e.g. an
+    in-process fake in tests); by default one is created from the S3_*
+    settings on first use.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", client=None,
+                 multipart_threshold: int = S3_MULTIPART_THRESHOLD, part_size: int = S3_PART_SIZE,
+                 upload_concurrency: int = S3_UPLOAD_CONCURRENCY):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.upload_concurrency = max(1, upload_concurrency)
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import boto3
+
+                self._client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+            return self._client
+
+    def key(self, name: str) -> str:
+        return self.prefix + name
+
+    def save_file(self, path: str, name: str) -> None:
+        size = os.path.getsize(path)
+        if size < self.multipart_threshold:
+            with open(path, "rb") as f:
+                self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=f)
+        else:
+            self._upload_multipart(path, name, size)
+        os.remove(path)
+
+    def _upload_multipart(self, path: str, name: str, size: int) -> None:
+        key = self.key(name)
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+
+        def upload_part(number: int) -> dict:
+            offset = (number - 1) * self.part_size
+            with open(path, "rb") as f:
+                f.seek(offset)
+                body = f.read(self.part_size)
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+            )
+            return {"PartNumber": number, "ETag": response["ETag"]}
+
+        numbers = range(1, (size + self.part_size - 1) // self.part_size + 1)
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.upload_concurrency, len(numbers))) as pool:
+                parts = list(pool.map(upload_part, numbers))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            # Otherwise the uploaded parts linger (and are billed) until a lifecycle rule removes them
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    def save_bytes(self, data: bytes, name: str) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.key(name), Body=data)
+
+    def stat(self, name: str) -> StoredObject | None:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except Exception as e:
+            if _is_missing(e):
+                return None
+            raise
+        return StoredObject(
+            name=name,
+            size=head["ContentLength"],
+            mtime=head["LastModified"].timestamp(),
+            etag=head["ETag"],
+        )
+
+    def iter_range(self, name, start=0, length=None, chunk_size=CHUNK_SIZE):
+        args = {"Bucket": self.bucket, "Key": self.key(name)}
+        if start or length is not None:
+            end = "" if length is None else str(start + length - 1)
+            args["Range"] = f"bytes={start}-{end}"
+        try:
+            body = self.client.get_object(**args)["Body"]
+        except Exception as e:
+            if _is_missing(e):
+                raise FileNotFoundError(name)
+            raise
+        try:
+            while True:
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, name: str) -> bool:
+        # S3 deletes are idempotent and do not say whether the key existed
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(name))
+        return True
+
+    def delete_many(self, names: list[str]) -> tuple[int, int]:
+        deleted = failed = 0
+        for i in range(0, len(names), S3_DELETE_BATCH):
+            batch = names[i:i + S3_DELETE_BATCH]
+            response = self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self.key(name)} for name in batch], "Quiet": True},
+            )
+            errors = response.get("Errors", [])
+            for error in errors:
+                print(f"Error deleting {error.get('Key')}: {error.get('Message')}")
+            failed += len(errors)
+            deleted += len(batch) - len(errors)
+        return deleted, failed
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "local":
+        return LocalShardedStorage(STORAGE_LOCAL_ROOT)
+    if backend == "s3":
+        return S3Storage(S3_BUCKET, S3_PREFIX)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def scratch_path(name: str) -> str:
+    """Local path a conversion writes to before its output is stored"""
+    return os.path.join(STORAGE_SCRATCH_DIR, name)
+
+
+def convert_and_store(convert, input_path: str, output_stem: str, *args):
+    """Pool target: run convert(input_path, output_stem, *args), then store what it wrote.
+
+    Uploading from the worker keeps object-store transfers off the API
+    process and in parallel with other conversions. Returns convert's
+    ExtractionResult (or list of them) with its waveform peaks and
+    "waveform" and "store" stages added.
+    """
+    # numpy is only needed where conversions run, not in every process importing storage
+    from services import waveform
+
+    result = convert(input_path, output_stem, *args)
+    results = result if isinstance(result, list) else [result]
+    scratch_dir = os.path.dirname(output_stem)
+    for item in results:
+        waveform.attach(item, os.path.join(scratch_dir, item.filename))
+    start = time.perf_counter()
+    try:
+        for item in results:
+            outputs.save_file(os.path.join(scratch_dir, item.filename), item.filename)
+    except Exception:
+        for item in results:
+            path = os.path.join(scratch_dir, item.filename)
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    seconds = time.perf_counter() - start
+    for item in results:
+        item.stages["store"] = seconds
+    return result
+
+
+outputs = create_storage()
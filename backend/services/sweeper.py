@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.orm import Session
+
+import models.models as models
+from databases.database import AsyncSessionLocal
+from services import storage, uploads
+
+# Files older than this many hours are deleted; 0 keeps them forever
+RETENTION_HOURS = float(os.getenv("RETENTION_HOURS", "72"))
+# Per file_type overrides, e.g. "text_to_audio=24,video_to_audio=168"
+RETENTION_HOURS_BY_TYPE = {
+    file_type.strip(): float(hours)
+    for file_type, _, hours in (
+        item.partition("=") for item in os.getenv("RETENTION_HOURS_BY_TYPE", "").split(",") if "=" in item
+    )
+}
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "300"))
+# Rows deleted per transaction; keeps locks short and memory flat with a large backlog
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+
+
+def retention_rules(now: datetime | None = None) -> list[tuple[str | None, datetime]]:
+    """(file_type, cutoff) pairs to sweep; file_type None covers every type without an override"""
+    now = now or datetime.utcnow()
+    rules = [
+        (file_type, now - timedelta(hours=hours))
+        for file_type, hours in RETENTION_HOURS_BY_TYPE.items()
+        if hours > 0
+    ]
+    if RETENTION_HOURS > 0:
+        rules.append((None, now - timedelta(hours=RETENTION_HOURS)))
+    return rules
+
+
+def reclaim_batch(db: Session, file_type: str | None, cutoff: datetime, batch_size: int) -> tuple[int, list[str]]:
+    """Delete up to batch_size expired MediaFile rows and release their outputs.
+
+    Returns the number of rows deleted and the stored files that nothing
+    references any more. The caller commits, then removes those files.
+    """
+    expired = select(models.MediaFile.id).where(models.MediaFile.created_at < cutoff)
+    if file_type is not None:
+        expired = expired.where(models.MediaFile.file_type == file_type)
+    elif RETENTION_HOURS_BY_TYPE:
+        expired = expired.where(or_(
+            models.MediaFile.file_type.is_(None),
+            models.MediaFile.file_type.not_in(list(RETENTION_HOURS_BY_TYPE)),
+        ))
+    # Oldest first so the created_at index bounds the scan
+    expired = expired.order_by(models.MediaFile.created_at).limit(batch_size)
+    deleted = db.execute(
+        delete(models.MediaFile)
+        .where(models.MediaFile.id.in_(expired.scalar_subquery()))
+        .returning(models.MediaFile.filename, models.MediaFile.content_key)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    orphaned = [row.filename for row in deleted if row.content_key is None]
+    released = Counter((row.content_key, row.filename) for row in deleted if row.content_key is not None)
+    touched = []
+    for (key, filename), count in released.items():
+        # Same matching as dedup.release: a re-registered key owns a different file
+        blob_id = db.execute(
+            update(models.OutputBlob)
+            .where(models.OutputBlob.content_key == key, models.OutputBlob.filename == filename)
+            .values(ref_count=models.OutputBlob.ref_count - count)
+            .returning(models.OutputBlob.id)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if blob_id is None:
+            orphaned.append(filename)
+        else:
+            touched.append(blob_id)
+    if touched:
+        orphaned.extend(db.execute(
+            delete(models.OutputBlob)
+            .where(models.OutputBlob.id.in_(touched), models.OutputBlob.ref_count <= 0)
+            .returning(models.OutputBlob.filename)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+    return len(deleted), orphaned
+
+
+def delete_files(filenames: list[str]) -> tuple[int, int]:
+    """Remove files from storage; returns (deleted, failed)"""
+    return storage.outputs.delete_many(filenames)
+
+
+class SweeperStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.rows_deleted = 0
+        self.files_deleted = 0
+        self.file_errors = 0
+        self.uploads_expired = 0
+        self.seconds = 0.0
+        self.last_run: dict | None = None
+
+    def record(self, rows: int, files: int, errors: int, seconds: float, expired_uploads: int = 0) -> None:
+        with self._lock:
+            self.runs += 1
+            self.rows_deleted += rows
+            self.files_deleted += files
+            self.file_errors += errors
+            self.uploads_expired += expired_uploads
+            self.seconds += seconds
+            self.last_run = {
+                "finished_at": datetime.utcnow().isoformat(),
+                "rows_deleted": rows,
+                "files_deleted": files,
+                "seconds": seconds,
+            }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "rows_deleted": self.rows_deleted,
+                "files_deleted": self.files_deleted,
+                "file_errors": self.file_errors,
+                "uploads_expired": self.uploads_expired,
+                "seconds": self.seconds,
+                "last_run": self.last_run,
+            }
+
+
+class Sweeper:
+    """Periodically deletes expired files in bounded batches without blocking requests"""
+
+    def __init__(self, session_factory, interval_seconds: float, batch_size: int):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.batch_size = max(1, batch_size)
+        self.stats = SweeperStats()
+        self._task: asyncio.Task | None = None
+
+    async def sweep(self) -> int:
+        """Run one full pass over every retention rule; returns rows deleted"""
+        start = time.perf_counter()
+        rows = files = errors = 0
+        for file_type, cutoff in retention_rules():
+            while True:
+                async with self.session_factory() as db:
+                    count, orphaned = await db.run_sync(reclaim_batch, file_type, cutoff, self.batch_size)
+                    await db.commit()
+                # Only delete files once the rows are gone for good
+                removed, failed = await asyncio.to_thread(delete_files, orphaned)
+                rows += count
+                files += removed
+                errors += failed
+                if count < self.batch_size:
+                    break
+        # Resumable uploads abandoned part way
+        expired_uploads = await asyncio.to_thread(uploads.store.remove_expired)
+        seconds = time.perf_counter() - start
+        self.stats.record(rows, files, errors, seconds, expired_uploads)
+        if rows or expired_uploads:
+            print(
+                f"Sweeper removed {rows} expired records, {files} files and "
+                f"{expired_uploads} abandoned uploads in {seconds:.2f}s"
+            )
+        return rows
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Sweeper pass failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+sweeper = Sweeper(AsyncSessionLocal, SWEEP_INTERVAL_SECONDS, SWEEP_BATCH_SIZE)
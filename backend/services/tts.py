@@ -0,0 +1,322 @@
+import io
+import os
+import re
+import shutil
+import subprocess
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Total size of rendered MP3s kept in memory
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Larger renders are not cached so one long document cannot flush everything else
+TTS_CACHE_MAX_ITEM_BYTES = int(os.getenv("TTS_CACHE_MAX_ITEM_BYTES", str(2 * 1024 * 1024)))
+# Long texts are split into chunks of about this many characters...
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "1000"))
+# ...and at most this many chunks are synthesized at once across all requests
+TTS_PARALLELISM = int(os.getenv("TTS_PARALLELISM", "4"))
+# Engine used when a request does not name one
+TTS_ENGINE = os.getenv("TTS_ENGINE", "gtts")
+# MP3 bitrate for engines that render PCM locally
+LOCAL_TTS_BITRATE = os.getenv("LOCAL_TTS_BITRATE", "64k")
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:\u3002\uff01\uff1f])\s+")
+
+
+class UnknownEngineError(ValueError):
+    """Raised for an engine name that is not registered or cannot run here"""
+
+
+class TTSEngine:
+    """Renders text to MP3 bytes. Implementations must be thread-safe."""
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    def warm_up(self) -> None:
+        """Load whatever the first synthesis would otherwise have to"""
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate text-to-speech; one HTTPS round trip per call"""
+    name = "gtts"
+
+    def warm_up(self) -> None:
+        import gtts  # noqa: F401
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=language).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakEngine(TTSEngine):
+    """In-process espeak-ng synthesis, encoded to MP3 with the bundled ffmpeg.
+
+    Runs entirely on local cores, so throughput is not tied to a remote API.
+    """
+    name = "espeak"
+    # gTTS language codes whose espeak-ng voice has a different name
+    VOICES = {"zh": "cmn", "zh-CN": "cmn", "zh-TW": "cmn", "pt-BR": "pt-br", "en-GB": "en-gb"}
+
+    def _binary(self) -> str | None:
+        return shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self) -> bool:
+        return self._binary() is not None
+
+    def warm_up(self) -> None:
+        from services.extractor import ffmpeg_exe
+
+        ffmpeg_exe()
+
+    def synthesize(self, text: str, language: str) -> bytes:
+        from services.extractor import ffmpeg_exe
+
+        binary = self._binary()
+        if binary is None:
+            raise UnknownEngineError("espeak-ng is not installed")
+        voice = self.VOICES.get(language, language)
+        speech = subprocess.run(
+            [binary, "-v", voice, "--stdin", "--stdout"],
+            input=text.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        encoded = subprocess.run(
+            [ffmpeg_exe(), "-hide_banner", "-loglevel", "error",
+             "-f", "wav", "-i", "pipe:0", "-c:a", "libmp3lame", "-b:a", LOCAL_TTS_BITRATE,
+             # No Xing/Info frame: it would state this chunk's length once chunks are joined
+             "-write_xing", "0", "-f", "mp3", "pipe:1"],
+            input=speech.stdout,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+        )
+        return encoded.stdout
+
+
+ENGINES: dict[str, TTSEngine] = {engine.name: engine for engine in (GTTSEngine(), EspeakEngine())}
+
+
+def get_engine(name: str | None = None) -> TTSEngine:
+    """Look up an engine by name, defaulting to TTS_ENGINE"""
+    engine = ENGINES.get(name or TTS_ENGINE)
+    if engine is None:
+        raise UnknownEngineError(f"Unknown TTS engine: {name or TTS_ENGINE}")
+    if not engine.available():
+        raise UnknownEngineError(f"TTS engine {engine.name} is not available on this server")
+    return engine
+
+
+def warm_up() -> None:
+    """Warm up the default engine"""
+    get_engine().warm_up()
+
+
+def register_engine(engine: TTSEngine) -> None:
+    """Make an engine selectable by name, e.g. a stub engine in tests and benchmarks"""
+    ENGINES[engine.name] = engine
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC with whitespace runs collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class SynthesisCache:
+    """Byte-bounded LRU of rendered audio keyed by (normalized text, language, engine)"""
+
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries: OrderedDict[tuple, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes) -> None:
+        if len(data) > min(self.max_item_bytes, self.max_bytes):
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else None,
+            }
+
+
+synthesis_cache = SynthesisCache(TTS_CACHE_MAX_BYTES, TTS_CACHE_MAX_ITEM_BYTES)
+
+
+def synthesize(text: str, language: str, engine=None, cache: SynthesisCache | None = None) -> bytes:
+    """Render text to MP3 bytes, serving repeats from the cache without calling the engine"""
+    engine = engine or get_engine()
+    cache = cache or synthesis_cache
+    normalized = normalize_text(text)
+    key = (normalized, language, engine.name)
+    data = cache.get(key)
+    if data is None:
+        data = engine.synthesize(normalized, language)
+        cache.put(key, data)
+    return data
+
+
+# --- Chunked synthesis ---
+
+_chunk_executor: ThreadPoolExecutor | None = None
+_chunk_executor_lock = threading.Lock()
+
+
+def _get_chunk_executor() -> ThreadPoolExecutor:
+    global _chunk_executor
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            _chunk_executor = ThreadPoolExecutor(max_workers=max(1, TTS_PARALLELISM), thread_name_prefix="tts")
+        return _chunk_executor
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    """Split text into chunks of at most max_chars, breaking at sentence ends where possible.
+
+    Sentences longer than max_chars are broken between words, and words longer
+    than max_chars are cut.
+    """
+    pieces = []
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars + 1)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def strip_id3(data: bytes) -> bytes:
+    """Drop ID3v2/ID3v1 tags so MP3 frames from several renders can be concatenated"""
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = 0
+        for byte in data[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
+
+# Layer III bitrates (kbps) by MPEG version bits: 3 is MPEG-1, 2 MPEG-2, 0 MPEG-2.5
+_MP3_BITRATES = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_BITRATES[0] = _MP3_BITRATES[2]
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_frame_length(header: bytes) -> int | None:
+    """Byte length of the Layer III frame starting with header, or None if it is not one"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version, layer = (header[1] >> 3) & 0x3, (header[1] >> 1) & 0x3
+    bitrate_index, rate_index = header[2] >> 4, (header[2] >> 2) & 0x3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    padding = (header[2] >> 1) & 0x1
+    # Samples per frame / 8: 1152 for MPEG-1, 576 for MPEG-2 and 2.5
+    factor = 144 if version == 3 else 72
+    bitrate = _MP3_BITRATES[version][bitrate_index] * 1000
+    return factor * bitrate // _MP3_SAMPLE_RATES[version][rate_index] + padding
+
+
+def strip_vbr_header(data: bytes) -> bytes:
+    """Drop a leading Xing/Info (LAME) or VBRI frame.
+
+    Encoders put one silent frame first that states the frame count and length
+    of that render. After concatenation it would describe only the first chunk,
+    so players would show the wrong duration and seek wrongly; without it they
+    derive both from the frames themselves.
+    """
+    length = _mp3_frame_length(data[:4])
+    if length is None:
+        return data
+    # The tag follows the side information, whose size depends on version and channels
+    if any(marker in data[4:min(length, 64)] for marker in (b"Xing", b"Info", b"VBRI")):
+        return data[length:]
+    return data
+
+
+def synthesize_long(
+    text: str,
+    language: str,
+    engine=None,
+    cache: SynthesisCache | None = None,
+    max_chars: int | None = None,
+) -> bytes:
+    """Render arbitrarily long text by synthesizing sentence-aligned chunks concurrently.
+
+    MP3 is a sequence of self-contained frames, so the chunks are joined in
+    order without re-encoding, minus their tags and per-chunk Xing/Info
+    headers. Each chunk goes through the synthesis cache.
+    """
+    chunks = split_text(normalize_text(text), max_chars or TTS_CHUNK_CHARS)
+    if len(chunks) <= 1:
+        return synthesize(text, language, engine=engine, cache=cache)
+    futures = [
+        _get_chunk_executor().submit(synthesize, chunk, language, engine, cache)
+        for chunk in chunks
+    ]
+    parts = [future.result() for future in futures]
+    return b"".join(strip_vbr_header(strip_id3(part)) for part in parts)
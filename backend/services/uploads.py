@@ -0,0 +1,226 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+# Protocol version spoken by /uploads (https://tus.io/protocols/resumable-upload)
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,checksum,termination,expiration"
+# Where partial uploads and their state live; share it between API processes
+UPLOAD_DIR = os.getenv("RESUMABLE_UPLOAD_DIR", os.path.join("uploads", "resumable"))
+# Largest file accepted through /uploads
+UPLOAD_MAX_BYTES = int(os.getenv("RESUMABLE_UPLOAD_MAX_BYTES", str(8 * 1024 ** 3)))
+# Unfinished uploads untouched for this long are removed by the sweeper
+UPLOAD_EXPIRY_HOURS = float(os.getenv("RESUMABLE_UPLOAD_EXPIRY_HOURS", "24"))
+
+# Upload-Checksum algorithms, by their tus names
+CHECKSUM_ALGORITHMS = {"sha1": hashlib.sha1, "sha256": hashlib.sha256, "md5": hashlib.md5}
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class InvalidUploadError(ValueError):
+    """Raised for a malformed resumable upload request"""
+
+
+class UploadConflictError(InvalidUploadError):
+    """Raised when a PATCH does not start at the upload's current offset, or another is in progress"""
+
+
+class ChecksumMismatchError(InvalidUploadError):
+    """Raised when a chunk does not match its Upload-Checksum; the chunk is discarded"""
+
+
+@dataclass
+class ResumableUpload:
+    id: str
+    user_id: int
+    length: int
+    filename: str
+    profiles: list[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    # Set once the upload is complete and handed to the converter
+    job_id: str | None = None
+    # Bytes received so far; the size of the partial file, not stored in the info file
+    offset: int = 0
+
+    @property
+    def complete(self) -> bool:
+        return self.job_id is not None
+
+
+def parse_metadata(header: str | None) -> dict[str, str]:
+    """Decode an Upload-Metadata header: comma-separated "key base64(value)" pairs"""
+    metadata = {}
+    for pair in (header or "").split(","):
+        key, _, value = pair.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8")
+        except ValueError:
+            raise InvalidUploadError(f"Upload-Metadata value for {key} is not valid base64")
+    return metadata
+
+
+def parse_checksum(header: str | None):
+    """Hash object and expected digest from an Upload-Checksum header, or None without one"""
+    if not header:
+        return None
+    algorithm, _, encoded = header.strip().partition(" ")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise InvalidUploadError(f"Unsupported checksum algorithm: {algorithm}")
+    try:
+        expected = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise InvalidUploadError("Upload-Checksum digest is not valid base64")
+    return CHECKSUM_ALGORITHMS[algorithm](), expected
+
+
+class UploadStore:
+    """Partial uploads on disk: <id>.part holds the bytes received, <id>.json the rest.
+
+    The partial file's size is the offset, so state survives restarts and is
+    shared by every API process that sees the directory. Writes to one upload
+    are serialized within a process; across processes the offset check turns
+    a concurrent PATCH into a conflict.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, expiry_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.expiry_seconds = expiry_seconds
+        self._busy: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _path(self, upload_id: str, suffix: str) -> str:
+        if not _ID_RE.match(upload_id):
+            raise KeyError(upload_id)
+        return os.path.join(self.directory, upload_id + suffix)
+
+    def _save(self, upload: ResumableUpload) -> None:
+        info = asdict(upload)
+        del info["offset"]
+        partial = self._path(upload.id, ".json.tmp")
+        with open(partial, "w") as f:
+            json.dump(info, f)
+        os.replace(partial, self._path(upload.id, ".json"))
+
+    def create(self, user_id: int, length: int, metadata: dict[str, str]) -> ResumableUpload:
+        if length < 1:
+            raise InvalidUploadError("Upload-Length must be positive")
+        if length > self.max_bytes:
+            raise InvalidUploadError(f"Uploads are limited to {self.max_bytes} bytes")
+        profiles = [name.strip() for name in metadata.get("profiles", "").split(",") if name.strip()]
+        upload = ResumableUpload(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            length=length,
+            filename=os.path.basename(metadata.get("filename") or "upload"),
+            profiles=profiles,
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        open(self._path(upload.id, ".part"), "wb").close()
+        self._save(upload)
+        return upload
+
+    def get(self, upload_id: str) -> ResumableUpload | None:
+        try:
+            with open(self._path(upload_id, ".json")) as f:
+                upload = ResumableUpload(**json.load(f))
+        except (KeyError, FileNotFoundError):
+            return None
+        if upload.complete:
+            upload.offset = upload.length
+        else:
+            try:
+                upload.offset = os.path.getsize(self._path(upload_id, ".part"))
+            except FileNotFoundError:
+                return None
+        return upload
+
+    def expires_at(self, upload: ResumableUpload) -> float:
+        try:
+            touched = os.path.getmtime(self._path(upload.id, ".json" if upload.complete else ".part"))
+        except FileNotFoundError:
+            touched = upload.created_at
+        return touched + self.expiry_seconds
+
+    @contextmanager
+    def writing(self, upload: ResumableUpload, offset: int):
+        """Open the partial file for appending a chunk that starts at offset"""
+        with self._lock:
+            if upload.id in self._busy:
+                raise UploadConflictError("Another request is writing to this upload")
+            self._busy.add(upload.id)
+        try:
+            if upload.complete or offset != upload.offset:
+                raise UploadConflictError(f"Upload-Offset must be {upload.offset}")
+            with open(self._path(upload.id, ".part"), "r+b") as f:
+                f.seek(offset)
+                yield f
+        finally:
+            with self._lock:
+                self._busy.discard(upload.id)
+
+    def truncate(self, upload: ResumableUpload, offset: int) -> None:
+        """Drop bytes written after offset, e.g. a chunk that failed its checksum"""
+        with open(self._path(upload.id, ".part"), "r+b") as f:
+            f.truncate(offset)
+
+    def finish(self, upload: ResumableUpload, staging_dir: str) -> str:
+        """Move the assembled file into staging_dir for conversion and return its path"""
+        input_path = os.path.join(staging_dir, f"{uuid.uuid4()}_{upload.filename}")
+        os.replace(self._path(upload.id, ".part"), input_path)
+        return input_path
+
+    def mark_complete(self, upload: ResumableUpload, job_id: str) -> None:
+        """Remember the job so a client that lost the final response can still find it"""
+        upload.job_id = job_id
+        upload.offset = upload.length
+        self._save(upload)
+
+    def delete(self, upload: ResumableUpload) -> None:
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(self._path(upload.id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def remove_expired(self, now: float | None = None) -> int:
+        """Delete uploads, finished or not, that have not been touched within the expiry"""
+        now = now or time.time()
+        removed = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            upload_id, suffix = os.path.splitext(entry.name)
+            if suffix != ".json":
+                continue
+            upload = self.get(upload_id)
+            if upload is None or self.expires_at(upload) <= now:
+                if upload is None:
+                    upload = ResumableUpload(id=upload_id, user_id=0, length=0, filename="")
+                self.delete(upload)
+                removed += 1
+        return removed
+
+
+def file_digest(path: str) -> str:
+    """sha256 of an assembled upload, the same content key a direct upload gets"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+store = UploadStore(UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_EXPIRY_HOURS * 3600)
@@ -0,0 +1,163 @@
+import os
+import struct
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from services import extractor
+
+# Compute peaks for every new output; turn off to save the extra decode per conversion
+WAVEFORM_ENABLED = os.getenv("WAVEFORM_ENABLED", "1") == "1"
+# Outputs are decoded to mono at this rate, plenty to find peaks
+WAVEFORM_SAMPLE_RATE = 8000
+# Samples reduced to one min/max pair while decoding, before the levels are built
+BLOCK_SAMPLES = 32
+# Bucket counts stored per output; other resolutions are reduced from the next finer one
+RESOLUTIONS = (32, 64, 128, 256, 512, 1024, 2048, 4096)
+MAX_RESOLUTION = RESOLUTIONS[-1]
+
+READ_SIZE = BLOCK_SAMPLES * 2 * 1024
+# Version byte, level count and duration, then the bucket count of each level
+_HEADER = struct.Struct("<BBf")
+_VERSION = 1
+
+
+class Peaks:
+    """Min/max pairs per bucket at several resolutions, values scaled to -128..127"""
+
+    def __init__(self, duration: float, levels: list[np.ndarray]):
+        self.duration = duration
+        self.levels = levels  # int8 arrays of shape (buckets, 2), coarsest first
+
+    def encode(self) -> bytes:
+        """A few KB: a small header and the int8 pairs of every level"""
+        header = _HEADER.pack(_VERSION, len(self.levels), self.duration)
+        sizes = struct.pack(f"<{len(self.levels)}H", *(len(level) for level in self.levels))
+        return header + sizes + b"".join(level.tobytes() for level in self.levels)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Peaks":
+        version, count, duration = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Unsupported waveform version {version}")
+        sizes = struct.unpack_from(f"<{count}H", data, _HEADER.size)
+        offset = _HEADER.size + 2 * count
+        levels = []
+        for size in sizes:
+            levels.append(np.frombuffer(data, dtype=np.int8, count=size * 2, offset=offset).reshape(size, 2))
+            offset += size * 2
+        return cls(duration, levels)
+
+    def at(self, resolution: int) -> np.ndarray:
+        """resolution (min, max) pairs, or fewer if the audio is too short to fill them"""
+        for level in self.levels:
+            if len(level) >= resolution:
+                return _reduce(level, resolution)
+        return self.levels[-1]
+
+
+def _reduce(pairs: np.ndarray, buckets: int) -> np.ndarray:
+    """Merge consecutive (min, max) pairs into buckets groups of near-equal size"""
+    if len(pairs) <= buckets:
+        return pairs
+    edges = np.arange(buckets) * len(pairs) // buckets
+    return np.stack([np.minimum.reduceat(pairs[:, 0], edges), np.maximum.reduceat(pairs[:, 1], edges)], axis=1)
+
+
+def _reduce_blocks(samples: np.ndarray) -> np.ndarray:
+    """(min, max) of each run of BLOCK_SAMPLES samples; len(samples) must be a multiple of it"""
+    blocks = samples.reshape(-1, BLOCK_SAMPLES)
+    return np.stack([blocks.min(axis=1), blocks.max(axis=1)], axis=1)
+
+
+def compute(path: str | None = None, data: bytes | None = None) -> Peaks:
+    """Decode the audio file at path (or the encoded bytes data) once and build every level.
+
+    PCM is read from ffmpeg a few KB at a time and reduced to block peaks as
+    it arrives, so memory grows with the length of the audio by only 4 bytes
+    (an int16 min/max pair) per BLOCK_SAMPLES samples.
+    """
+    proc = subprocess.Popen(
+        [extractor.ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-i", path or "pipe:0",
+         "-map", "0:a:0", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        stdin=subprocess.PIPE if path is None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    threads = []
+    if path is None:
+        def feed():
+            try:
+                proc.stdin.write(data)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+
+        threads.append(threading.Thread(target=feed, daemon=True))
+    # Drained alongside stdout so a chatty ffmpeg never blocks on a full stderr pipe
+    stderr = []
+    threads.append(threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True))
+    for thread in threads:
+        thread.start()
+
+    blocks = []
+    pending = b""
+    total = 0
+    while True:
+        chunk = proc.stdout.read(READ_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        usable = len(pending) - len(pending) % (BLOCK_SAMPLES * 2)
+        if usable:
+            blocks.append(_reduce_blocks(np.frombuffer(pending[:usable], dtype="<i2")))
+            total += usable // 2
+            pending = pending[usable:]
+    if len(pending) >= 2:
+        # Pad the last partial block with its own final sample so it does not add a false peak at zero
+        tail = np.frombuffer(pending[:len(pending) - len(pending) % 2], dtype="<i2")
+        total += len(tail)
+        blocks.append(_reduce_blocks(np.pad(tail, (0, BLOCK_SAMPLES - len(tail)), mode="edge")))
+    for thread in threads:
+        thread.join()
+    if proc.wait() != 0:
+        raise RuntimeError(f"Could not decode audio: {stderr[0].decode(errors='replace').strip()[-500:]}")
+    if not blocks:
+        raise RuntimeError("No audio samples decoded")
+
+    # int16 -> int8 keeps the shape of the waveform and halves the size again
+    peaks = (np.concatenate(blocks) >> 8).astype(np.int8)
+    # Each level is built from the next finer one; short audio stops at as many buckets as it has blocks
+    levels = []
+    for resolution in reversed(RESOLUTIONS):
+        peaks = _reduce(peaks, resolution)
+        if not levels or len(peaks) < len(levels[0]):
+            levels.insert(0, peaks)
+    return Peaks(total / WAVEFORM_SAMPLE_RATE, levels)
+
+
+def compute_encoded(path: str | None = None, data: bytes | None = None) -> tuple[bytes | None, float]:
+    """Encoded peaks for an output and the seconds it took; None if disabled or decoding failed.
+
+    A missing waveform only disables the preview, so errors are logged
+    rather than failing the conversion.
+    """
+    if not WAVEFORM_ENABLED:
+        return None, 0.0
+    start = time.perf_counter()
+    try:
+        encoded = compute(path, data).encode()
+    except Exception as e:
+        print(f"Waveform for {path or 'audio bytes'} failed: {e}")
+        encoded = None
+    return encoded, time.perf_counter() - start
+
+
+def attach(result: extractor.ExtractionResult, path: str) -> None:
+    """Compute the peaks of a finished output still on local disk and record them on result"""
+    result.waveform, seconds = compute_encoded(path)
+    if result.waveform is not None:
+        result.stages["waveform"] = seconds
@@ -0,0 +1,354 @@
+import asyncio
+import math
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models.models as models
+from services import admission, dedup, extractor, jobs, storage
+
+# A running job whose worker has not checked in for this long is handed to another worker
+VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("WORKER_VISIBILITY_TIMEOUT_SECONDS", "60"))
+# How often workers renew their leases and publish progress
+HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "2"))
+# Runs per job, counting the first, before it is marked failed
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "3"))
+# Delay before the first retry; doubles with every further attempt
+RETRY_BACKOFF_SECONDS = float(os.getenv("WORKER_RETRY_BACKOFF_SECONDS", "10"))
+# How often /jobs/{job_id}/events re-reads a job the API process does not run itself
+EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "1"))
+
+
+def _to_job(row: models.ConversionJob) -> jobs.Job:
+    """The in-memory Job view of a row, so /jobs serializes both backends the same way"""
+    return jobs.Job(
+        id=row.id,
+        user_id=row.user_id,
+        kind=row.kind,
+        original_name=row.original_name,
+        input_path=row.input_path,
+        output_filename=row.output_filename,
+        content_key=row.content_key,
+        status=row.status,
+        error=row.error,
+        media_file_ids=list(row.media_file_ids or []),
+        created_at=row.created_at,
+        finished_at=row.finished_at,
+        percent=row.percent,
+        eta_seconds=row.eta_seconds,
+        version=row.version,
+    )
+
+
+def _retry_after(db: Session, position: int) -> int:
+    """Seconds until about position queued jobs have run, from recent run times and the jobs running now"""
+    recent = db.execute(
+        select(models.ConversionJob.started_at, models.ConversionJob.finished_at)
+        .where(models.ConversionJob.status == jobs.COMPLETED, models.ConversionJob.started_at.is_not(None))
+        .order_by(models.ConversionJob.finished_at.desc())
+        .limit(20)
+    ).all()
+    if not recent:
+        return 1
+    mean = sum((finished - started).total_seconds() for started, finished in recent) / len(recent)
+    running = db.execute(
+        select(func.count()).where(models.ConversionJob.status == jobs.RUNNING)
+    ).scalar()
+    return max(1, math.ceil(mean * (position + 1) / max(1, running)))
+
+
+def check_admission(db: Session, user_id: int, controller: admission.AdmissionController = admission.video) -> None:
+    """Apply controller's per-user and queue limits to the table, raising AdmissionRejected.
+
+    The jobs run in worker processes the in-process controller never sees, so
+    the limits are checked against the rows instead: queued or running jobs of
+    user_id against max_per_user (429), and jobs waiting for a worker across
+    all API processes against max_queue (503). Like AdmissionController.check()
+    nothing is reserved, so concurrent requests may overshoot by a few.
+    """
+    in_progress = models.ConversionJob.status.in_((jobs.QUEUED, jobs.RUNNING))
+    if controller.max_per_user:
+        user_jobs = db.execute(
+            select(func.count()).where(models.ConversionJob.user_id == user_id, in_progress)
+        ).scalar()
+        if user_jobs >= controller.max_per_user:
+            raise controller.reject(
+                "per_user", 429, f"You already have {controller.max_per_user} conversions in progress",
+                _retry_after(db, 0),
+            )
+    queued = db.execute(select(func.count()).where(models.ConversionJob.status == jobs.QUEUED)).scalar()
+    if queued >= controller.max_queue:
+        raise controller.reject(
+            "queue_full", 503, "Server is busy converting, please retry later", _retry_after(db, queued)
+        )
+
+
+def enqueue(
+    db: Session,
+    job: jobs.Job,
+    profiles: list[str] | None = None,
+    content_keys: dict[str, str] | None = None,
+    linked: list[int] | None = None,
+    options: extractor.ClipOptions | None = None,
+) -> jobs.Job:
+    """Queue job for the workers.
+
+    Without profiles the default extraction is stored under job.content_key;
+    otherwise each named profile is encoded and stored under content_keys[name].
+    linked holds MediaFile rows already created from the dedup cache.
+    """
+    db.add(models.ConversionJob(
+        id=job.id,
+        user_id=job.user_id,
+        kind=job.kind,
+        status=jobs.QUEUED,
+        original_name=job.original_name,
+        input_path=job.input_path,
+        content_key=job.content_key,
+        profiles=profiles,
+        content_keys=content_keys,
+        media_file_ids=list(linked or []),
+        options=options.params() if options is not None else None,
+        max_attempts=MAX_ATTEMPTS,
+        created_at=job.created_at,
+        run_after=job.created_at,
+    ))
+    db.commit()
+    return job
+
+
+def record_completed(db: Session, job: jobs.Job, media_file_ids: list[int]) -> jobs.Job:
+    """Record a job that was satisfied without running, e.g. from the dedup cache"""
+    job.status = jobs.COMPLETED
+    job.media_file_ids = list(media_file_ids)
+    job.percent, job.eta_seconds = 100.0, 0.0
+    job.finished_at = datetime.utcnow()
+    db.add(models.ConversionJob(
+        id=job.id,
+        user_id=job.user_id,
+        kind=job.kind,
+        status=job.status,
+        original_name=job.original_name,
+        content_key=job.content_key,
+        output_filename=job.output_filename,
+        media_file_ids=job.media_file_ids,
+        percent=job.percent,
+        eta_seconds=job.eta_seconds,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    ))
+    db.commit()
+    return job
+
+
+def get(db: Session, job_id: str) -> jobs.Job | None:
+    row = db.execute(
+        select(models.ConversionJob)
+        .where(models.ConversionJob.id == job_id)
+        .execution_options(populate_existing=True)
+    ).scalar()
+    return _to_job(row) if row is not None else None
+
+
+def for_user(db: Session, user_id: int) -> list[jobs.Job]:
+    cutoff = datetime.utcnow() - timedelta(minutes=jobs.JOB_RETENTION_MINUTES)
+    rows = db.execute(
+        select(models.ConversionJob)
+        .where(
+            models.ConversionJob.user_id == user_id,
+            or_(models.ConversionJob.finished_at.is_(None), models.ConversionJob.finished_at >= cutoff),
+        )
+        .order_by(models.ConversionJob.created_at.desc())
+        .execution_options(populate_existing=True)
+    ).scalars()
+    return [_to_job(row) for row in rows]
+
+
+async def wait_for_change(db: AsyncSession, job: jobs.Job, version: int, timeout: float) -> tuple[jobs.Job, bool]:
+    """Poll job until its version moves past version; the latest view and False if timeout passed first"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline:
+        # End the read transaction so the connection goes back to the pool while we sleep
+        await db.rollback()
+        await asyncio.sleep(min(EVENTS_POLL_SECONDS, max(0.0, deadline - loop.time())))
+        latest = await db.run_sync(get, job.id)
+        if latest is None:
+            return job, False
+        job = latest
+        if job.version != version:
+            return job, True
+    return job, False
+
+
+def claim(db: Session, worker_id: str, now: datetime | None = None) -> models.ConversionJob | None:
+    """Take the oldest runnable job for worker_id, or None if there is nothing to do.
+
+    Runnable means queued and past its retry delay, or running on a worker
+    whose lease expired. On PostgreSQL, FOR UPDATE SKIP LOCKED lets many
+    workers claim at once without waiting on each other; the version check
+    keeps databases without it (SQLite) from handing one job to two workers.
+    """
+    now = now or datetime.utcnow()
+    runnable = or_(
+        and_(models.ConversionJob.status == jobs.QUEUED, models.ConversionJob.run_after <= now),
+        and_(models.ConversionJob.status == jobs.RUNNING, models.ConversionJob.locked_until < now),
+    )
+    while True:
+        row = db.execute(
+            select(models.ConversionJob)
+            .where(runnable)
+            .order_by(models.ConversionJob.created_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .execution_options(populate_existing=True)
+        ).scalar()
+        if row is None:
+            db.rollback()
+            return None
+        if row.status == jobs.RUNNING and row.attempts >= row.max_attempts:
+            # Its last worker died on the final attempt
+            row.status, row.error, row.finished_at = jobs.FAILED, "Worker stopped responding", now
+            row.locked_by = row.locked_until = None
+            row.version += 1
+            remove_input(row.input_path)
+            db.commit()
+            continue
+        claimed = db.execute(
+            update(models.ConversionJob)
+            .where(models.ConversionJob.id == row.id, models.ConversionJob.version == row.version)
+            .values(
+                status=jobs.RUNNING,
+                attempts=models.ConversionJob.attempts + 1,
+                locked_by=worker_id,
+                locked_until=now + timedelta(seconds=VISIBILITY_TIMEOUT_SECONDS),
+                started_at=now,
+                percent=None,
+                eta_seconds=None,
+                version=models.ConversionJob.version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            db.refresh(row)
+            return row
+
+
+def heartbeat(
+    db: Session, job_id: str, worker_id: str, estimate: tuple[float | None, float | None] | None = None
+) -> bool:
+    """Extend worker_id's lease on job_id and publish progress; False if the job is no longer ours"""
+    values = {"locked_until": datetime.utcnow() + timedelta(seconds=VISIBILITY_TIMEOUT_SECONDS)}
+    if estimate is not None:
+        percent, eta_seconds = estimate
+        if percent is not None:
+            values["percent"] = percent
+        if eta_seconds is not None:
+            values["eta_seconds"] = eta_seconds
+        values["version"] = models.ConversionJob.version + 1
+    renewed = db.execute(
+        update(models.ConversionJob)
+        .where(_held_by(job_id, worker_id))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def complete(db: Session, job: models.ConversionJob, worker_id: str, results: list) -> bool:
+    """Record the ExtractionResults of a finished run as MediaFile rows and mark the job completed.
+
+    Returns False, after deleting the stored outputs, if the lease was lost
+    and another worker may be converting the same job.
+    """
+    if not heartbeat(db, job.id, worker_id):
+        storage.outputs.delete_many([result.filename for result in results])
+        return False
+    media_file_ids = list(job.media_file_ids or [])
+    output_filename = None
+    for result in results:
+        profile = result.profile if job.profiles else None
+        key = job.content_keys[profile] if profile else job.content_key
+        blob = dedup.register_blob(db, key, result.filename, result.file_size, result.waveform)
+        output_filename = output_filename or blob.filename
+        media_file_ids.append(dedup.link_output(db, blob, key, job.original_name, job.user_id, profile).id)
+    db.execute(
+        update(models.ConversionJob)
+        .where(_held_by(job.id, worker_id))
+        .values(
+            status=jobs.COMPLETED,
+            media_file_ids=media_file_ids,
+            output_filename=output_filename,
+            error=None,
+            percent=100.0,
+            eta_seconds=0.0,
+            finished_at=datetime.utcnow(),
+            locked_by=None,
+            locked_until=None,
+            version=models.ConversionJob.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return True
+
+
+def fail(db: Session, job: models.ConversionJob, worker_id: str, error: str, retry: bool = True) -> bool:
+    """Give job back after a failed run: queue a retry with backoff, or fail it for good.
+
+    Returns True if the failure is final (or the job is no longer ours), so
+    the caller can remove the input.
+    """
+    row = db.execute(
+        select(models.ConversionJob)
+        .where(_held_by(job.id, worker_id))
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalar()
+    if row is None:
+        db.rollback()
+        return False
+    now = datetime.utcnow()
+    final = not retry or row.attempts >= row.max_attempts
+    row.error = error
+    row.locked_by = row.locked_until = None
+    row.percent = row.eta_seconds = None
+    row.version += 1
+    if final:
+        row.status, row.finished_at = jobs.FAILED, now
+    else:
+        row.status = jobs.QUEUED
+        row.run_after = now + timedelta(seconds=RETRY_BACKOFF_SECONDS * 2 ** (row.attempts - 1))
+    db.commit()
+    return final
+
+
+def prune(db: Session, now: datetime | None = None) -> int:
+    """Delete finished jobs older than JOB_RETENTION_MINUTES; their MediaFile rows stay"""
+    cutoff = (now or datetime.utcnow()) - timedelta(minutes=jobs.JOB_RETENTION_MINUTES)
+    deleted = db.execute(
+        delete(models.ConversionJob)
+        .where(models.ConversionJob.finished_at < cutoff)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def _held_by(job_id: str, worker_id: str):
+    return and_(
+        models.ConversionJob.id == job_id,
+        models.ConversionJob.status == jobs.RUNNING,
+        models.ConversionJob.locked_by == worker_id,
+    )
+
+
+def remove_input(path: str | None) -> None:
+    """Delete a job's staged upload once no attempt will need it again"""
+    if path and os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,75 @@
+import os
+import time
+import zipfile
+from typing import Iterable, Iterator
+
+from services.storage import Storage
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """Write-only file object that buffers what zipfile writes until it is drained.
+
+    It has no seek()/tell(), so zipfile writes entries with data descriptors
+    instead of seeking back to patch sizes into the local headers.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def unique_name(name: str, used: set[str]) -> str:
+    """name, or name with a (2), (3)... suffix if an earlier entry already took it"""
+    candidate = name
+    stem, ext = os.path.splitext(name)
+    counter = 2
+    while candidate in used:
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(entries: Iterable[tuple[str, str]], store: Storage, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a ZIP archive of (archive name, stored name) entries as it is built.
+
+    Entries are stored uncompressed: the outputs are already compressed audio,
+    so deflating them would cost CPU for no gain. Memory use stays at about one
+    chunk regardless of archive size. Entries missing from storage are skipped.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, name in entries:
+            stored = store.stat(name)
+            if stored is None:
+                continue
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime(stored.mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            # Declared up front so zipfile switches to ZIP64 for large entries
+            info.file_size = stored.size
+            with archive.open(info, "w") as dest:
+                for chunk in store.iter_range(name, chunk_size=chunk_size):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory, written when the archive closes
+    data = sink.drain()
+    if data:
+        yield data
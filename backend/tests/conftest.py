@@ -16,3 +16,21 @@ def pytest_collection_modifyitems(config, items):
     for item in items:
         if "test_file_management" in item.nodeid or "test_token" in item.nodeid:
             item.add_marker(pytest.mark.skip(reason="Requires running server on localhost:8000"))
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Session on a throwaway SQLite database, with outputs/ in a temp working dir"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import models.models as models
+
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    models.Base.metadata.create_all(bind=test_engine)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("outputs", exist_ok=True)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        test_engine.dispose()
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import admission, jobs
+
+
+def test_work_queues_fifo_and_takes_over_released_slots():
+    controller = admission.AdmissionController("test", max_active=1, max_queue=2, max_per_user=0)
+    started = []
+    controller.admit(1, lambda release: started.append(("a", release)))
+    controller.admit(2, lambda release: started.append(("b", release)))
+    controller.admit(3, lambda release: started.append(("c", release)))
+    assert [name for name, _ in started] == ["a"]
+    assert controller.stats()["queued"] == 2
+
+    started[0][1]()
+    started[0][1]()  # A second release is ignored
+    assert [name for name, _ in started] == ["a", "b"]
+    started[1][1]()
+    started[2][1]()
+    stats = controller.stats()
+    assert (stats["active"], stats["queued"], stats["admitted"]) == (0, 0, 3)
+
+
+def test_rejects_when_queue_is_full_or_user_has_too_many():
+    controller = admission.AdmissionController("test", max_active=1, max_queue=1, max_per_user=2)
+    controller.admit(1, lambda release: None)
+    controller.admit(1, lambda release: None)
+    with pytest.raises(admission.AdmissionRejected) as per_user:
+        controller.admit(1, lambda release: None)
+    assert per_user.value.status_code == 429
+    with pytest.raises(admission.AdmissionRejected) as full:
+        controller.check(2)
+    assert full.value.status_code == 503
+    assert full.value.retry_after >= 1
+    # Work that is part of an already accepted request still queues
+    controller.admit(2, lambda release: None, queue_limit=False)
+    assert controller.stats()["queued"] == 2
+    assert controller.stats()["rejected"] == {"queue_full": 1, "per_user": 1, "timeout": 0}
+
+
+def test_slot_times_out_and_leaves_the_queue():
+    controller = admission.AdmissionController("test", max_active=1, max_queue=4, max_per_user=0)
+
+    async def scenario():
+        async with controller.slot(1):
+            with pytest.raises(admission.AdmissionRejected) as timed_out:
+                async with controller.slot(2, timeout=0.05):
+                    pass
+            assert timed_out.value.status_code == 503
+            assert controller.stats()["queued"] == 0
+
+            waiting = asyncio.create_task(_hold(controller, 3))
+            await asyncio.sleep(0.01)
+            assert controller.stats()["queued"] == 1
+        await waiting
+
+    asyncio.run(scenario())
+    stats = controller.stats()
+    assert (stats["active"], stats["admitted"], stats["rejected"]["timeout"]) == (0, 2, 1)
+
+
+async def _hold(controller, user_id):
+    async with controller.slot(user_id):
+        await asyncio.sleep(0)
+
+
+def test_middleware_rejects_before_the_endpoint_runs():
+    controller = admission.AdmissionController("test", max_active=1, max_queue=0, max_per_user=0)
+    app = FastAPI()
+    app.add_middleware(admission.AdmissionMiddleware, routes={"/convert": controller})
+    calls = []
+
+    @app.post("/convert")
+    def convert():
+        calls.append(1)
+        return {}
+
+    client = TestClient(app)
+    assert client.post("/convert").status_code == 200
+    controller.admit(1, lambda release: None)
+    response = client.post("/convert", content=b"x" * 1000)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert response.json()["detail"]
+    assert calls == [1]
+
+
+def test_job_queue_releases_slot_when_job_finishes():
+    controller = admission.AdmissionController("test", max_active=1, max_queue=1, max_per_user=0)
+    queue = jobs.JobQueue(1)
+    try:
+        first, second = jobs.new_job(1, "test"), jobs.new_job(1, "test")
+        for job in (first, second):
+            queue.submit(job, time.sleep, 0.5, on_success=lambda job, result: 1, admission=controller)
+        with pytest.raises(admission.AdmissionRejected):
+            queue.submit(jobs.new_job(1, "test"), time.sleep, 0, on_success=lambda job, result: 1, admission=controller)
+        assert len(queue.for_user(1)) == 2
+        for job in (first, second):
+            while job.finished_at is None:
+                time.sleep(0.05)
+            assert job.current_status == jobs.COMPLETED
+        assert controller.stats()["active"] == 0
+    finally:
+        queue.shutdown()
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models.models as models
+from services import auth_cache
+from services.auth_cache import Principal, TokenCache
+
+
+def test_hit_after_put_and_expiry():
+    cache = TokenCache(ttl_seconds=0.05, max_entries=10)
+    principal = Principal(id=1, email="a@example.com")
+    assert cache.get("token") is None
+    cache.put("token", principal)
+    assert cache.get("token") == principal
+    time.sleep(0.06)
+    assert cache.get("token") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entry_never_outlives_token():
+    cache = TokenCache(ttl_seconds=60, max_entries=10)
+    cache.put("expired", Principal(id=1, email="a@example.com"), token_expires_at=time.time() - 1)
+    assert cache.get("expired") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = TokenCache(ttl_seconds=0, max_entries=10)
+    cache.put("token", Principal(id=1, email="a@example.com"))
+    assert cache.get("token") is None
+
+
+def test_bounded_size_evicts_oldest():
+    cache = TokenCache(ttl_seconds=60, max_entries=2)
+    for i in range(3):
+        cache.put(f"t{i}", Principal(id=i, email=f"{i}@example.com"))
+    assert cache.get("t0") is None
+    assert cache.get("t2").id == 2
+
+
+def test_password_change_and_delete_invalidate(db):
+    user = models.User(email="a@example.com", hashed_password="old")
+    db.add(user)
+    db.commit()
+    cache = auth_cache.token_cache
+    cache.put("token", Principal(id=user.id, email=user.email))
+
+    user.hashed_password = "new"
+    db.commit()
+    assert cache.get("token") is None
+
+    cache.put("token", Principal(id=user.id, email=user.email))
+    db.delete(user)
+    db.commit()
+    assert cache.get("token") is None
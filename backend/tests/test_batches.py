@@ -0,0 +1,101 @@
+import io
+import os
+import sys
+import time
+import zipfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services import batches, jobs, storage, zipstream
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+def test_expand_archive_skips_unsafe_and_metadata_entries(tmp_path):
+    archive = make_zip({
+        "lectures/week1.mp4": b"one",
+        "lectures/.DS_Store": b"x",
+        "__MACOSX/lectures/._week1.mp4": b"x",
+        "../escape.mp4": b"x",
+        "week2.mp4": b"two",
+    })
+    staged = batches.expand_archive(archive, str(tmp_path))
+    assert [name for name, _, _ in staged] == ["lectures/week1.mp4", "week2.mp4"]
+    for _, path, _ in staged:
+        assert os.path.dirname(path) == str(tmp_path)
+    assert open(staged[1][1], "rb").read() == b"two"
+
+
+def test_expand_archive_rejects_oversized_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(batches, "BATCH_MAX_ARCHIVE_BYTES", 5)
+    with pytest.raises(batches.InvalidBatchError):
+        batches.expand_archive(make_zip({"a.mp4": b"123456"}), str(tmp_path))
+    with pytest.raises(batches.InvalidBatchError):
+        batches.expand_archive(io.BytesIO(b"not a zip"), str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_batch_runs_items_and_completes_once(tmp_path):
+    sizes = {}
+    for name, size in [("a", 3), ("b", 5), ("c", 7)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+    batch = batches.new_batch(1)
+    batch.items = [batches.BatchItem(name=name, input_path=str(tmp_path / name)) for name in "abc"]
+    batch.items.append(batches.BatchItem(name="missing", input_path=str(tmp_path / "missing")))
+    batch.items.append(batches.BatchItem(name="cached", status=jobs.COMPLETED))
+    finished, completed = [], []
+
+    def on_complete(batch):
+        completed.append(batch.counts())
+        for item in batch.items:
+            if item.status == jobs.COMPLETED:
+                item.media_file_id = 1
+
+    job_queue = jobs.JobQueue(2)
+    queue = batches.BatchQueue(job_queue, concurrency=2)
+    try:
+        queue.submit(
+            batch,
+            os.path.getsize,
+            lambda item: (item.input_path,),
+            on_item_success=lambda batch, item, size: sizes.__setitem__(item.name, size),
+            on_item_finish=finished.append,
+            on_complete=on_complete,
+        )
+        deadline = time.monotonic() + 30
+        while batch.finished_at is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        job_queue.shutdown()
+
+    assert batch.status == jobs.COMPLETED
+    assert sizes == {"a": 3, "b": 5, "c": 7}
+    assert len(finished) == 4
+    assert completed == [{"queued": 0, "running": 0, "completed": 4, "failed": 1}]
+    assert batch.items[3].error
+    assert queue.get(batch.id) is batch
+
+
+def test_stream_zip_round_trips(tmp_path):
+    store = storage.LocalShardedStorage(str(tmp_path))
+    store.save_bytes(b"a" * 100_000, "one.mp3")
+    store.save_bytes(b"b" * 10, "two.m4a")
+    used = set()
+    entries = [
+        (zipstream.unique_name("talk.mp3", used), "one.mp3"),
+        (zipstream.unique_name("talk.mp3", used), "two.m4a"),
+        ("gone.mp3", "missing.mp3"),
+    ]
+    data = b"".join(zipstream.stream_zip(entries, store, chunk_size=4096))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["talk.mp3", "talk (2).mp3"]
+        assert archive.read("talk (2).mp3") == b"b" * 10
@@ -0,0 +1,35 @@
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import harness
+
+
+def test_run_load_counts_errors_and_latencies():
+    async def send(i):
+        await asyncio.sleep(0)
+        if i % 5 == 0:
+            raise RuntimeError("boom")
+        return i % 5 != 1
+
+    summary = asyncio.run(harness.run_load(send, concurrency=4, requests=20))
+    assert summary["requests"] == 20
+    assert summary["errors"] == 8
+    assert summary["throughput_rps"] > 0
+    assert 0 <= summary["p50_ms"] <= summary["p99_ms"]
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {
+        "download": {"4": {"throughput_rps": 100.0, "p50_ms": 10.0, "p99_ms": 20.0, "errors": 0}},
+        "login": {"1": {"throughput_rps": 50.0, "p50_ms": 5.0, "p99_ms": 8.0, "errors": 0}},
+    }
+    current = {
+        "download": {"4": {"throughput_rps": 95.0, "p50_ms": 10.5, "p99_ms": 30.0, "errors": 2}},
+        "text_to_audio": {"1": {"throughput_rps": 10.0, "p50_ms": 1.0, "p99_ms": 2.0, "errors": 0}},
+    }
+    rows = harness.compare(baseline, current, threshold=0.1)
+    assert {row["metric"]: row["regressed"] for row in rows} == {
+        "throughput_rps": False, "p50_ms": False, "p99_ms": True, "errors": True,
+    }
@@ -40,3 +40,37 @@ def test_database_connection():
         print("\nTo create the database, run in SQL Shell (psql):")
         print("   CREATE DATABASE mediaconverter;")
         pytest.fail(f"Database connection failed: {e}")
+
+
+def test_async_database_url_swaps_driver():
+    from databases.database import async_database_url
+    assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("sqlite:///./app.db") == "sqlite+aiosqlite:///./app.db"
+    assert async_database_url("postgresql+asyncpg://u@db/app") == "postgresql+asyncpg://u@db/app"
+
+
+def test_timed_pool_records_waits_and_timeouts(tmp_path):
+    from sqlalchemy import create_engine, exc
+    from sqlalchemy.pool import QueuePool
+    from databases.database import PoolStats, _timed_pool_class
+
+    stats = PoolStats()
+    test_engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=_timed_pool_class(QueuePool, stats),
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    try:
+        with test_engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                test_engine.connect()
+            assert test_engine.pool.checkedout() == 1
+        snapshot = stats.snapshot()
+        assert snapshot["checkouts"] == 1
+        assert snapshot["timeouts"] == 1
+        assert snapshot["max_wait_seconds"] >= 0
+    finally:
+        test_engine.dispose()
@@ -0,0 +1,118 @@
+import asyncio
+import io
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models.models as models
+from services import dedup, storage
+
+
+def make_output(name, data=b"audio"):
+    with open(os.path.join("outputs", name), "wb") as f:
+        f.write(data)
+    return name
+
+
+def add_user(db):
+    user = models.User(email="dedup@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def link(db, user, blob, key):
+    media_file = models.MediaFile(filename=blob.filename, file_type="video_to_audio",
+                                  file_size=blob.file_size, user_id=user.id, content_key=key)
+    db.add(media_file)
+    db.commit()
+    return media_file
+
+
+def test_content_key_depends_on_input_and_params():
+    key = dedup.content_key("video_to_audio", "abc", bitrate="192k")
+    assert key == dedup.content_key("video_to_audio", "abc", bitrate="192k")
+    assert key != dedup.content_key("video_to_audio", "abd", bitrate="192k")
+    assert key != dedup.content_key("video_to_audio", "abc", bitrate="128k")
+    assert key != dedup.content_key("text_to_audio", "abc", bitrate="192k")
+
+
+def test_copy_and_hash():
+    dst = io.BytesIO()
+    digest = dedup.copy_and_hash(io.BytesIO(b"hello"), dst)
+    assert dst.getvalue() == b"hello"
+    assert digest == "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+
+def test_blob_is_shared_and_deleted_after_last_release(db):
+    user = add_user(db)
+    assert dedup.find_blob(db, "key") is None
+    blob = dedup.register_blob(db, "key", make_output("a.mp3"), 5)
+    first = link(db, user, blob, "key")
+
+    again = dedup.find_blob(db, "key")
+    assert again.filename == "a.mp3"
+    second = link(db, user, again, "key")
+
+    assert dedup.release(db, first) is None
+    db.delete(first)
+    db.commit()
+    assert dedup.release(db, second) == "a.mp3"
+    db.delete(second)
+    db.commit()
+    assert db.query(models.OutputBlob).count() == 0
+
+
+def test_register_race_keeps_first_blob(db):
+    dedup.register_blob(db, "key", make_output("a.mp3"), 5)
+    db.commit()
+    winner = dedup.register_blob(db, "key", make_output("b.mp3"), 5)
+    db.commit()
+    assert winner.filename == "a.mp3"
+    assert winner.ref_count == 2
+    assert not os.path.exists(os.path.join("outputs", "b.mp3"))
+
+
+def test_missing_file_is_a_miss(db):
+    dedup.register_blob(db, "key", "gone.mp3", 5)
+    db.commit()
+    assert dedup.find_blob(db, "key") is None
+    assert db.query(models.OutputBlob).count() == 0
+
+
+def test_legacy_rows_release_their_own_file(db):
+    media_file = models.MediaFile(filename="old.mp3", user_id=1)
+    assert dedup.release(db, media_file) == "old.mp3"
+
+
+def test_async_lookups_keep_storage_calls_off_the_event_loop(db, tmp_path, monkeypatch):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    dedup.register_blob(db, "key", make_output("a.mp3"), 5)
+    db.commit()
+    callers = []
+    for name in ("exists", "delete"):
+        def record(filename, call=getattr(storage.outputs, name)):
+            callers.append(threading.current_thread())
+            return call(filename)
+        monkeypatch.setattr(storage.outputs, name, record)
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        try:
+            async with async_sessionmaker(async_engine)() as session:
+                found = (await dedup.find_blob_async(session, "key")).filename
+                await session.commit()
+                # A concurrent conversion of the same input registered first
+                winner = (await dedup.register_blob_async(session, "key", make_output("b.mp3"), 5)).filename
+                await session.commit()
+                return found, winner, threading.current_thread()
+        finally:
+            await async_engine.dispose()
+
+    found, winner, loop_thread = asyncio.run(run())
+    assert (found, winner) == ("a.mp3", "a.mp3")
+    assert not os.path.exists(os.path.join("outputs", "b.mp3"))
+    assert db.query(models.OutputBlob.ref_count).scalar() == 3
+    assert len(callers) == 3 and loop_thread not in callers
@@ -0,0 +1,80 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services import downloads, storage
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path):
+    store = storage.LocalShardedStorage(str(tmp_path))
+    store.save_bytes(DATA, "song.mp3")
+    app = FastAPI()
+
+    @app.get("/file")
+    def serve(request: Request):
+        return downloads.file_response(request, store, store.stat("song.mp3"), "audio/mpeg", "song.mp3")
+
+    return TestClient(app)
+
+
+def test_full_download_has_validators(client):
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "max-age" in response.headers["cache-control"]
+    assert response.headers["content-disposition"] == 'attachment; filename="song.mp3"'
+
+
+def test_range_request(client):
+    response = client.get("/file", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+
+    response = client.get("/file", headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == DATA[-10:]
+
+    response = client.get("/file", headers={"Range": "bytes=10000-"})
+    assert response.status_code == 206
+    assert response.content == DATA[10000:]
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/file", headers={"Range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_conditional_requests(client):
+    first = client.get("/file")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+    assert client.get("/file", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/file", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert client.get("/file", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get("/file", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/file", headers={"If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"}).status_code == 200
+
+
+def test_if_range_mismatch_sends_whole_file(client):
+    etag = client.get("/file").headers["etag"]
+    matching = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert matching.status_code == 206
+    stale = client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
+
+
+def test_multi_range_falls_back_to_full_body(client):
+    response = client.get("/file", headers={"Range": "bytes=0-1,5-6"})
+    assert response.status_code == 200
+    assert response.content == DATA
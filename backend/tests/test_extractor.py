@@ -0,0 +1,151 @@
+import os
+import queue
+import subprocess
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services import extractor, progress
+
+MP4_BANNER = """
+Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'v.mp4':
+  Duration: 01:02:03.50, start: 0.000000, bitrate: 96 kb/s
+  Stream #0:0[0x1](und): Video: h264 (High 4:4:4 Predictive) (avc1 / 0x31637661), yuv444p
+  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, mono, fltp, 69 kb/s (default)
+"""
+
+
+def make_video(path, audio_codec):
+    args = [extractor.ffmpeg_exe(), "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", "testsrc=size=64x48:rate=5"]
+    if audio_codec:
+        args += ["-f", "lavfi", "-i", "sine=frequency=440", "-c:a", audio_codec, "-shortest"]
+    args += ["-t", "2", "-c:v", "libx264", str(path)]
+    subprocess.run(args, check=True)
+    return str(path)
+
+
+def test_parse_probe_reads_codec_and_duration():
+    info = extractor.parse_probe(MP4_BANNER)
+    assert info.container == "mov,mp4,m4a,3gp,3g2,mj2"
+    assert info.audio_codec == "aac"
+    assert info.duration == pytest.approx(3723.5)
+
+
+def test_parse_probe_without_audio():
+    info = extractor.parse_probe("Input #0, matroska,webm, from 'v.mkv':\n  Stream #0:0: Video: h264, yuv420p\n")
+    assert info.container == "matroska,webm"
+    assert info.audio_codec is None
+    assert info.duration is None
+
+
+@pytest.mark.parametrize("container,audio_codec,mode,extension", [
+    ("mp4", "aac", "copy", ".m4a"),
+    ("mkv", "libmp3lame", "copy", ".mp3"),
+    ("mkv", "flac", "transcode", ".mp3"),
+])
+def test_extract_audio_chooses_path(tmp_path, container, audio_codec, mode, extension):
+    video = make_video(tmp_path / f"in.{container}", audio_codec)
+    result = extractor.extract_audio(video, str(tmp_path / "out"))
+    assert result.mode == mode
+    assert result.filename == "out" + extension
+    assert result.file_size == os.path.getsize(tmp_path / result.filename) > 0
+
+
+def test_extract_audio_without_audio_track(tmp_path):
+    video = make_video(tmp_path / "in.mp4", None)
+    with pytest.raises(extractor.NoAudioTrackError):
+        extractor.extract_audio(video, str(tmp_path / "out"))
+    assert not any(name.startswith("out") for name in os.listdir(tmp_path))
+
+
+def test_extract_clip_of_selected_stream(tmp_path):
+    # Two audio tracks: AAC, then a 48 kHz stereo MP3
+    video = str(tmp_path / "in.mkv")
+    subprocess.run([extractor.ffmpeg_exe(), "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", "testsrc=size=64x48:rate=5",
+                    "-f", "lavfi", "-i", "sine=frequency=440",
+                    "-f", "lavfi", "-i", "sine=frequency=880:sample_rate=48000",
+                    "-map", "0", "-map", "1", "-map", "2", "-t", "4", "-ac:a:1", "2",
+                    "-c:v", "libx264", "-c:a:0", "aac", "-c:a:1", "libmp3lame", video], check=True)
+
+    clip = extractor.extract_audio(video, str(tmp_path / "clip"), extractor.ClipOptions(start=1, end=2.5, stream=1))
+    assert (clip.mode, clip.codec, clip.filename, clip.duration) == ("copy", "mp3", "clip.mp3", 1.5)
+    assert extractor.probe(str(tmp_path / "clip.mp3")).duration == pytest.approx(1.5, abs=0.1)
+
+    mono = extractor.ClipOptions(end=2, stream=1, channels=1, sample_rate=16000)
+    result = extractor.extract_audio(video, str(tmp_path / "mono"), mono)
+    assert result.mode == "transcode"
+    banner = subprocess.run([extractor.ffmpeg_exe(), "-hide_banner", "-i", str(tmp_path / result.filename)],
+                            stderr=subprocess.PIPE).stderr.decode()
+    assert "16000 Hz, mono" in banner
+
+    with pytest.raises(extractor.InvalidInputError):
+        extractor.extract_audio(video, str(tmp_path / "out"), extractor.ClipOptions(stream=2))
+    with pytest.raises(extractor.InvalidInputError):
+        extractor.extract_audio(video, str(tmp_path / "out"), extractor.ClipOptions(start=5))
+
+
+def test_clip_options_validate_and_normalize():
+    assert extractor.ClipOptions(start=0, end=90).params() == {"end": 90.0}
+    assert extractor.ClipOptions().params() == {}
+    assert extractor.ClipOptions(start=10, end=40).length(25.0) == 15.0
+    for invalid in ({"start": -1}, {"start": 5, "end": 5}, {"channels": 6}, {"sample_rate": 12345},
+                    {"end": float("inf")}, {"stream": -1}):
+        with pytest.raises(extractor.InvalidInputError):
+            extractor.ClipOptions(**invalid)
+    with pytest.raises(extractor.InvalidInputError):
+        extractor.ClipOptions(sample_rate=44100).check_profiles(extractor.get_profiles(["opus-32k"]))
+
+
+def test_needs_seek_checks_moov_position(tmp_path):
+    video = make_video(tmp_path / "in.mp4", "aac")
+    faststart = str(tmp_path / "faststart.mp4")
+    subprocess.run([extractor.ffmpeg_exe(), "-loglevel", "error", "-i", video,
+                    "-c", "copy", "-movflags", "+faststart", faststart], check=True)
+    mkv = make_video(tmp_path / "in.mkv", "libmp3lame")
+    assert extractor.needs_seek(open(video, "rb").read(4096))
+    assert not extractor.needs_seek(open(faststart, "rb").read(4096))
+    assert not extractor.needs_seek(open(mkv, "rb").read(4096))
+
+
+def test_extract_audio_stream_from_pipe(tmp_path):
+    import asyncio
+    data = open(make_video(tmp_path / "in.mkv", "libmp3lame"), "rb").read()
+
+    async def chunks():
+        for i in range(1024, len(data), 1024):
+            yield data[i:i + 1024]
+
+    result = asyncio.run(extractor.extract_audio_stream(data[:1024], chunks(), str(tmp_path / "out")))
+    assert result.mode == "copy"
+    assert result.filename == "out.mp3"
+    assert os.path.getsize(tmp_path / "out.mp3") == result.file_size > 0
+
+
+def test_extract_renditions_from_one_run(tmp_path):
+    video = make_video(tmp_path / "in.mkv", "flac")
+    results = extractor.extract_renditions(video, str(tmp_path / "out"), ["opus-32k", "mp3-192k", "opus-32k"])
+    assert [(r.profile, r.filename, r.mode) for r in results] == [
+        ("opus-32k", "out-opus-32k.opus", "renditions"),
+        ("mp3-192k", "out-mp3-192k.mp3", "renditions"),
+    ]
+    assert all(r.file_size == os.path.getsize(tmp_path / r.filename) > 0 for r in results)
+    assert extractor.output_format(results[0].filename) == "opus"
+    with pytest.raises(extractor.UnknownProfileError):
+        extractor.get_profiles(["flac-lossless"])
+
+
+def test_tracked_extraction_reports_progress(tmp_path, monkeypatch):
+    reports = queue.Queue()
+    monkeypatch.setattr(progress, "_sink", lambda *message: reports.put(message))
+    video = make_video(tmp_path / "in.mkv", "libvorbis")
+    result = progress.run_job("job-1", extractor.extract_audio, video, str(tmp_path / "out"))
+    assert result.mode == "transcode"
+    messages = [reports.get_nowait() for _ in range(reports.qsize())]
+    assert messages[0][:3] == ("job-1", 0.0, None)
+    job_id, position, duration, elapsed = messages[-1]
+    assert duration == pytest.approx(2.0, abs=0.1)
+    assert position == pytest.approx(duration, abs=0.1)
+    assert progress.parse_out_time(b"out_time_us=N/A\n") is None
@@ -67,7 +67,7 @@ def test_file_management_system():
 
     if response.status_code == 200:
         data = response.json()
-        print(f"✅ Total files: {data['total']}")
+        print(f"✅ Files on first page: {len(data['files'])}")
         for file in data['files']:
             print(f"   - {file['filename'][:30]}... ({file['file_size']} bytes)")
             print(f"     Type: {file['file_type']}, Created: {file['created_at']}")
@@ -0,0 +1,72 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import jobs
+
+
+def wait_for(job, timeout=30):
+    deadline = time.monotonic() + timeout
+    while job.finished_at is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return job
+
+
+def test_job_completes_on_worker_pool(tmp_path):
+    path = tmp_path / "input.bin"
+    path.write_bytes(b"x" * 1234)
+    finished = []
+    queue = jobs.JobQueue(1)
+    try:
+        job = jobs.new_job(1, "test")
+        queue.submit(
+            job,
+            os.path.getsize,
+            str(path),
+            on_success=lambda job, size: size,
+            on_finish=finished.append,
+        )
+        wait_for(job)
+        assert job.current_status == jobs.COMPLETED
+        assert job.media_file_id == 1234
+        assert finished == [job]
+        assert queue.get(job.id) is job
+        assert queue.for_user(1) == [job]
+        assert queue.for_user(2) == []
+    finally:
+        queue.shutdown()
+
+
+def test_job_failure_is_reported(tmp_path):
+    queue = jobs.JobQueue(1)
+    try:
+        job = jobs.new_job(1, "test")
+        queue.submit(job, os.path.getsize, str(tmp_path / "missing"), on_success=lambda job, size: size)
+        wait_for(job)
+        assert job.current_status == jobs.FAILED
+        assert job.media_file_id is None
+        assert job.error
+    finally:
+        queue.shutdown()
+
+
+def test_progress_wakes_waiting_clients():
+    queue = jobs.JobQueue(1)
+    job = jobs.new_job(1, "test")
+
+    def report():
+        time.sleep(0.05)
+        job.record_progress(30.0, 120.0, elapsed=3.0)
+        queue._notify(job)
+
+    async def scenario():
+        assert not await queue.wait_for_change(job, job.version, timeout=0.01)
+        threading.Thread(target=report).start()
+        return await queue.wait_for_change(job, 0, timeout=5)
+
+    assert asyncio.run(scenario())
+    assert (job.percent, job.eta_seconds, job.version) == (25.0, 9.0, 1)
+    assert not queue._waiters
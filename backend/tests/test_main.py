@@ -43,3 +43,248 @@ def test_signup_flow():
     response = client.get("/my-files", headers=headers)
     assert response.status_code == 200
     assert "files" in response.json()
+
+def test_my_files_cursor_roundtrip():
+    from datetime import datetime
+    from main import encode_cursor, decode_cursor
+    created_at = datetime(2025, 11, 23, 15, 30, 0, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_job_events_stream_ends_with_the_result():
+    from services import jobs
+    from services.auth_cache import Principal, token_cache
+
+    token_cache.put("events-token", Principal(id=9001, email="events@example.com"))
+    job = jobs.job_queue.record_completed(jobs.new_job(9001, "video_to_audio"), [])
+    response = client.get(f"/jobs/{job.id}/events?access_token=events-token")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "event: completed\n" in response.text
+    assert '"percent": 100.0' in response.text
+    assert client.get(f"/jobs/{job.id}/events").status_code == 401
+    other = jobs.job_queue.record_completed(jobs.new_job(9002, "video_to_audio"), [])
+    assert client.get(f"/jobs/{other.id}/events?access_token=events-token").status_code == 404
+
+
+def test_video_to_audio_rejects_invalid_clip_options():
+    from services.auth_cache import Principal, token_cache
+
+    token_cache.put("clip-token", Principal(id=9003, email="clip@example.com"))
+    headers = {"Authorization": "Bearer clip-token"}
+    files = {"file": ("v.mp4", b"not a video")}
+    for query in ("start=30&end=10", "channels=6", "sample_rate=44100&profiles=opus-32k"):
+        response = client.post(f"/convert/video-to-audio?{query}", files=files, headers=headers)
+        assert response.status_code == 400, query
+
+
+def test_library_archive_selects_only_the_users_files(db):
+    import io
+    import zipfile
+    from datetime import datetime
+    import models.models as models
+    import schemas.schemas as schemas
+    from main import _library_archive_entries, _library_archive_query
+    from services import storage, zipstream
+
+    store = storage.LocalShardedStorage("outputs")
+    files = [
+        (1, "a.mp3", "talk.mp4", "video_to_audio", None, datetime(2025, 1, 1)),
+        (1, "b.opus", "talk.mp4", "video_to_audio", "opus-32k", datetime(2025, 2, 1)),
+        (1, "c.mp3", "text_conversion", "text_to_audio", None, datetime(2025, 3, 1)),
+        (2, "d.mp3", "other.mp4", "video_to_audio", None, datetime(2025, 2, 1)),
+    ]
+    for user_id, filename, original_name, file_type, profile, created_at in files:
+        store.save_bytes(filename.encode() * 100, filename)
+        db.add(models.MediaFile(user_id=user_id, filename=filename, original_name=original_name,
+                                file_type=file_type, profile=profile, created_at=created_at))
+    db.commit()
+
+    def select_files(**fields):
+        return db.execute(_library_archive_query(1, schemas.LibraryArchiveRequest(**fields))).all()
+
+    assert [row.filename for row in select_files()] == ["a.mp3", "b.opus", "c.mp3"]
+    assert [row.filename for row in select_files(filenames=["a.mp3", "d.mp3"])] == ["a.mp3"]
+    assert [row.filename for row in select_files(file_type="video_to_audio")] == ["a.mp3", "b.opus"]
+    assert [row.filename for row in select_files(created_after=datetime(2025, 1, 15),
+                                                 created_before=datetime(2025, 3, 1))] == ["b.opus"]
+
+    data = b"".join(zipstream.stream_zip(_library_archive_entries(select_files()), store))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ["talk.mp3", "talk-opus-32k.opus", "text_conversion.mp3"]
+        assert archive.getinfo("talk.mp3").compress_type == zipfile.ZIP_STORED
+        assert archive.read("talk.mp3") == b"a.mp3" * 100
+
+
+def test_library_archive_requires_a_non_empty_filename_list():
+    from services.auth_cache import Principal, token_cache
+
+    token_cache.put("archive-token", Principal(id=9004, email="archive@example.com"))
+    response = client.post("/my-files/archive", json={"filenames": []},
+                           headers={"Authorization": "Bearer archive-token"})
+    assert response.status_code == 422
+    assert client.post("/my-files/archive", json={}).status_code == 401
+
+
+def test_rejected_conversion_keeps_cors_headers_and_is_timed(monkeypatch):
+    from prometheus_client import REGISTRY
+    from services import admission
+
+    labels = {"method": "POST", "route": "unmatched", "status": "503"}
+
+    def rejected_count():
+        return REGISTRY.get_sample_value("mediaconverter_http_request_duration_seconds_count", labels) or 0
+
+    def saturated(user_id=None):
+        raise admission.AdmissionRejected(503, "Server busy", 7)
+
+    monkeypatch.setattr(admission.video, "check", saturated)
+    before = rejected_count()
+    response = client.post("/convert/video-to-audio", headers={"Origin": "http://localhost:5173"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.headers["access-control-allow-origin"]
+    assert "retry-after" in response.headers["access-control-expose-headers"].lower()
+    assert rejected_count() == before + 1
+
+
+def test_stream_conversion_removes_scratch_output_of_rejected_input(db, monkeypatch):
+    from services import extractor, storage
+    from services.auth_cache import Principal, token_cache
+
+    os.makedirs(storage.STORAGE_SCRATCH_DIR, exist_ok=True)
+
+    async def half_written(head, chunks, output_stem):
+        async for _ in chunks:
+            pass
+        with open(output_stem + ".mp3", "wb") as f:
+            f.write(b"partial")
+        raise extractor.InvalidInputError("Could not read the uploaded video")
+
+    monkeypatch.setattr(extractor, "extract_audio_stream", half_written)
+    token_cache.put("stream-token", Principal(id=9005, email="stream@example.com"))
+    response = client.post("/convert/video-to-audio/stream?filename=v.mkv", content=b"not a video" * 100,
+                           headers={"Authorization": "Bearer stream-token"})
+    assert response.status_code == 400
+    assert os.listdir(storage.STORAGE_SCRATCH_DIR) == []
+
+
+def test_batches_are_refused_when_jobs_run_on_standalone_workers(monkeypatch):
+    from services import jobs
+    from services.auth_cache import Principal, token_cache
+
+    monkeypatch.setattr(jobs, "JOB_BACKEND", "database")
+    token_cache.put("batch-token", Principal(id=9006, email="batch@example.com"))
+    response = client.post("/convert/batch", files=[("files", ("a.mp4", b"video"))],
+                           headers={"Authorization": "Bearer batch-token"})
+    assert response.status_code == 501
+
+
+@pytest.mark.parametrize("rejected_at", ["check", "admit"])
+def test_rejected_renditions_link_no_cached_outputs(db, tmp_path, monkeypatch, rejected_at):
+    import asyncio
+    import models.models as models
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from main import _convert_renditions, _video_content_key
+    from services import admission, dedup, extractor, jobs, storage
+
+    profiles = extractor.get_profiles(["opus-32k", "aac-128k"])
+    options = extractor.ClipOptions()
+    storage.outputs.save_bytes(b"opus", "cached.opus")
+    dedup.register_blob(db, _video_content_key("digest", profiles[0], options), "cached.opus", 4)
+    db.commit()
+    input_path = tmp_path / "input.mp4"
+    input_path.write_bytes(b"video")
+
+    def busy(*args, **kwargs):
+        raise admission.AdmissionRejected(429, "You already have 4 conversions in progress", 1)
+
+    monkeypatch.setattr(admission.video, rejected_at, busy)
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        try:
+            async with async_sessionmaker(async_engine, expire_on_commit=False)() as session:
+                job = jobs.new_job(1, "video_to_audio", original_name="talk.mp4")
+                await _convert_renditions(job, str(input_path), "digest", profiles, session, options)
+        finally:
+            await async_engine.dispose()
+
+    with pytest.raises(admission.AdmissionRejected):
+        asyncio.run(run())
+    db.expire_all()
+    assert db.query(models.MediaFile).count() == 0
+    assert db.query(models.OutputBlob.ref_count).scalar() == 1
+
+
+@pytest.fixture
+def app_db(db, tmp_path):
+    """Route the app's async sessions to the test database of the db fixture"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from databases.database import get_async_db
+
+    async def test_db():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        try:
+            async with async_sessionmaker(async_engine, expire_on_commit=False)() as session:
+                yield session
+        finally:
+            await async_engine.dispose()
+
+    app.dependency_overrides[get_async_db] = test_db
+    try:
+        yield db
+    finally:
+        app.dependency_overrides.pop(get_async_db, None)
+
+
+def test_library_archive_counts_distinct_files_owned(app_db):
+    import io
+    import zipfile
+    import models.models as models
+    from services import storage
+    from services.auth_cache import Principal, token_cache
+
+    storage.outputs.save_bytes(b"shared audio", "a.mp3")
+    # The same video uploaded twice: two rows sharing one stored file
+    for original_name in ("talk.mp4", "talk-again.mp4"):
+        app_db.add(models.MediaFile(user_id=9007, filename="a.mp3", original_name=original_name,
+                                    file_type="video_to_audio"))
+    app_db.commit()
+
+    token_cache.put("library-token", Principal(id=9007, email="library@example.com"))
+    headers = {"Authorization": "Bearer library-token"}
+    missing = client.post("/my-files/archive", json={"filenames": ["a.mp3", "b.mp3"]}, headers=headers)
+    assert missing.status_code == 404
+    response = client.post("/my-files/archive", json={"filenames": ["a.mp3"]}, headers=headers)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["talk.mp3"]
+
+
+def test_my_files_pages_through_files_sharing_a_timestamp(app_db):
+    from datetime import datetime
+    import models.models as models
+    from services.auth_cache import Principal, token_cache
+
+    # Bulk imports give many rows one created_at; only the id tells them apart
+    created = [datetime(2025, 3, 1)] + [datetime(2025, 2, 1)] * 5 + [datetime(2025, 1, 1)]
+    files = [models.MediaFile(user_id=9008, filename=f"{i}.mp3", file_type="video_to_audio", created_at=at)
+             for i, at in enumerate(created)]
+    app_db.add_all(files + [models.MediaFile(user_id=9009, filename="other.mp3", file_type="video_to_audio",
+                                             created_at=datetime(2025, 2, 1))])
+    app_db.commit()
+    expected = [f.filename for f in sorted(files, key=lambda f: (f.created_at, f.id), reverse=True)]
+
+    token_cache.put("pages-token", Principal(id=9008, email="pages@example.com"))
+    seen = []
+    cursor = None
+    for _ in range(len(files)):
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/my-files", params=params, headers={"Authorization": "Bearer pages-token"}).json()
+        seen += [f["filename"] for f in page["files"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+    assert cursor is None
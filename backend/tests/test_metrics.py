@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from services import downloads, metrics, storage
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(f"mediaconverter_{name}", labels) or 0
+
+
+def test_requests_are_labelled_by_route_template(tmp_path):
+    store = storage.LocalShardedStorage(str(tmp_path))
+    store.save_bytes(b"x" * 1000, "song.mp3")
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/files/{name}")
+    def serve(name: str, request: Request):
+        stored = store.stat("song.mp3")
+        return metrics.count_download(downloads.file_response(request, store, stored, "audio/mpeg", name))
+
+    labels = {"method": "GET", "route": "/files/{name}", "status": "206"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    sent = sample("download_bytes_total")
+    client = TestClient(app)
+    for name in ("a.mp3", "b.mp3"):
+        assert client.get(f"/files/{name}", headers={"Range": "bytes=0-99"}).status_code == 206
+    assert client.get("/missing").status_code == 404
+
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+    assert sample("download_bytes_total") == sent + 200
+
+
+def test_stage_helpers():
+    before = sample("conversion_stage_seconds_count", kind="test", stage="probe")
+    with metrics.stage("test", "probe"):
+        pass
+    metrics.observe_stages("test", {"probe": 0.5, "extract": 1.5})
+    metrics.count_bytes("test", "out", 2048)
+    metrics.count_bytes("test", "out", None)
+
+    assert sample("conversion_stage_seconds_count", kind="test", stage="probe") == before + 2
+    assert sample("conversion_stage_seconds_sum", kind="test", stage="extract") >= 1.5
+    assert sample("conversion_bytes_total", kind="test", direction="out") == 2048
+
+
+def test_metrics_endpoint_exports_service_stats():
+    from main import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for name in ("jobs_pending", "db_pool_checkouts_total", "sweeper_runs_total", "auth_cache_lookups_total",
+                 "admission_queued", "admission_rejected_total"):
+        assert f"mediaconverter_{name}" in response.text
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from services import readiness
+
+
+def test_ready_once_required_steps_succeed_and_warm_ups_finish(monkeypatch):
+    monkeypatch.setattr(readiness, "RETRY_SECONDS", 0)
+    attempts = []
+    order = []
+
+    def database():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("database is starting up")
+
+    def broken_engine():
+        raise RuntimeError("engine missing")
+
+    async def scenario():
+        tracker = readiness.Readiness()
+        assert not tracker.ready
+        tracker.start(
+            required={"database": database},
+            optional={"ffmpeg": lambda: order.append("ffmpeg"), "tts": broken_engine},
+            after_required=lambda: order.append("sweeper"),
+        )
+        assert not tracker.ready
+        await tracker._task
+        return tracker
+
+    tracker = asyncio.run(scenario())
+    snapshot = tracker.snapshot()
+    assert snapshot["ready"]
+    assert len(attempts) == 3
+    assert order == ["sweeper", "ffmpeg"]
+    steps = snapshot["steps"]
+    assert (steps["database"]["status"], steps["database"]["error"]) == (readiness.READY, None)
+    assert (steps["tts"]["status"], steps["tts"]["error"]) == (readiness.FAILED, "engine missing")
+
+
+def test_ready_endpoint_reports_503_until_ready(monkeypatch):
+    import main
+
+    tracker = readiness.Readiness()
+    monkeypatch.setattr(readiness, "readiness", tracker)
+    client = TestClient(main.app)
+    assert client.get("/ready").status_code == 503
+    tracker._set("database", status=readiness.READY, required=True, seconds=0.1, error=None)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["steps"]["database"]["status"] == "ready"
@@ -0,0 +1,133 @@
+import io
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from services import storage
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """In-process stand-in for the subset of the boto3 S3 client that S3Storage uses"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _record(self, name):
+        with self._lock:
+            self.calls.append(name)
+
+    def put_object(self, Bucket, Key, Body):
+        self._record("put_object")
+        data = Body if isinstance(Body, bytes) else Body.read()
+        self.objects[(Bucket, Key)] = (data, datetime.now(timezone.utc))
+
+    def create_multipart_upload(self, Bucket, Key):
+        self._record("create_multipart_upload")
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._record("upload_part")
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._record("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts)
+        self.objects[(Bucket, Key)] = (b"".join(parts[n] for n in numbers), datetime.now(timezone.utc))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._record("abort_multipart_upload")
+        self.uploads.pop(UploadId, None)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("404")
+        data, modified = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "LastModified": modified, "ETag": f'"{hash(data):x}"'}
+
+    def get_object(self, Bucket, Key, Range=None):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        data = self.objects[(Bucket, Key)][0]
+        if Range:
+            first, last = Range[len("bytes="):].split("-")
+            data = data[int(first):int(last) + 1 if last else None]
+        return {"Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        for entry in Delete["Objects"]:
+            self.objects.pop((Bucket, entry["Key"]), None)
+        return {}
+
+
+def test_local_storage_shards_and_reads_legacy_files(tmp_path):
+    store = storage.LocalShardedStorage(str(tmp_path))
+    store.save_bytes(b"0123456789", "a.mp3")
+    path = store.path("a.mp3")
+    assert os.path.relpath(path, tmp_path).count(os.sep) == 2
+    assert b"".join(store.iter_range("a.mp3", 2, 3)) == b"234"
+
+    (tmp_path / "legacy.mp3").write_bytes(b"old")
+    assert store.stat("legacy.mp3").size == 3
+    assert store.migrate_flat() == 1
+    assert os.path.exists(store.path("legacy.mp3"))
+    assert store.delete_many(["a.mp3", "legacy.mp3", "missing.mp3"]) == (2, 0)
+    assert not store.exists("a.mp3")
+    with pytest.raises(ValueError):
+        store.path("../escape.mp3")
+
+
+def test_s3_storage_uploads_large_files_in_parts(tmp_path):
+    client = FakeS3Client()
+    store = storage.S3Storage("bucket", "outputs/", client=client, multipart_threshold=10, part_size=4)
+    source = tmp_path / "big.m4a"
+    source.write_bytes(b"abcdefghijklmn")
+    store.save_file(str(source), "big.m4a")
+    assert not source.exists()
+    assert client.calls.count("upload_part") == 4
+    assert client.objects[("bucket", "outputs/big.m4a")][0] == b"abcdefghijklmn"
+
+    stored = store.stat("big.m4a")
+    assert stored.size == 14
+    assert b"".join(store.iter_range("big.m4a", 4, 6, chunk_size=4)) == b"efghij"
+    assert store.stat("missing.m4a") is None
+    with pytest.raises(FileNotFoundError):
+        list(store.iter_range("missing.m4a"))
+    assert store.delete_many(["big.m4a"]) == (1, 0)
+    assert not client.objects
+
+
+def test_failed_multipart_upload_is_aborted(tmp_path):
+    client = FakeS3Client()
+
+    def fail(**kwargs):
+        raise FakeS3Error("InternalError")
+
+    client.complete_multipart_upload = fail
+    store = storage.S3Storage("bucket", client=client, multipart_threshold=1, part_size=4)
+    source = tmp_path / "out.mp3"
+    source.write_bytes(b"x" * 10)
+    with pytest.raises(FakeS3Error):
+        store.save_file(str(source), "out.mp3")
+    assert client.calls[-1] == "abort_multipart_upload"
+    assert not client.uploads
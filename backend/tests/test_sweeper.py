@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models.models as models
+from services import dedup, sweeper
+
+OLD = datetime.utcnow() - timedelta(days=10)
+
+
+def make_output(name):
+    with open(os.path.join("outputs", name), "wb") as f:
+        f.write(b"audio")
+    return name
+
+
+def add_file(db, user, filename, created_at, file_type="video_to_audio", key=None):
+    db.add(models.MediaFile(filename=filename, file_type=file_type, file_size=5,
+                            user_id=user.id, content_key=key, created_at=created_at))
+
+
+def setup_user(db):
+    user = models.User(email="sweep@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def test_shared_blob_is_kept_until_last_reference_expires(db):
+    user = setup_user(db)
+    blob = dedup.register_blob(db, "k", make_output("shared.m4a"), 5)
+    dedup.find_blob(db, "k")  # second reference
+    add_file(db, user, "shared.m4a", OLD, key="k")
+    add_file(db, user, "shared.m4a", datetime.utcnow(), key="k")
+    add_file(db, user, make_output("legacy.mp3"), OLD)
+    db.commit()
+
+    count, orphaned = sweeper.reclaim_batch(db, None, datetime.utcnow() - timedelta(hours=1), 100)
+    db.commit()
+    assert count == 2
+    assert orphaned == ["legacy.mp3"]
+    db.refresh(blob)
+    assert blob.ref_count == 1
+    assert db.query(models.MediaFile).count() == 1
+
+
+def test_batches_are_bounded_and_blobs_released(db):
+    user = setup_user(db)
+    dedup.register_blob(db, "k", make_output("shared.m4a"), 5)
+    for _ in range(2):
+        dedup.find_blob(db, "k")
+    for i in range(3):
+        add_file(db, user, "shared.m4a", OLD + timedelta(minutes=i), key="k")
+    db.commit()
+
+    cutoff = datetime.utcnow()
+    assert sweeper.reclaim_batch(db, None, cutoff, 2) == (2, [])
+    assert sweeper.reclaim_batch(db, None, cutoff, 2) == (1, ["shared.m4a"])
+    db.commit()
+    assert db.query(models.OutputBlob).count() == 0
+    assert sweeper.delete_files(["shared.m4a", "missing.mp3"]) == (1, 0)
+
+
+def test_type_override_excludes_type_from_default_rule(db, monkeypatch):
+    monkeypatch.setattr(sweeper, "RETENTION_HOURS_BY_TYPE", {"text_to_audio": 0})
+    user = setup_user(db)
+    add_file(db, user, make_output("speech.mp3"), OLD, file_type="text_to_audio")
+    add_file(db, user, make_output("track.mp3"), OLD)
+    db.commit()
+
+    assert [rule[0] for rule in sweeper.retention_rules()] == [None]
+    assert sweeper.reclaim_batch(db, None, datetime.utcnow(), 100) == (1, ["track.mp3"])
+
+
+def test_sweep_pass_records_stats(db, tmp_path):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    user = setup_user(db)
+    for i in range(5):
+        add_file(db, user, make_output(f"{i}.mp3"), OLD)
+    db.commit()
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        try:
+            job = sweeper.Sweeper(async_sessionmaker(async_engine), interval_seconds=60, batch_size=2)
+            return job, await job.sweep()
+        finally:
+            await async_engine.dispose()
+
+    job, rows = asyncio.run(run())
+    assert rows == 5
+    assert os.listdir("outputs") == []
+    stats = job.stats.snapshot()
+    assert (stats["runs"], stats["rows_deleted"], stats["files_deleted"]) == (1, 5, 5)
@@ -32,7 +32,7 @@ def test_token_authentication():
         
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ SUCCESS! Found {data['total']} files")
+            print(f"✅ SUCCESS! Found {len(data['files'])} files")
             for file in data['files']:
                 print(f"   - {file['filename']}")
         else:
@@ -0,0 +1,181 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import tts
+
+
+class FakeEngine(tts.TTSEngine):
+    """Offline stand-in that renders text to deterministic bytes"""
+    name = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    def synthesize(self, text, language):
+        self.calls.append((text, language))
+        return f"{language}:{text}".encode("utf-8")
+
+
+def test_repeat_requests_skip_the_engine():
+    engine = FakeEngine()
+    cache = tts.SynthesisCache(max_bytes=1024, max_item_bytes=1024)
+    first = tts.synthesize("Your  order\nhas shipped", "en", engine=engine, cache=cache)
+    second = tts.synthesize(" Your order has shipped ", "en", engine=engine, cache=cache)
+    assert first == second == b"en:Your order has shipped"
+    assert engine.calls == [("Your order has shipped", "en")]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_language_and_engine_are_part_of_the_key():
+    engine = FakeEngine()
+    cache = tts.SynthesisCache(max_bytes=1024, max_item_bytes=1024)
+    tts.synthesize("hello", "en", engine=engine, cache=cache)
+    tts.synthesize("hello", "fr", engine=engine, cache=cache)
+    other = FakeEngine()
+    other.name = "other"
+    tts.synthesize("hello", "en", engine=other, cache=cache)
+    assert len(engine.calls) == 2
+    assert len(other.calls) == 1
+
+
+def test_lru_eviction_by_size():
+    cache = tts.SynthesisCache(max_bytes=10, max_item_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "b" is now least recently used
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
+    assert cache.stats()["bytes"] == 8
+    assert cache.evictions == 1
+
+
+def test_oversized_items_are_not_cached():
+    cache = tts.SynthesisCache(max_bytes=100, max_item_bytes=4)
+    cache.put("big", b"12345")
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 0
+
+
+class SlowEngine(FakeEngine):
+    """Fake engine that records how many syntheses overlap"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def synthesize(self, text, language):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return super().synthesize(text, language)
+
+
+def test_split_text_prefers_sentence_boundaries():
+    text = "One two. Three four five! Six? " + "word " * 10
+    chunks = tts.split_text(text, 20)
+    assert chunks[:2] == ["One two.", "Three four five!"]
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_split_text_cuts_overlong_words():
+    assert tts.split_text("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_strip_id3():
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x02ab"
+    assert tts.strip_id3(tag + b"\xff\xfbframes") == b"\xff\xfbframes"
+    assert tts.strip_id3(b"\xff\xfbframes" + b"TAG" + b"\x00" * 125) == b"\xff\xfbframes"
+
+
+def test_long_text_is_synthesized_concurrently_in_order():
+    engine = SlowEngine(delay=0.05)
+    cache = tts.SynthesisCache(max_bytes=1 << 20, max_item_bytes=1 << 20)
+    sentences = [f"Sentence number {i}." for i in range(8)]
+    audio = tts.synthesize_long(" ".join(sentences), "en", engine=engine, cache=cache, max_chars=25)
+    assert audio == b"".join(f"en:{sentence}".encode() for sentence in sentences)
+    assert len(engine.calls) == 8
+    assert 1 < engine.max_active <= tts.TTS_PARALLELISM
+
+
+def test_short_text_is_a_single_synthesis():
+    engine = FakeEngine()
+    cache = tts.SynthesisCache(max_bytes=1024, max_item_bytes=1024)
+    assert tts.synthesize_long("Hi. There.", "en", engine=engine, cache=cache) == b"en:Hi. There."
+    assert engine.calls == [("Hi. There.", "en")]
+
+
+def test_engine_registry():
+    assert tts.get_engine("gtts").name == "gtts"
+    with pytest.raises(tts.UnknownEngineError):
+        tts.get_engine("nope")
+    engine = FakeEngine()
+    engine.name = "stub"
+    tts.register_engine(engine)
+    try:
+        assert tts.get_engine("stub") is engine
+    finally:
+        tts.ENGINES.pop("stub")
+
+
+@pytest.mark.skipif(not tts.EspeakEngine().available(), reason="espeak-ng is not installed")
+def test_espeak_engine_renders_mp3():
+    audio = tts.EspeakEngine().synthesize("Hello world.", "en")
+    assert audio[:3] == b"ID3" or audio[:2] == b"\xff\xfb"
+
+
+class ToneEngine(tts.TTSEngine):
+    """Renders every chunk as one second of LAME-encoded MP3, Info header included"""
+    name = "tone"
+
+    def synthesize(self, text, language):
+        from services.extractor import ffmpeg_exe
+
+        # ffmpeg only writes the Info frame to seekable output, as gTTS's encoder does
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "tone.mp3")
+            subprocess.run(
+                [ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-f", "lavfi",
+                 "-i", "sine=frequency=440:duration=1", "-c:a", "libmp3lame", "-b:a", "64k", path],
+                check=True,
+            )
+            with open(path, "rb") as f:
+                return f.read()
+
+
+def test_joined_chunks_report_the_total_duration(tmp_path):
+    from services import extractor
+
+    cache = tts.SynthesisCache(max_bytes=1 << 20, max_item_bytes=1 << 20)
+    single = ToneEngine().synthesize("x", "en")
+    assert b"Info" in single[:200] or b"Xing" in single[:200]
+    audio = tts.synthesize_long("One. Two. Three.", "en", engine=ToneEngine(), cache=cache, max_chars=6)
+    assert b"Info" not in audio and b"Xing" not in audio
+
+    path = tmp_path / "joined.mp3"
+    path.write_bytes(audio)
+    assert extractor.probe(str(path)).duration == pytest.approx(3.0, abs=0.2)
+
+
+def test_strip_vbr_header_keeps_other_data():
+    assert tts.strip_vbr_header(b"en:plain text") == b"en:plain text"
+    frame = tts.strip_id3(ToneEngine().synthesize("x", "en"))
+    stripped = tts.strip_vbr_header(frame)
+    assert 0 < len(frame) - len(stripped) < 1000
+    assert tts.strip_vbr_header(stripped) == stripped
@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services import uploads
+
+
+def test_upload_store_tracks_offset_and_expiry(tmp_path):
+    store = uploads.UploadStore(str(tmp_path / "resumable"), max_bytes=100, expiry_seconds=60)
+    upload = store.create(7, 10, uploads.parse_metadata("filename " + base64.b64encode(b"a/b.mp4").decode()))
+    assert upload.filename == "b.mp4"
+    with store.writing(upload, 0) as f:
+        f.write(b"hello")
+        with pytest.raises(uploads.UploadConflictError):
+            with store.writing(upload, 0):
+                pass
+    resumed = store.get(upload.id)
+    assert (resumed.offset, resumed.length, resumed.user_id) == (5, 10, 7)
+    with pytest.raises(uploads.UploadConflictError):
+        with store.writing(resumed, 0):
+            pass
+
+    with store.writing(resumed, 5) as f:
+        f.write(b"world")
+    input_path = store.finish(resumed, str(tmp_path))
+    store.mark_complete(resumed, "job-1")
+    assert open(input_path, "rb").read() == b"helloworld"
+    assert store.get(upload.id).job_id == "job-1"
+    assert store.get("../../etc/passwd") is None
+
+    assert store.remove_expired(now=store.expires_at(resumed) - 1) == 0
+    assert store.remove_expired(now=store.expires_at(resumed) + 1) == 1
+    assert store.get(upload.id) is None
+    with pytest.raises(uploads.InvalidUploadError):
+        store.create(7, 101, {})
+
+
+def test_parse_checksum():
+    hasher, expected = uploads.parse_checksum("sha1 " + base64.b64encode(hashlib.sha1(b"x").digest()).decode())
+    hasher.update(b"x")
+    assert hasher.digest() == expected
+    assert uploads.parse_checksum(None) is None
+    with pytest.raises(uploads.InvalidUploadError):
+        uploads.parse_checksum("crc32 AAAA")
+
+
+def test_patch_resumes_and_rejects_bad_chunks(tmp_path, monkeypatch):
+    from main import app
+    from services.auth_cache import Principal, token_cache
+
+    monkeypatch.setattr(uploads, "store", uploads.UploadStore(str(tmp_path), max_bytes=1000, expiry_seconds=60))
+    token_cache.put("uploads-token", Principal(id=9100, email="uploads@example.com"))
+    headers = {"Authorization": "Bearer uploads-token", "Tus-Resumable": uploads.TUS_VERSION}
+    client = TestClient(app)
+
+    response = client.post("/uploads", headers={**headers, "Upload-Length": "8"})
+    assert response.status_code == 201
+    url = response.headers["location"].removeprefix("http://localhost:8000")
+    patch = {**headers, "Content-Type": "application/offset+octet-stream"}
+
+    assert client.patch(url, content=b"1234", headers={**patch, "Upload-Offset": "0"}).headers["upload-offset"] == "4"
+    assert client.patch(url, content=b"1234", headers={**patch, "Upload-Offset": "0"}).status_code == 409
+    wrong = "sha256 " + base64.b64encode(hashlib.sha256(b"nope").digest()).decode()
+    response = client.patch(url, content=b"5678", headers={**patch, "Upload-Offset": "4", "Upload-Checksum": wrong})
+    assert response.status_code == 460
+    assert client.head(url, headers=headers).headers["upload-offset"] == "4"
+    too_long = client.patch(url, content=b"56789", headers={**patch, "Upload-Offset": "4"})
+    assert too_long.status_code == 400
+    assert client.head(url, headers=headers).headers["upload-offset"] == "4"
+
+    assert client.post("/uploads", headers={**headers, "Upload-Length": "1001"}).status_code == 413
+    assert client.head(url, headers={"Authorization": "Bearer uploads-token", "Tus-Resumable": "0.2.2"}).status_code == 412
+    assert client.delete(url, headers=headers).status_code == 204
+    assert client.head(url, headers=headers).status_code == 404
+
+
+def test_finished_upload_is_held_back_while_over_the_admission_limits(tmp_path, monkeypatch):
+    import main
+    from services import admission
+    from services.auth_cache import Principal, token_cache
+
+    monkeypatch.setattr(uploads, "store", uploads.UploadStore(str(tmp_path), max_bytes=1000, expiry_seconds=60))
+    token_cache.put("limits-token", Principal(id=9101, email="limits@example.com"))
+    headers = {"Authorization": "Bearer limits-token", "Tus-Resumable": uploads.TUS_VERSION}
+    patch = {**headers, "Content-Type": "application/offset+octet-stream", "Upload-Offset": "4"}
+    client = TestClient(main.app)
+    url = client.post("/uploads", headers={**headers, "Upload-Length": "4"}).headers["location"]
+    url = url.removeprefix("http://localhost:8000")
+
+    # Other uploads of this user were queued since this one was created
+    def over_limit(user_id=None):
+        raise admission.AdmissionRejected(429, "You already have 4 conversions in progress", 9)
+
+    with monkeypatch.context() as over:
+        over.setattr(admission.video, "check", over_limit)
+        response = client.patch(url, content=b"1234", headers={**patch, "Upload-Offset": "0"})
+    assert response.status_code == 429
+    assert (response.headers["retry-after"], response.headers["upload-offset"]) == ("9", "4")
+    assert "job-id" not in client.head(url, headers=headers).headers
+
+    finished = []
+
+    async def convert(upload, db):
+        finished.append(upload.id)
+
+    monkeypatch.setattr(main, "_convert_finished_upload", convert)
+    assert client.patch(url, content=b"", headers=patch).status_code == 204
+    assert finished == [url.rsplit("/", 1)[1]]
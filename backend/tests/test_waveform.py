@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from services import extractor, waveform
+
+
+@pytest.fixture
+def tone(tmp_path):
+    """Two seconds of MP3: one of silence, then a 440 Hz tone at half scale"""
+    path = tmp_path / "tone.mp3"
+    subprocess.run(
+        [extractor.ffmpeg_exe(), "-loglevel", "error", "-y", "-f", "lavfi",
+         "-i", "aevalsrc='if(gte(t,1),0.5*sin(2*PI*440*t),0)':s=44100:d=2", str(path)],
+        check=True,
+    )
+    return str(path)
+
+
+def test_peaks_follow_the_signal_at_every_resolution(tone):
+    peaks = waveform.compute(tone)
+    assert peaks.duration == pytest.approx(2.0, abs=0.1)
+    # 2 s at 8 kHz is 500 blocks, so the finer levels stop there
+    assert [len(level) for level in peaks.levels] == [32, 64, 128, 256, 500]
+
+    halves = peaks.at(2)
+    assert np.abs(halves[0]).max() <= 2
+    assert halves[1, 0] == pytest.approx(-64, abs=4)
+    assert halves[1, 1] == pytest.approx(63, abs=4)
+    assert len(peaks.at(100)) == 100
+    assert len(peaks.at(10_000)) == 500
+
+    decoded = waveform.Peaks.decode(peaks.encode())
+    assert decoded.duration == pytest.approx(peaks.duration)
+    assert np.array_equal(decoded.at(100), peaks.at(100))
+
+
+def test_peaks_from_bytes_match_the_file_and_bad_audio_is_skipped(tone):
+    with open(tone, "rb") as f:
+        data = f.read()
+    # Piped MP3 cannot seek to its gapless header, so the edges may differ by a frame
+    piped, read = waveform.compute(data=data), waveform.compute(tone)
+    assert piped.duration == pytest.approx(read.duration, abs=0.1)
+    for peaks in (piped, read):
+        quarters = peaks.at(4)
+        assert np.abs(quarters[0]).max() <= 2
+        assert quarters[3, 1] == pytest.approx(63, abs=4)
+    assert waveform.compute_encoded(data=b"not audio") == (None, pytest.approx(0, abs=5))
+
+
+def test_waveform_query_only_answers_from_the_files_own_blob(db):
+    import models.models as models
+    from main import _waveform_query
+
+    db.add_all([
+        models.OutputBlob(content_key="k1", filename="a.mp3", ref_count=1, waveform=b"peaks of a"),
+        # k2 was re-registered with another file; the old row still names b.mp3
+        models.OutputBlob(content_key="k2", filename="c.mp3", ref_count=1, waveform=b"peaks of c"),
+        models.MediaFile(user_id=1, filename="a.mp3", content_key="k1"),
+        models.MediaFile(user_id=1, filename="b.mp3", content_key="k2"),
+    ])
+    db.commit()
+    assert db.execute(_waveform_query("a.mp3", 1)).scalar() == b"peaks of a"
+    assert db.execute(_waveform_query("a.mp3", 2)).scalar() is None
+    assert db.execute(_waveform_query("b.mp3", 1)).scalar() is None
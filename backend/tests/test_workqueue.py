@@ -0,0 +1,97 @@
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.orm import sessionmaker
+
+import pytest
+
+import models.models as models
+from services import admission, jobs, storage, workqueue
+from tests.test_extractor import make_video
+
+
+def queue_job(db, input_path=None, **kwargs):
+    job = jobs.new_job(1, "video_to_audio", original_name="v.mp4")
+    job.input_path = input_path
+    job.content_key = "key-" + job.id
+    return workqueue.enqueue(db, job, **kwargs)
+
+
+def test_claim_leases_retries_and_takes_over_expired_jobs(db):
+    job = queue_job(db)
+    first = workqueue.claim(db, "w1")
+    assert (first.id, first.status, first.attempts, first.locked_by) == (job.id, jobs.RUNNING, 1, "w1")
+    assert workqueue.claim(db, "w2") is None
+
+    version = workqueue.get(db, job.id).version
+    assert workqueue.heartbeat(db, job.id, "w1", (40.0, 12.0))
+    seen = workqueue.get(db, job.id)
+    assert (seen.current_status, seen.percent, seen.eta_seconds, seen.version) == (jobs.RUNNING, 40.0, 12.0, version + 1)
+
+    # A transient failure is retried after a backoff, by whichever worker gets there first
+    assert workqueue.fail(db, first, "w1", "disk full") is False
+    assert workqueue.get(db, job.id).status == jobs.QUEUED
+    assert workqueue.claim(db, "w2") is None
+    later = datetime.utcnow() + timedelta(seconds=workqueue.RETRY_BACKOFF_SECONDS + 1)
+    second = workqueue.claim(db, "w2", now=later)
+    assert (second.attempts, second.locked_by) == (2, "w2")
+
+    # w2 stops heartbeating: its lease runs out and w3 takes the job over
+    expired = later + timedelta(seconds=workqueue.VISIBILITY_TIMEOUT_SECONDS + 1)
+    third = workqueue.claim(db, "w3", now=expired)
+    assert (third.attempts, third.locked_by) == (3, "w3")
+    assert workqueue.heartbeat(db, job.id, "w2") is False
+    assert workqueue.fail(db, second, "w2", "late") is False
+
+    # Dying on the last attempt fails the job for good
+    assert workqueue.claim(db, "w4", now=expired + timedelta(seconds=workqueue.VISIBILITY_TIMEOUT_SECONDS + 1)) is None
+    failed = workqueue.get(db, job.id)
+    assert (failed.status, failed.error) == (jobs.FAILED, "Worker stopped responding")
+    assert failed.finished_at is not None
+
+
+def test_invalid_input_is_not_retried(db):
+    job = queue_job(db)
+    claimed = workqueue.claim(db, "w1")
+    assert workqueue.fail(db, claimed, "w1", "no audio", retry=False) is True
+    assert workqueue.get(db, job.id).status == jobs.FAILED
+    assert workqueue.claim(db, "w1", now=datetime.utcnow() + timedelta(days=1)) is None
+
+
+def test_admission_limits_count_the_jobs_in_the_table(db):
+    controller = admission.AdmissionController("test", max_active=1, max_queue=2, max_per_user=2)
+    queue_job(db)
+    queue_job(db)
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        workqueue.check_admission(db, 1, controller)
+    assert (rejected.value.status_code, rejected.value.retry_after) == (429, 1)
+
+    # Another user is turned away while two jobs wait for a worker...
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        workqueue.check_admission(db, 2, controller)
+    assert rejected.value.status_code == 503
+    # ...and admitted once a worker has taken one of them
+    workqueue.claim(db, "w1")
+    workqueue.check_admission(db, 2, controller)
+    assert controller.stats()["rejected"] == {"queue_full": 1, "per_user": 1, "timeout": 0}
+
+
+def test_worker_converts_and_records_media_files(db, tmp_path):
+    from worker import Worker
+
+    os.makedirs(storage.STORAGE_SCRATCH_DIR, exist_ok=True)
+    input_path = make_video(tmp_path / "input.mp4", "aac")
+    job = queue_job(db, input_path)
+    worker = Worker(1, worker_id="test-worker", session_factory=sessionmaker(bind=db.get_bind()))
+
+    assert worker.run_once() is True
+    assert worker.run_once() is False
+    done = workqueue.get(db, job.id)
+    assert (done.status, done.percent, done.error) == (jobs.COMPLETED, 100.0, None)
+    assert not os.path.exists(input_path)
+    media_file = db.get(models.MediaFile, done.media_file_id)
+    assert (media_file.filename, media_file.content_key) == (done.output_filename, job.content_key)
+    assert storage.outputs.exists(media_file.filename)
+    assert [j.id for j in workqueue.for_user(db, 1)] == [job.id]
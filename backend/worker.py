@@ -0,0 +1,164 @@
+"""Standalone conversion worker for JOB_BACKEND=database.
+
+Claims video conversions queued in the conversion_jobs table, runs them and
+records the results, so encoding capacity scales by starting more of these
+(on any host that shares the database, uploads/ and storage) instead of
+more API processes:
+
+    JOB_BACKEND=database python worker.py
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+# Load env vars immediately
+load_dotenv()
+
+import models.models as models
+from databases.database import engine, SessionLocal, add_missing_columns, add_missing_indexes
+from services import extractor, jobs, progress, storage, workqueue
+
+# Jobs converted at once by this worker; each runs its own ffmpeg
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(jobs.CONVERSION_WORKERS)))
+# How long an idle worker waits before looking for work again
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "1"))
+# How often finished jobs past JOB_RETENTION_MINUTES are deleted
+PRUNE_INTERVAL_SECONDS = 300
+
+
+class Worker:
+    """Runs up to concurrency claimed jobs at a time and keeps their leases alive"""
+
+    def __init__(self, concurrency: int, worker_id: str | None = None, session_factory=SessionLocal):
+        self.concurrency = max(1, concurrency)
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.session_factory = session_factory
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        # Jobs this worker is running, and their latest unpublished progress estimate
+        self._running: set[str] = set()
+        self._progress: dict[str, tuple[float | None, float | None]] = {}
+
+    def run(self) -> None:
+        """Work until stop() is called, then let running jobs finish"""
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True)
+        heartbeat.start()
+        slots = [
+            threading.Thread(target=self._slot_loop, name=f"worker-slot-{i}") for i in range(self.concurrency)
+        ]
+        for slot in slots:
+            slot.start()
+        for slot in slots:
+            slot.join()
+        heartbeat.join()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _slot_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if not self.run_once():
+                    self._stopping.wait(WORKER_POLL_SECONDS)
+            except Exception as e:
+                # e.g. the database is briefly unreachable; try again shortly
+                print(f"Worker {self.id} error: {e}")
+                self._stopping.wait(WORKER_POLL_SECONDS)
+
+    def run_once(self) -> bool:
+        """Claim and run one job; False if none was waiting"""
+        with self.session_factory() as db:
+            job = workqueue.claim(db, self.id)
+        if job is None:
+            return False
+        print(f"Worker {self.id} running job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+        with self._lock:
+            self._running.add(job.id)
+        try:
+            self._run(job)
+        finally:
+            with self._lock:
+                self._running.discard(job.id)
+                self._progress.pop(job.id, None)
+        return True
+
+    def _run(self, job: models.ConversionJob) -> None:
+        output_stem = storage.scratch_path(str(uuid.uuid4()))
+        try:
+            options = extractor.ClipOptions(**(job.options or {}))
+            with progress.tracking_job(job.id, self._record_progress):
+                progress.report(0.0, None)
+                if job.profiles:
+                    result = storage.convert_and_store(
+                        extractor.extract_renditions, job.input_path, output_stem, job.profiles, options
+                    )
+                else:
+                    result = storage.convert_and_store(extractor.extract_audio, job.input_path, output_stem, options)
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            # Bad input fails the same way every time; anything else may be transient
+            retry = not isinstance(e, extractor.InvalidInputError)
+            with self.session_factory() as db:
+                final = workqueue.fail(db, job, self.id, error, retry=retry)
+            print(f"Job {job.id} failed{'' if final else ', will retry'}: {error}")
+            if final:
+                workqueue.remove_input(job.input_path)
+            return
+
+        results = result if isinstance(result, list) else [result]
+        for item in results:
+            extractor.record_timing(item)
+        with self.session_factory() as db:
+            if workqueue.complete(db, job, self.id, results):
+                workqueue.remove_input(job.input_path)
+            else:
+                print(f"Job {job.id} was taken over by another worker; discarded its output")
+
+    def _record_progress(self, job_id: str, position: float, duration: float | None, elapsed: float) -> None:
+        """progress sink: keep the latest estimate for the next heartbeat to publish"""
+        with self._lock:
+            self._progress[job_id] = progress.estimate(position, duration, elapsed)
+
+    def _heartbeat_loop(self) -> None:
+        last_prune = 0.0
+        while not self._stopping.is_set() or self._running:
+            with self._lock:
+                running = list(self._running)
+                estimates = {job_id: self._progress.pop(job_id, None) for job_id in running}
+            try:
+                with self.session_factory() as db:
+                    for job_id in running:
+                        if not workqueue.heartbeat(db, job_id, self.id, estimates[job_id]):
+                            print(f"Worker {self.id} lost its lease on job {job_id}")
+                    if time.monotonic() - last_prune >= PRUNE_INTERVAL_SECONDS:
+                        workqueue.prune(db)
+                        last_prune = time.monotonic()
+            except Exception as e:
+                print(f"Worker {self.id} heartbeat failed: {e}")
+            time.sleep(workqueue.HEARTBEAT_SECONDS)
+
+
+def main() -> None:
+    models.Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    os.makedirs(storage.STORAGE_SCRATCH_DIR, exist_ok=True)
+
+    worker = Worker(WORKER_CONCURRENCY)
+
+    def stop(signum, frame):
+        print(f"Worker {worker.id} stopping after its running jobs finish")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Worker {worker.id} started with {worker.concurrency} slots")
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
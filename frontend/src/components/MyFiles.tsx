@@ -31,19 +31,33 @@ const MyFiles: React.FC = () => {
   const [filterType, setFilterType] = useState("all");
   const { token } = useSelector((state: RootState) => state.auth);
 
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [downloadingAll, setDownloadingAll] = useState(false);
+
+  // The listing is paginated: each page returns a cursor for the next one
+  const fetchPage = async (cursor: string | null) => {
+    const params = new URLSearchParams();
+    if (cursor) params.set("cursor", cursor);
+    if (filterType !== "all") params.set("file_type", filterType);
+    const response = await fetch(`${API_URL}/my-files?${params}`, {
+      headers: {
+        Authorization: `Bearer ${token}`,
+      },
+    });
+
+    if (!response.ok) throw new Error("Failed to fetch files");
+
+    return response.json();
+  };
+
   useEffect(() => {
     const fetchFiles = async () => {
+      setLoading(true);
       try {
-        const response = await fetch(`${API_URL}/my-files`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-
-        if (!response.ok) throw new Error("Failed to fetch files");
-
-        const data = await response.json();
+        const data = await fetchPage(null);
         setFiles(data.files);
+        setNextCursor(data.next_cursor);
       } catch (err: any) {
         setError(err.message);
       } finally {
@@ -52,7 +66,21 @@ const MyFiles: React.FC = () => {
     };
 
     fetchFiles();
-  }, [token]);
+  }, [token, filterType]);
+
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchPage(nextCursor);
+      setFiles((current) => [...current, ...data.files]);
+      setNextCursor(data.next_cursor);
+    } catch (err: any) {
+      setError(err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleDownload = async (file: MediaFile) => {
     try {
@@ -78,6 +106,43 @@ const MyFiles: React.FC = () => {
     }
   };
 
+  // One ZIP built by the server: the files matching the type filter, or the
+  // ones shown when a search narrows the list to loaded pages
+  const handleDownloadAll = async () => {
+    setDownloadingAll(true);
+    try {
+      const body = searchTerm
+        ? { filenames: filteredFiles.map((file) => file.filename) }
+        : filterType === "all"
+          ? {}
+          : { file_type: filterType };
+      const response = await fetch(`${API_URL}/my-files/archive`, {
+        method: "POST",
+        headers: {
+          Authorization: `Bearer ${token}`,
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify(body),
+      });
+
+      if (!response.ok) throw new Error("Download failed");
+
+      const blob = await response.blob();
+      const url = window.URL.createObjectURL(blob);
+      const a = document.createElement("a");
+      a.href = url;
+      a.download = "my-files.zip";
+      document.body.appendChild(a);
+      a.click();
+      window.URL.revokeObjectURL(url);
+      document.body.removeChild(a);
+    } catch (err: any) {
+      setError("Failed to download files: " + err.message);
+    } finally {
+      setDownloadingAll(false);
+    }
+  };
+
   const formatFileSize = (bytes: number) => {
     if (bytes === 0) return "0 Bytes";
     const k = 1024;
@@ -157,6 +222,14 @@ const MyFiles: React.FC = () => {
               <option value="video_to_audio">Video to Audio</option>
             </select>
           </div>
+          <button
+            onClick={handleDownloadAll}
+            disabled={downloadingAll || filteredFiles.length === 0}
+            className="flex items-center justify-center gap-2 px-4 py-2 rounded-xl bg-white/5 hover:bg-white/10 text-slate-300 font-medium transition-colors border border-white/10 disabled:opacity-50"
+          >
+            <Download className="w-4 h-4" />
+            {downloadingAll ? "Preparing..." : "Download all"}
+          </button>
         </div>
       </div>
 
@@ -222,6 +295,15 @@ const MyFiles: React.FC = () => {
             </div>
           ))
         )}
+        {nextCursor && (
+          <button
+            onClick={loadMore}
+            disabled={loadingMore}
+            className="w-full py-3 rounded-xl bg-white/5 hover:bg-white/10 text-slate-300 font-medium transition-colors border border-white/10 disabled:opacity-50"
+          >
+            {loadingMore ? "Loading..." : "Load more"}
+          </button>
+        )}
       </div>
     </div>
   );
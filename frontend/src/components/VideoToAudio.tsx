@@ -1,4 +1,4 @@
-import React, { useState, useRef } from "react";
+import React, { useState, useRef, useEffect } from "react";
 import { useSelector } from "react-redux";
 import type { RootState } from "../service/store";
 import {
@@ -11,16 +11,86 @@ import {
   Play,
 } from "lucide-react";
 import API_URL from "../config";
+import { uploadResumable } from "../service/resumableUpload";
+
+// Larger files go through the resumable upload endpoints
+const RESUMABLE_UPLOAD_BYTES = 16 * 1024 * 1024;
 
 const VideoToAudio: React.FC = () => {
   const [file, setFile] = useState<File | null>(null);
   const [loading, setLoading] = useState(false);
   const [audioUrl, setAudioUrl] = useState<string | null>(null);
+  const [audioExt, setAudioExt] = useState("mp3");
   const [error, setError] = useState("");
   const [dragActive, setDragActive] = useState(false);
+  const [progress, setProgress] = useState<{
+    phase: "upload" | "convert";
+    percent: number | null;
+    eta: number | null;
+  } | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const { token } = useSelector((state: RootState) => state.auth);
 
+  // Follow a job's progress events until it finishes. EventSource reconnects
+  // by itself after a dropped connection; the conversion keeps running.
+  const waitForJob = (jobId: string) =>
+    new Promise<any>((resolve, reject) => {
+      const source = new EventSource(
+        `${API_URL}/jobs/${jobId}/events?access_token=${encodeURIComponent(token ?? "")}`
+      );
+      source.addEventListener("progress", (e) => {
+        const data = JSON.parse((e as MessageEvent).data);
+        setProgress({ phase: "convert", percent: data.percent, eta: data.eta_seconds });
+      });
+      source.addEventListener("completed", (e) => {
+        source.close();
+        resolve(JSON.parse((e as MessageEvent).data));
+      });
+      source.addEventListener("failed", (e) => {
+        source.close();
+        reject(new Error(JSON.parse((e as MessageEvent).data).error || "Conversion failed"));
+      });
+      source.onerror = () => {
+        // Closed for good (e.g. the job expired); otherwise the browser retries
+        if (source.readyState === EventSource.CLOSED) {
+          reject(new Error("Lost track of the conversion"));
+        }
+      };
+    });
+
+  const finishJob = async (jobId: string) => {
+    // Remembered so that a reload resumes watching instead of converting again
+    sessionStorage.setItem("videoToAudioJob", jobId);
+    try {
+      const job = await waitForJob(jobId);
+      // Fetch audio with auth to create blob URL
+      const audioResp = await fetch(job.file.download_url, {
+        headers: { Authorization: `Bearer ${token}` },
+      });
+      if (!audioResp.ok) throw new Error("Failed to load audio");
+      const blob = await audioResp.blob();
+      const blobUrl = URL.createObjectURL(blob);
+      // Audio is stream-copied when possible, so it is not always MP3
+      setAudioExt(job.file.filename.split(".").pop() || "mp3");
+      setAudioUrl(blobUrl);
+    } finally {
+      sessionStorage.removeItem("videoToAudioJob");
+    }
+  };
+
+  useEffect(() => {
+    const jobId = sessionStorage.getItem("videoToAudioJob");
+    if (!jobId || !token) return;
+    setLoading(true);
+    finishJob(jobId)
+      .catch((err) => setError(err.message))
+      .finally(() => {
+        setLoading(false);
+        setProgress(null);
+      });
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files[0]) {
       setFile(e.target.files[0]);
@@ -35,10 +105,17 @@ const VideoToAudio: React.FC = () => {
     setLoading(true);
     setError("");
 
-    const formData = new FormData();
-    formData.append("file", file);
-
     try {
+      if (file.size >= RESUMABLE_UPLOAD_BYTES) {
+        const jobId = await uploadResumable(file, token ?? "", (sent, total) =>
+          setProgress({ phase: "upload", percent: (sent / total) * 100, eta: null })
+        );
+        await finishJob(jobId);
+        return;
+      }
+
+      const formData = new FormData();
+      formData.append("file", file);
       const response = await fetch(`${API_URL}/convert/video-to-audio`, {
         method: "POST",
         headers: {
@@ -52,19 +129,14 @@ const VideoToAudio: React.FC = () => {
         throw new Error(errData.detail || "Conversion failed");
       }
 
-      const data = await response.json();
-      // Fetch audio with auth to create blob URL
-      const audioResp = await fetch(data.url, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      if (!audioResp.ok) throw new Error("Failed to load audio");
-      const blob = await audioResp.blob();
-      const blobUrl = URL.createObjectURL(blob);
-      setAudioUrl(blobUrl);
+      // Conversion runs as a background job that reports its progress
+      const job = await response.json();
+      await finishJob(job.job_id);
     } catch (err: any) {
       setError(err.message);
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -188,7 +260,11 @@ const VideoToAudio: React.FC = () => {
             {loading ? (
               <>
                 <Loader2 className="w-6 h-6 animate-spin" />
-                Extracting Audio...
+                {progress?.phase === "upload" ? "Uploading" : "Extracting Audio"}
+                {progress?.percent != null ? ` ${Math.round(progress.percent)}%` : "..."}
+                {progress?.eta != null && progress.eta > 0
+                  ? ` (about ${Math.ceil(progress.eta)}s left)`
+                  : ""}
               </>
             ) : (
               <>
@@ -219,11 +295,11 @@ const VideoToAudio: React.FC = () => {
                   <audio src={audioUrl} controls className="w-full" />
                   <a
                     href={audioUrl}
-                    download={`extracted-${file?.name.split(".")[0]}.mp3`}
+                    download={`extracted-${file?.name.split(".")[0]}.${audioExt}`}
                     className="flex items-center justify-center gap-2 w-full py-2.5 rounded-xl bg-white/5 hover:bg-white/10 text-white font-medium transition-colors border border-white/10"
                   >
                     <Download className="w-4 h-4" />
-                    Download MP3
+                    Download {audioExt.toUpperCase()}
                   </a>
                 </div>
               </>
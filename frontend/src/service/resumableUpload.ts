@@ -0,0 +1,111 @@
+import API_URL from "../config";
+
+const TUS_VERSION = "1.0.0";
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_RETRIES = 5;
+
+const toBase64 = (bytes: Uint8Array) => {
+  let binary = "";
+  bytes.forEach((byte) => (binary += String.fromCharCode(byte)));
+  return btoa(binary);
+};
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const errorDetail = async (response: Response, fallback: string) => {
+  try {
+    return (await response.json()).detail || fallback;
+  } catch {
+    return fallback;
+  }
+};
+
+/**
+ * Upload a video through the resumable /uploads endpoints and return the id of
+ * the conversion job it starts.
+ *
+ * Chunks carry a SHA-256 checksum and a dropped connection resumes from the
+ * offset the server reports. The upload URL is remembered per file, so
+ * picking the same file after a reload continues where it stopped.
+ */
+export async function uploadResumable(
+  file: File,
+  token: string,
+  onProgress?: (sent: number, total: number) => void
+): Promise<string> {
+  const headers = { Authorization: `Bearer ${token}`, "Tus-Resumable": TUS_VERSION };
+  const fingerprint = `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+  // Returns the server's offset and, once complete, the job id; null if the upload is gone
+  const query = async (url: string) => {
+    const response = await fetch(url, { method: "HEAD", headers });
+    if (!response.ok) return null;
+    return {
+      offset: Number(response.headers.get("Upload-Offset")),
+      jobId: response.headers.get("Job-Id"),
+    };
+  };
+
+  let url = localStorage.getItem(fingerprint);
+  let state = url ? await query(url) : null;
+  if (!url || !state) {
+    const response = await fetch(`${API_URL}/uploads`, {
+      method: "POST",
+      headers: {
+        ...headers,
+        "Upload-Length": String(file.size),
+        "Upload-Metadata": `filename ${toBase64(new TextEncoder().encode(file.name))}`,
+      },
+    });
+    if (!response.ok) throw new Error(await errorDetail(response, "Upload failed"));
+    url = response.headers.get("Location")!;
+    localStorage.setItem(fingerprint, url);
+    state = { offset: 0, jobId: null };
+  }
+
+  let { offset } = state;
+  let jobId = state.jobId;
+  let failures = 0;
+  while (!jobId) {
+    onProgress?.(offset, file.size);
+    const body = await file.slice(offset, offset + CHUNK_SIZE).arrayBuffer();
+    const chunkHeaders: Record<string, string> = {
+      ...headers,
+      "Content-Type": "application/offset+octet-stream",
+      "Upload-Offset": String(offset),
+    };
+    // crypto.subtle only exists on secure origins (https, localhost)
+    if (crypto.subtle) {
+      const digest = await crypto.subtle.digest("SHA-256", body);
+      chunkHeaders["Upload-Checksum"] = `sha256 ${toBase64(new Uint8Array(digest))}`;
+    }
+
+    let response: Response | null = null;
+    try {
+      response = await fetch(url, { method: "PATCH", headers: chunkHeaders, body });
+    } catch {
+      // Connection dropped; ask the server how far it got below
+    }
+    if (response?.ok) {
+      failures = 0;
+      offset = Number(response.headers.get("Upload-Offset"));
+      jobId = response.headers.get("Job-Id");
+      continue;
+    }
+    if (response && ![409, 460].includes(response.status) && response.status < 500) {
+      throw new Error(await errorDetail(response, "Upload failed"));
+    }
+    if (++failures > MAX_RETRIES) throw new Error("Upload failed: connection lost");
+    await sleep(1000 * 2 ** (failures - 1));
+    const current = await query(url);
+    if (!current) {
+      localStorage.removeItem(fingerprint);
+      throw new Error("Upload expired, please try again");
+    }
+    offset = current.offset;
+    jobId = current.jobId;
+  }
+  localStorage.removeItem(fingerprint);
+  onProgress?.(file.size, file.size);
+  return jobId;
+}
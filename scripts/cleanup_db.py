@@ -1,6 +1,12 @@
 import os
-from database import get_db
-from models import User, MediaFile
+import sys
+
+# Run from backend/ so relative storage paths match the API's
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from databases.database import get_db
+from models.models import User, MediaFile, OutputBlob
+from services import storage
 
 print("🗑️  Cleaning up database...\n")
 
@@ -22,18 +28,19 @@ try:
         print("Deleting files...")
         files = db.query(MediaFile).all()
         for file_record in files:
-            # Delete physical file
-            file_path = os.path.join("outputs", file_record.filename)
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
+            # Delete stored file
+            try:
+                if storage.outputs.delete(file_record.filename):
                     print(f"  ✓ Deleted: {file_record.filename}")
-                except Exception as e:
-                    print(f"  ⚠️  Could not delete {file_record.filename}: {e}")
+            except Exception as e:
+                print(f"  ⚠️  Could not delete {file_record.filename}: {e}")
             
             # Delete database record
             db.delete(file_record)
         
+        # Shared output records from the dedup cache
+        db.query(OutputBlob).delete()
+        
         # Delete all users (will cascade delete any remaining file records)
         print("\nDeleting users...")
         users = db.query(User).all()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# Run from backend/ so relative storage paths match the API's
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from services import storage
+
+if not isinstance(storage.outputs, storage.LocalShardedStorage):
+    print("STORAGE_BACKEND is not local; nothing to migrate.")
+    sys.exit(0)
+
+print(f"📦 Moving files in {storage.outputs.root}/ into the sharded layout...")
+moved = storage.outputs.migrate_flat()
+print(f"✅ Moved {moved} files")